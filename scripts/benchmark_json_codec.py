@@ -0,0 +1,70 @@
+"""Compares the encoding and decoding time of the JSON codecs, on pages of audios and user infos as served by the API.
+Run from the root of the project with: python -m scripts.benchmark_json_codec"""
+
+import json
+import random
+import timeit
+
+import click
+
+from src.main.helpers.json_utils import StdlibJSONCodec, OrjsonJSONCodec, orjson
+
+
+def make_audio(session_id):
+    return {
+        "session_id": session_id,
+        "ticks": [round(random.uniform(-100, -10), 2) for _ in range(15)],
+        "selected_tick": random.randrange(15),
+        "step_count": random.randrange(10),
+    }
+
+
+def make_user_info(user_id):
+    return {
+        "user_id": user_id,
+        "name": f"User {user_id}",
+        "email": f"user{user_id}@example.com",
+        "address": f"{user_id} Main Street",
+        "image_link": f"https://storage.googleapis.com/images/user_{user_id}-image",
+        "image_variant_links": {
+            "thumbnail": f"https://storage.googleapis.com/images/user_{user_id}-image-1-thumbnail.webp",
+            "medium": f"https://storage.googleapis.com/images/user_{user_id}-image-1-medium.webp",
+        },
+    }
+
+
+def time_codec(codec, document, number):
+    data = codec.dumps(document)
+    dumps_time = timeit.timeit(lambda: codec.dumps(document), number=number) / number
+    loads_time = timeit.timeit(lambda: codec.loads(data), number=number) / number
+    return dumps_time, loads_time
+
+
+@click.command()
+@click.option("--page-size", default=1000, help="Number of resources per page.")
+@click.option("--number", default=100, help="Number of times each page is encoded and decoded.")
+def benchmark(page_size, number):
+    codecs = [StdlibJSONCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonJSONCodec())
+    else:
+        click.echo("orjson is not installed, only the standard library codec is benchmarked.")
+
+    documents = {
+        "audios": [make_audio(session_id) for session_id in range(page_size)],
+        "user infos": [make_user_info(user_id) for user_id in range(page_size)],
+    }
+
+    for name, document in documents.items():
+        click.echo(f"Page of {page_size} {name} ({len(json.dumps(document))} bytes):")
+        baseline = None
+        for codec in codecs:
+            dumps_time, loads_time = time_codec(codec, document, number)
+            if baseline is None:
+                baseline = dumps_time, loads_time
+            click.echo(f"  {codec.name:>7}: dumps {dumps_time * 1000:.3f} ms (x{baseline[0] / dumps_time:.1f}), "
+                       f"loads {loads_time * 1000:.3f} ms (x{baseline[1] / loads_time:.1f})")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -23,16 +23,30 @@ def extract_resource_ids(res):
 @click.option("--endpoint", prompt="The endpoint for the resources to delete, namely 'accounts' or 'audios'")
 def delete_all_resources(server_url, endpoint):
     s = get_http_session(server_url)
+    # the resources are paginated, so the first page is deleted until there are no resources left
     res = s.get(f"/{endpoint}")
     resource_ids = extract_resource_ids(res)
     if len(resource_ids) == 0:
         click.echo(f"No resources found at '{endpoint}' endpoint to delete against '{server_url}'")
         return
 
-    click.echo(f"Deleting {len(resource_ids)} resources against '{server_url}'. This could take a few minutes...")
-    for resource_id in resource_ids:
-        click.echo(f"Deleting resource '{endpoint}/{resource_id}'")
-        s.delete(f"/{endpoint}/{resource_id}")
+    while len(resource_ids) > 0:
+        click.echo(f"Deleting {len(resource_ids)} resources against '{server_url}'. This could take a few minutes...")
+        deleted_count = 0
+        for resource_id in resource_ids:
+            click.echo(f"Deleting resource '{endpoint}/{resource_id}'")
+            res = s.delete(f"/{endpoint}/{resource_id}")
+            if res.ok:
+                deleted_count += 1
+            else:
+                click.echo(f"Could not delete resource '{endpoint}/{resource_id}': {res.status_code} {res.text}")
+
+        # the same first page would be fetched again, so stop rather than retry the same deletes forever
+        if deleted_count == 0:
+            raise click.ClickException(f"None of the {len(resource_ids)} resources could be deleted, stopping.")
+
+        res = s.get(f"/{endpoint}")
+        resource_ids = extract_resource_ids(res)
 
 
 if __name__ == "__main__":
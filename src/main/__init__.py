@@ -4,8 +4,11 @@ import sys
 import click
 from werkzeug.exceptions import HTTPException
 from werkzeug.middleware.proxy_fix import ProxyFix
-from flask import Flask, json, make_response, send_from_directory
-from .exceptions import ValidationError, NoSuchInstanceError
+from flask import Flask, make_response, send_from_directory
+from flask.cli import with_appcontext
+from .exceptions import ValidationError, NoSuchInstanceError, PreconditionFailedError, BadGatewayError
+from .helpers import json_utils, metrics_utils, profiling_utils, sql_trace_utils
+from .helpers.config_utils import is_enabled
 import configparser
 from dotenv import load_dotenv
 
@@ -25,24 +28,69 @@ def create_app(test_config=None):
     """Create and configure the app."""
 
     app = Flask(__name__, instance_relative_config=True)
+    app.json = json_utils.CodecJSONProvider(app)
 
     app.wsgi_app = ProxyFix(
         app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1
     )
 
     app.config.from_mapping(
-        DATABASE=os.path.join(app.instance_path, DB_FILENAME)
+        DATABASE=os.path.join(app.instance_path, DB_FILENAME),
+        DATABASE_POOL_SIZE=8,  # matches the number of gunicorn threads, see start.sh
+        DATABASE_BUSY_TIMEOUT=5000,  # in milliseconds, how long to wait on the lock held by another writer
+        DATABASE_CACHE_SIZE=-16000,  # in KiB when negative, the page cache size of each connection
+        DATABASE_MMAP_SIZE=256 * 1024 * 1024,  # in bytes, how much of the database file to memory map
+        STORAGE_BACKEND="gcs",  # or "local", to store buckets in LOCAL_STORAGE_PATH rather than in GCP Storage
+        LOCAL_STORAGE_PATH=os.path.join(app.instance_path, "storage"),
+        STORAGE_POOL_SIZE=16,  # the 8 gunicorn threads (see start.sh) plus the storage worker threads
+        STORAGE_WORKERS=8,
+        ACCOUNTS_DEFAULT_PAGE_SIZE=100,
+        ACCOUNTS_MAX_PAGE_SIZE=1000,
+        ACCOUNTS_MAX_BATCH_SIZE=10000,
+        AUDIOS_DEFAULT_PAGE_SIZE=100,
+        AUDIOS_MAX_PAGE_SIZE=1000,
+        AUDIOS_MAX_BATCH_SIZE=1000,
+        AUDIO_CACHE_MAX_SIZE=1024,
+        AUDIO_CACHE_TTL=60,  # in seconds, bounds how long audios updated by other processes may be stale
+        AUDIO_STATS_MAX_AGE=60,  # in seconds, bounds how long audio stats may miss changes made by other processes
+        MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # in bytes, larger request bodies are rejected before being read
+        IMAGE_UPLOAD_CHUNK_SIZE=2 * 1024 * 1024,  # in bytes, must be a multiple of 256 KiB
+        IMAGE_RESUMABLE_UPLOAD_THRESHOLD=8 * 1024 * 1024,  # in bytes, smaller images are uploaded in a single request
+        IMAGE_MAX_PIXELS=25 * 1000 * 1000,  # larger images are rejected, as each is decoded in memory (4 bytes/pixel)
+        IMAGE_WORKERS=2,  # resizing is CPU bound, so more workers would mostly compete with request handling
+        OUTBOX_WORKER=True,  # whether to drain the outbox in the background, rather than only with 'drain-outbox'
+        OUTBOX_BATCH_SIZE=100,
+        OUTBOX_MAX_ATTEMPTS=10,
+        OUTBOX_RETRY_DELAY=5,  # in seconds, doubled after each failed attempt
+        OUTBOX_POLL_INTERVAL=60,  # in seconds, how often failed entries are checked for a retry
+        SQL_TRACE=False,  # whether to trace the SQL statements run on the database, see sql_trace_utils
+        SQL_TRACE_PATH=os.path.join(app.instance_path, "sql_trace"),
+        SQL_TRACE_SLOW_THRESHOLD=10,  # in milliseconds, statements at least this slow have their query plan explained
+        SQL_TRACE_SLOW_LOG_SIZE=100,
+        SQL_TRACE_MAX_STATEMENTS=1000,  # statements beyond this many distinct ones are aggregated together
+        SQL_TRACE_SAVE_INTERVAL=10,  # in seconds, how often each process saves its statistics in SQL_TRACE_PATH
+        PROFILING=False,  # whether requests with the PROFILING_SECRET in their X-Profile header are profiled
+        PROFILING_SECRET=None,
+        PROFILING_PATH=os.path.join(app.instance_path, "profiles"),
+        PROFILING_SAMPLE_INTERVAL=0.001,  # in seconds, for requests profiled with 'X-Profile-Mode: sample'
+        PROFILING_MAX_PROFILES=100,  # the oldest profiles beyond this many are deleted
+        DEBUG_ROUTES=False,  # whether the /debug routes are served outside of debug mode, to requests with DEBUG_SECRET
+        DEBUG_SECRET=None,
     )
 
-    def load_bucket_metadata_config(file):
+    def load_instance_config(file):
         config = configparser.ConfigParser()
         config.optionxform = lambda option: option.upper()  # Only values in uppercase are actually stored in the config object later on
         config.read(file.name)
-        return dict(config["bucket_metadata"])
+        instance_config = {}
+        for section in ("bucket_metadata", "storage", "sql_trace", "profiling", "debug"):
+            if section in config:
+                instance_config.update(config[section])
+        return instance_config
 
     if test_config is None:
         try:
-            app.config.from_file("config.cfg", load=load_bucket_metadata_config)  # , silent=True)
+            app.config.from_file("config.cfg", load=load_instance_config)  # , silent=True)
         except FileNotFoundError as le:
             # we only want to error if this is the case once running the app, otherwise we may be running commands
             if is_running_server:
@@ -52,12 +100,25 @@ def create_app(test_config=None):
         # load the test config if passed in
         app.config.from_mapping(test_config)
 
+    if app.config["STORAGE_BACKEND"] == "local":
+        # local buckets do not need to be provisioned, so they have default names
+        app.config.setdefault("AUDIO_BUCKET", "audios")
+        app.config.setdefault("IMAGE_BUCKET", "images")
+
     # Ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
 
+    # Register metrics middleware, first so that it times the whole request handling
+
+    metrics_utils.init_app(app)
+
+    # Register the profiling middleware, around the dispatch of the requests
+
+    profiling_utils.init_app(app)
+
     # Register error handling middleware
 
     @app.errorhandler(HTTPException)
@@ -66,7 +127,7 @@ def create_app(test_config=None):
         # start with the correct headers and status code from the error
         response = e.get_response()
         # replace the body with JSON
-        response.data = json.dumps({
+        response.data = json_utils.dumps({
             "code": e.code,
             "name": e.name,
             "description": e.description,
@@ -76,7 +137,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(ValidationError)
     def handle_validation_error(e):
-        response = make_response(json.dumps(
+        response = make_response(json_utils.dumps(
             e.to_http_problem().serialize()
         ), 400)
         response.content_type = "application/json"
@@ -84,17 +145,41 @@ def create_app(test_config=None):
 
     @app.errorhandler(NoSuchInstanceError)
     def handle_no_such_instance_error(e):
-        response = make_response(json.dumps(
+        response = make_response(json_utils.dumps(
             e.to_http_problem().serialize()
         ), 404)
         response.content_type = "application/json"
         return response
 
+    @app.errorhandler(PreconditionFailedError)
+    def handle_precondition_failed_error(e):
+        response = make_response(json_utils.dumps(
+            e.to_http_problem().serialize()
+        ), 412)
+        response.content_type = "application/json"
+        return response
+
+    @app.errorhandler(BadGatewayError)
+    def handle_bad_gateway_error(e):
+        response = make_response(json_utils.dumps(
+            e.to_http_problem().serialize()
+        ), 502)
+        response.content_type = "application/json"
+        return response
+
     # Register CLI commands to provision resources on machine and in GCP
 
+    sql_trace_utils.init_app(app)
+
     from .data_sources import db
     db.init_app(app)
 
+    from .services import audios as audios_service
+    audios_service.init_app(app)
+
+    from .services import outbox
+    outbox.init_app(app)
+
     @click.command("configure-buckets")
     def configure_buckets():
         if not os.path.isfile(BUCKET_METADATA_CONFIG_FILENAME):
@@ -129,19 +214,46 @@ def create_app(test_config=None):
 
     app.cli.add_command(configure_gcp_credentials)
 
+    @click.command("rebuild-audio-catalog")
+    @with_appcontext
+    def rebuild_audio_catalog():
+        audio_count = audios_service.rebuild_audio_catalog()
+        click.echo(f"Rebuilt the audio catalog from the {audio_count} audio files in the audio bucket.")
+
+    app.cli.add_command(rebuild_audio_catalog)
+
+    @click.command("migrate-audio-blobs")
+    @with_appcontext
+    def migrate_audio_blobs():
+        migrated_count, audio_count = audios_service.migrate_audio_blobs()
+        click.echo(f"Migrated {migrated_count} of the {audio_count} audio files to the binary encoding.")
+
+    app.cli.add_command(migrate_audio_blobs)
+
     # Register routes
 
     @app.route("/ping")
     def hello():
         return "running", 200
 
+    @app.route("/metrics")
+    def metrics():
+        return app.response_class(metrics_utils.get_metrics().render(), mimetype=metrics_utils.PROMETHEUS_MIMETYPE)
+
     @app.route("/docs/openapi.yaml")
     def specs():
         return send_from_directory(app.root_path, SPEC_FILENAME)
 
-    from .controllers import accounts, audios, docs
+    from .controllers import accounts, audios, debug, docs
     app.register_blueprint(accounts.bp)
+    app.register_blueprint(accounts.batch_bp)
     app.register_blueprint(audios.bp)
+    app.register_blueprint(audios.batch_bp)
+    # the debug routes expose (and reset) internal statistics, so they are only served to everyone in debug mode
+    if app.debug or app.testing or is_enabled(app.config["DEBUG_ROUTES"]):
+        if not (app.debug or app.testing or app.config["DEBUG_SECRET"]):
+            raise ValueError("DEBUG_SECRET must be set when DEBUG_ROUTES is enabled.")
+        app.register_blueprint(debug.bp)
     app.register_blueprint(docs.bp)
 
     return app
@@ -1,22 +1,38 @@
 from flask import (
-    Blueprint, request, jsonify, make_response
+    Blueprint, request, jsonify, make_response, current_app
 )
 from src.main import ValidationError
 from src.main.helpers.email_utils import normalize_email
 from src.main.helpers.filename_validation_utils import is_allowed_file
-from src.main.helpers.header_utils import set_resource_uri_header
+from src.main.helpers.image_utils import open_image
+from src.main.helpers.header_utils import set_resource_uri_header, set_next_page_link_header, is_not_modified, \
+    make_not_modified_response, get_if_match_etags
+from src.main.helpers.ndjson_utils import NDJSON_MIMETYPE, accepts_ndjson, make_ndjson_response, parse_ndjson
 
 from src.main.helpers.dict_utils import filter_dict
 from src.main.parse_request import request_body_is_json, \
-    validate_and_get_user_info_model
+    validate_and_get_user_info_model, validate_and_get_page_size, validate_and_get_after_id
 from src.main.services import user_infos as user_info_service
 
 bp = Blueprint("accounts", __name__, url_prefix="/accounts")
 
+# custom methods on the collection (e.g. '/accounts:batch') cannot be nested under the blueprint url prefix
+batch_bp = Blueprint("accounts_batch", __name__)
+
+
+def to_resource(user_info_model_with_id):
+    """Leave out the row version, which is only exposed as the entity tag of the resource."""
+    user_info_model_with_id = dict(user_info_model_with_id)
+    version = user_info_model_with_id.pop("version")
+    return user_info_model_with_id, version
+
 
 def make_response_with_resource_header(user_info_model_with_id, status):
+    user_info_model_with_id, version = to_resource(user_info_model_with_id)
+
     response = make_response(jsonify(user_info_model_with_id), status)
     set_resource_uri_header(request, response, bp.url_prefix + "/" + str(user_info_model_with_id["id"]))
+    response.set_etag(str(version))
     return response
 
 
@@ -31,17 +47,84 @@ def insert_user_info():
     return make_response_with_resource_header(user_info_model_with_id, 201)
 
 
+def get_batch_data_from_request():
+    if request.mimetype == NDJSON_MIMETYPE:
+        data = parse_ndjson(request.stream)
+    else:
+        request_body_is_json(request)
+        data = request.json
+        if not isinstance(data, list):
+            raise ValidationError("Request body must be a JSON array of user infos, or NDJSON with a user info per line.")
+
+    max_batch_size = current_app.config["ACCOUNTS_MAX_BATCH_SIZE"]
+    if len(data) > max_batch_size:
+        raise ValidationError(f"Request must contain at most {max_batch_size} user infos.")
+
+    return data
+
+
+def make_batch_result(result):
+    if isinstance(result, ValidationError):
+        return {"status": 400, "problem": result.to_http_problem().serialize()}
+
+    user_info_model_with_id, _ = to_resource(result)
+    return {"status": 201, "resource": user_info_model_with_id}
+
+
+@batch_bp.post(bp.url_prefix + ":batch")
+def insert_user_infos():
+    data = get_batch_data_from_request()
+
+    # results are either the created user info or the validation error, for each user info in the request
+    results = [None] * len(data)
+
+    indexes = []
+    user_info_models = []
+    for index, user_info_data in enumerate(data):
+        try:
+            if not isinstance(user_info_data, dict):
+                raise ValidationError("User info must be a JSON object.")
+            user_info_models.append(validate_and_get_user_info_model(user_info_data))
+            indexes.append(index)
+        except ValidationError as e:
+            results[index] = e
+
+    for index, result in zip(indexes, user_info_service.create_user_infos(user_info_models)):
+        results[index] = result
+
+    return make_response(jsonify([make_batch_result(result) for result in results]), 200)
+
+
 @bp.get("/<user_id>")
 def get_user_info(user_id):
-    return make_response_with_resource_header(user_info_service.get_user_info(user_id), 200)
+    user_info_model_with_id = user_info_service.get_user_info(user_id)
+
+    if is_not_modified(request, str(user_info_model_with_id["version"])):
+        return make_not_modified_response(str(user_info_model_with_id["version"]))
+
+    return make_response_with_resource_header(user_info_model_with_id, 200)
 
 
 @bp.get("/")
 def list_user_infos():
-    search = filter_dict(dict(request.args), ["name", "email", "address"])
+    search = filter_dict(dict(request.args), user_info_service.SEARCHABLE_COLUMNS)
     if "email" in search:
         search["email"] = normalize_email(search["email"])
-    return make_response(jsonify(user_info_service.get_user_infos(search)), 200)
+
+    if accepts_ndjson(request):
+        # stream all user infos, regardless of pagination
+        return make_ndjson_response(user_info_service.iter_user_infos(search))
+
+    limit = validate_and_get_page_size(
+        request.args, "limit", current_app.config["ACCOUNTS_DEFAULT_PAGE_SIZE"], current_app.config["ACCOUNTS_MAX_PAGE_SIZE"])
+    after_id = validate_and_get_after_id(request.args, "after_id")
+
+    user_infos, next_after_id = user_info_service.get_user_infos_page(search, limit, after_id)
+
+    response = make_response(jsonify(user_infos), 200)
+    if next_after_id is not None:
+        set_next_page_link_header(request, response, {"limit": limit, "after_id": next_after_id})
+    return response
 
 
 @bp.put("/<user_id>")
@@ -50,7 +133,10 @@ def update_user_info(user_id):
 
     user_info_model = validate_and_get_user_info_model(request.json)
 
-    user_info_model_with_id = user_info_service.update_user_info(user_id, user_info_model)
+    if_match_etags = get_if_match_etags(request)
+    if_version_in = None if if_match_etags is None else [int(etag) for etag in if_match_etags if etag.isdigit()]
+
+    user_info_model_with_id = user_info_service.update_user_info(user_id, user_info_model, if_version_in)
 
     return make_response_with_resource_header(user_info_model_with_id, 200)
 
@@ -81,6 +167,10 @@ def get_if_allowed_file(prequest):
     if file.mimetype not in ["image/jpeg", "image/png"]:
         raise ValidationError("Uploaded image file mimetype must be 'image/jpeg' or 'image/png'.")
 
+    # images are only decoded in the background, so those too large to be decoded are rejected upfront from their header
+    open_image(file.stream, current_app.config["IMAGE_MAX_PIXELS"])
+    file.stream.seek(0)
+
     return file
 
 
@@ -93,6 +183,4 @@ def upload_user_image(user_id):
 
     user_info_model_with_id = user_info_service.upload_user_image(user_id, image_file)
 
-    result = make_response_with_resource_header(user_info_model_with_id, 200)
-    print(result)
-    return result
+    return make_response_with_resource_header(user_info_model_with_id, 200)
@@ -1,16 +1,37 @@
 from flask import (
-    Blueprint, request, jsonify, make_response
+    Blueprint, request, jsonify, make_response, current_app
 )
 import json
-from src.main import ValidationError
+from src.main import ValidationError, PreconditionFailedError, BadGatewayError
+from src.main.helpers import json_utils
 from src.main.helpers.filename_validation_utils import is_allowed_file
-from src.main.helpers.header_utils import set_resource_uri_header
+from src.main.helpers.header_utils import set_resource_uri_header, set_next_page_link_header, is_not_modified, \
+    make_not_modified_response, get_if_match_etags
+from src.main.helpers.ndjson_utils import accepts_ndjson, make_ndjson_response
 from src.main.parse_request import request_body_is_json, \
-    validate_and_get_audio_model
+    validate_and_get_audio_model, validate_and_get_page_size
 from src.main.services import audios as audios_service
 
 bp = Blueprint("audios", __name__, url_prefix="/audios")
 
+# custom methods on the collection (e.g. '/audios:batch') cannot be nested under the blueprint url prefix
+batch_bp = Blueprint("audios_batch", __name__)
+
+
+def validate_audio_file(file):
+    if file.filename == '':
+        raise ValidationError("Uploaded audio data file does not have a filename.")
+
+    if not is_allowed_file(file.filename, ["json"]):
+        raise ValidationError("Uploaded audio data filename must have a '.json' extension.")
+
+
+def load_audio_file(file):
+    try:
+        return json_utils.loads(file.read())
+    except json.decoder.JSONDecodeError as e:
+        raise ValidationError("Malformed JSON file: " + e.msg)
+
 
 def get_if_allowed_file(prequest):
     # check if the post request has the file part
@@ -22,11 +43,7 @@ def get_if_allowed_file(prequest):
     if file is None:
         return None
 
-    if file.filename == '':
-        raise ValidationError("Uploaded audio data file does not have a filename.")
-
-    if not is_allowed_file(file.filename, ["json"]):
-        raise ValidationError("Uploaded audio data filename must have a '.json' extension.")
+    validate_audio_file(file)
 
     return file
 
@@ -41,19 +58,15 @@ def get_data_from_request():
 
         data = request.json
     else:
-        # Opening JSON file
-        # with open(file, encoding="utf-8") as json_file:
-        try:
-            data = json.load(file)
-        except json.decoder.JSONDecodeError as e:
-            raise ValidationError("Malformed JSON file: " + e.msg)
+        data = load_audio_file(file)
 
     return data
 
 
-def make_response_with_resource_header(audio_model_with_id, status):
+def make_response_with_resource_header(audio_model_with_id, status, generation):
     response = make_response(jsonify(audio_model_with_id), status)
     set_resource_uri_header(request, response, bp.url_prefix + "/" + str(audio_model_with_id["session_id"]))
+    response.set_etag(str(generation))  # the blob generation changes every time the audio is written
     return response
 
 
@@ -63,39 +76,131 @@ def insert_audio():
 
     audio_model = validate_and_get_audio_model(data)
 
-    audio_model_with_id = audios_service.create_audio(audio_model)
+    audio_model_with_id, generation = audios_service.create_audio(audio_model)
 
-    return make_response_with_resource_header(audio_model_with_id, 201)
+    return make_response_with_resource_header(audio_model_with_id, 201, generation)
 
 
-@bp.get("/<session_id>")
+def get_batch_data_from_request():
+    """Get the data of each audio in the request, either from the JSON array body, or from the form-data files 'audio'.
+    The data of files which cannot be loaded is replaced by the ValidationError, so that the other files still are."""
+    files = request.files.getlist("audio")
+    if len(files) == 0:
+        request_body_is_json(request)
+        data = request.json
+        if not isinstance(data, list):
+            raise ValidationError("Request did not contain form-data files 'audio', and request body is not a JSON array.")
+    else:
+        data = []
+        for file in files:
+            try:
+                validate_audio_file(file)
+                data.append(load_audio_file(file))
+            except ValidationError as e:
+                data.append(e)
+
+    max_batch_size = current_app.config["AUDIOS_MAX_BATCH_SIZE"]
+    if len(data) > max_batch_size:
+        raise ValidationError(f"Request must contain at most {max_batch_size} audios.")
+
+    return data
+
+
+def make_batch_result(result):
+    if isinstance(result, ValidationError):
+        return {"status": 400, "problem": result.to_http_problem().serialize()}
+    if isinstance(result, BadGatewayError):
+        return {"status": 502, "problem": result.to_http_problem().serialize()}
+
+    audio_model_with_id, _ = result
+    return {"status": 201, "resource": audio_model_with_id}
+
+
+@batch_bp.post(bp.url_prefix + ":batch")
+def insert_audios():
+    data = get_batch_data_from_request()
+
+    # results are either the created audio and its generation, the validation error, or the error of its failed upload,
+    # for each audio in the request
+    results = [None] * len(data)
+
+    indexes = []
+    audio_models = []
+    for index, audio_data in enumerate(data):
+        try:
+            if isinstance(audio_data, ValidationError):
+                raise audio_data
+            if not isinstance(audio_data, dict):
+                raise ValidationError("Audio must be a JSON object.")
+            audio_models.append(validate_and_get_audio_model(audio_data))
+            indexes.append(index)
+        except ValidationError as e:
+            results[index] = e
+
+    for index, result in zip(indexes, audios_service.create_audios(audio_models)):
+        results[index] = result
+
+    return make_response(jsonify([make_batch_result(result) for result in results]), 200)
+
+
+@bp.get("/<int:session_id>")
 def get_audio(session_id):
-    return make_response_with_resource_header(audios_service.get_audio(session_id), 200)
+    audio_model_with_id, generation = audios_service.get_audio_and_generation(
+        session_id, is_not_modified=lambda current_generation: is_not_modified(request, str(current_generation)))
+
+    if audio_model_with_id is None or is_not_modified(request, str(generation)):
+        return make_not_modified_response(str(generation))
+
+    return make_response_with_resource_header(audio_model_with_id, 200, generation)
 
 
 @bp.get("/")
 def list_audios():
-    result = make_response(jsonify(audios_service.get_audios()), 200)
+    if accepts_ndjson(request):
+        # stream all audios, regardless of pagination
+        return make_ndjson_response(audios_service.iter_audios())
+
+    page_size = validate_and_get_page_size(
+        request.args, "page_size", current_app.config["AUDIOS_DEFAULT_PAGE_SIZE"], current_app.config["AUDIOS_MAX_PAGE_SIZE"])
+
+    audios, next_page_token = audios_service.get_audios(page_size, request.args.get("page_token"))
+
+    result = make_response(jsonify(audios), 200)
+    if next_page_token is not None:
+        set_next_page_link_header(request, result, {"page_size": page_size, "page_token": next_page_token})
     return result
 
 
-@bp.put("/<session_id>")
+@bp.get("/stats")
+def get_audio_stats():
+    return make_response(jsonify(audios_service.get_audio_stats()), 200)
+
+
+@bp.put("/<int:session_id>")
 def update_audio(session_id):
     data = get_data_from_request()
 
     audio_model = validate_and_get_audio_model(data)
 
-    audios_service.get_audio(session_id)  # ensure it exists already
+    if_match_etags = get_if_match_etags(request)
+    if if_match_etags is None:
+        audios_service.ensure_audio_exists(session_id)
+        if_generation_match = None
+    else:
+        # the current generation is checked against the one in storage, as the cached audio may be outdated
+        if_generation_match = audios_service.get_audio_generation(session_id)  # also ensures it exists already
+        if str(if_generation_match) not in if_match_etags:
+            raise PreconditionFailedError(f"Audio file with session_id {session_id} was modified.")
 
     if audio_model.session_id != session_id:
         raise ValidationError("Cannot modify an existing audio file's session_id.")
 
-    audio_model_with_id = audios_service.update_audio(session_id, audio_model)
+    audio_model_with_id, generation = audios_service.update_audio(session_id, audio_model, if_generation_match)
 
-    return make_response_with_resource_header(audio_model_with_id, 200)
+    return make_response_with_resource_header(audio_model_with_id, 200, generation)
 
 
-@bp.delete("/<session_id>")
+@bp.delete("/<int:session_id>")
 def delete_audio(session_id):
     audios_service.delete_audio(session_id)
 
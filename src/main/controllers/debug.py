@@ -0,0 +1,66 @@
+import hmac
+
+from flask import Blueprint, current_app, jsonify, make_response, request
+
+from src.main import ValidationError, NoSuchInstanceError
+from src.main.helpers import sql_trace_utils
+from src.main.parse_request import validate_and_get_page_size
+from src.main.services import audios as audios_service
+
+bp = Blueprint("debug", __name__, url_prefix="/debug")
+
+SQL_STATS_DEFAULT_LIMIT = 20
+SQL_STATS_MAX_LIMIT = 1000
+
+DEBUG_SECRET_HEADER = "X-Debug-Secret"
+
+
+@bp.before_request
+def check_debug_secret():
+    """Outside of debug mode, the debug routes are only served to requests with the DEBUG_SECRET in their X-Debug-Secret
+    header, and do not exist for the others."""
+    if current_app.debug or current_app.testing:
+        return
+    secret = request.headers.get(DEBUG_SECRET_HEADER, "")
+    if not hmac.compare_digest(secret.encode("utf-8"), current_app.config["DEBUG_SECRET"].encode("utf-8")):
+        raise NoSuchInstanceError(f"No debug route exists at '{request.path}'.")
+
+
+@bp.get("/caches")
+def get_cache_stats():
+    return make_response(jsonify({
+        "audios": audios_service.get_audio_cache().stats()
+    }), 200)
+
+
+def get_existing_sql_tracer():
+    sql_tracer = sql_trace_utils.get_sql_tracer()
+    if sql_tracer is None:
+        raise NoSuchInstanceError("SQL tracing is not enabled, see the SQL_TRACE config.")
+    return sql_tracer
+
+
+@bp.get("/sql")
+def get_sql_stats():
+    """Get the statistics of the SQL statements run by this process, with the statements with the largest sort
+    statistic first."""
+    sql_tracer = get_existing_sql_tracer()
+
+    sort = request.args.get("sort", "total")
+    if sort not in sql_trace_utils.SORT_KEYS:
+        raise ValidationError(detailed_validation_errors=[{
+            "detail": f"'{sort}' is not a valid value for request parameter 'sort', "
+                      f"expected one of {', '.join(sql_trace_utils.SORT_KEYS)}.",
+            "pointer": "sort"}])
+    limit = validate_and_get_page_size(request.args, "limit", SQL_STATS_DEFAULT_LIMIT, SQL_STATS_MAX_LIMIT)
+
+    stats = sql_tracer.snapshot()
+    stats["statements"] = sql_trace_utils.get_top_statements(stats, sort, limit)
+    return make_response(jsonify(stats), 200)
+
+
+@bp.delete("/sql")
+def reset_sql_stats():
+    get_existing_sql_tracer().reset()
+
+    return "", 200
@@ -1,16 +1,8 @@
-from flask import current_app, g
-from src.main.helpers.storage_utils import get_new_client_bucket
+from flask import current_app
+from src.main.helpers.storage_utils import get_bucket
 
 
 def get_image_bucket():
-    """Connect to the application's configured image Storage bucket.
-    The client is unique for each request and is reused throughout the same request."""
-    bucket_name = current_app.config["IMAGE_BUCKET"]
-
-    if "buckets" not in g:
-        g.buckets = {}
-
-    if bucket_name not in g.buckets:
-        g.buckets[bucket_name] = get_new_client_bucket(bucket_name)
-
-    return g.buckets[bucket_name]
+    """Get the application's configured image Storage bucket, on the configured storage backend.
+    GCP Storage bucket handles and their client are shared by all requests handled by the process."""
+    return get_bucket(current_app.config["IMAGE_BUCKET"])
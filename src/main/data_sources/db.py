@@ -1,6 +1,25 @@
+import os
+import queue
 import sqlite3
+import threading
+import weakref
+from contextlib import nullcontext
+
 import click
-from flask import current_app, g
+from flask import current_app, g, has_request_context, request
+
+from src.main.helpers import json_utils
+from src.main.helpers.metrics_utils import NullSpans, get_spans
+
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# queries with a variable number of bound parameters are split in chunks of this many parameters,
+# to stay below the default maximum number of bound parameters of older SQLite versions (999)
+QUERY_PARAMS_CHUNK_SIZE = 500
+
+
+# columns declared as JSON are decoded when read (values are encoded with json_utils.dumps when written)
+sqlite3.register_converter("JSON", json_utils.loads)
 
 
 def dict_factory(cursor, row):
@@ -8,22 +27,204 @@ def dict_factory(cursor, row):
     return {key: value for key, value in zip(fields, row)}
 
 
+class ConnectionPool:
+    """Pool of connections to a SQLite database file, shared by all request handling threads of the process.
+
+    At most size idle connections are kept open; when more connections are in use at once, the extra connections are
+    closed once released. Connections are in WAL mode, so that readers do not block behind writers (and vice versa),
+    and read-only pools set their connections to reject writes. If a tracer is given (see sql_trace_utils), the
+    statements run on the connections are traced."""
+
+    def __init__(self, database, size, readonly=False, busy_timeout=5000, cache_size=-16000, mmap_size=0,
+                 tracer=None):
+        self.database = database
+        self.size = size
+        self.readonly = readonly
+        self.busy_timeout = busy_timeout
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.tracer = tracer
+        self._idle = queue.LifoQueue()  # reuse the most recently used connection, whose cache is the warmest
+
+    def connect(self):
+        connection = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False  # connections are handed over between threads, but only used by one at a time
+        )
+        connection.row_factory = dict_factory  # make rows into dicts
+
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")  # durable enough in WAL mode, commits do not wait on fsync
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        connection.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if self.readonly:
+            connection.execute("PRAGMA query_only = ON")
+        if self.tracer is not None:
+            connection.set_trace_callback(self.tracer.trace_callback)
+
+        return connection
+
+    def acquire(self, spans=None):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+
+        return PooledConnection(self, connection, spans or NullSpans(), self.tracer)
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()  # do not leak uncommitted changes to the next user of the connection
+
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SpannedCursor:
+    """Cursor whose fetches are recorded as spans of the db phase, though not as round trips, which are counted by the
+    statements."""
+
+    def __init__(self, cursor, spans):
+        self._cursor = cursor
+        self._spans = spans
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchone(self):
+        with self._spans.span("db", "fetch", round_trip=False):
+            return self._cursor.fetchone()
+
+    def fetchmany(self, *args):
+        with self._spans.span("db", "fetch", round_trip=False):
+            return self._cursor.fetchmany(*args)
+
+    def fetchall(self):
+        with self._spans.span("db", "fetch", round_trip=False):
+            return self._cursor.fetchall()
+
+    def __iter__(self):
+        # rows are fetched in batches, so that iterating does not record a span per row
+        rows = self.fetchmany(100)
+        while len(rows) > 0:
+            yield from rows
+            rows = self.fetchmany(100)
+
+
+class PooledConnection:
+    """Connection borrowed from a pool, which behaves like a closed connection once it is given back to the pool.
+    Statements, fetches and transaction ends are recorded as spans of the db phase, and statements are timed by the
+    tracer, if any."""
+
+    def __init__(self, pool, connection, spans, tracer=None):
+        self._pool = pool
+        self._connection = connection
+        self._spans = spans
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._connection, name)
+
+    def _trace(self, sql, parameters, many=False):
+        if self._tracer is None or self._connection is None:
+            return nullcontext()
+        return self._tracer.trace(self._connection, sql, parameters, many)
+
+    def execute(self, sql, parameters=()):
+        with self._spans.span("db", "execute"), self._trace(sql, parameters):
+            return SpannedCursor(self.__getattr__("execute")(sql, parameters), self._spans)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._tracer is not None and not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)  # the tracer describes the parameters of the first statement
+        with self._spans.span("db", "executemany"), self._trace(sql, seq_of_parameters, many=True):
+            return SpannedCursor(self.__getattr__("executemany")(sql, seq_of_parameters), self._spans)
+
+    def executescript(self, *args):
+        with self._spans.span("db", "executescript"):
+            return self.__getattr__("executescript")(*args)
+
+    def commit(self):
+        with self._spans.span("db", "commit"):
+            return self.__getattr__("commit")()
+
+    def rollback(self):
+        with self._spans.span("db", "rollback"):
+            return self.__getattr__("rollback")()
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+
+# pools of all apps, so that they can be discarded in forked child processes
+_pools = weakref.WeakSet()
+_pools_lock = threading.Lock()
+
+
+def _discard_pools():
+    for pool in list(_pools):
+        # connections must not be shared across processes, so they are dropped without being closed
+        pool._idle = queue.LifoQueue()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_discard_pools)
+
+
+def get_pool(readonly):
+    pools = current_app.extensions["db_pools"]
+    database = current_app.config["DATABASE"]
+
+    key = (database, readonly)
+    if key not in pools:
+        with _pools_lock:
+            if key not in pools:
+                pool = ConnectionPool(
+                    database,
+                    current_app.config["DATABASE_POOL_SIZE"],
+                    readonly=readonly,
+                    busy_timeout=current_app.config["DATABASE_BUSY_TIMEOUT"],
+                    cache_size=current_app.config["DATABASE_CACHE_SIZE"],
+                    mmap_size=current_app.config["DATABASE_MMAP_SIZE"],
+                    tracer=current_app.extensions["sql_tracer"]
+                )
+                _pools.add(pool)
+                pools[key] = pool
+
+    return pools[key]
+
+
 def get_db():
-    """Connect to the application's configured database.
+    """Get a connection to the application's configured database, from the pool of connections.
     The connection is unique for each request and is reused throughout same request.
+    Requests with a read-only method (e.g. GET) get a connection which cannot write to the database.
     """
     if "db" not in g:
-        g.db = sqlite3.connect(
-            current_app.config["DATABASE"], detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = dict_factory  # make rows into dicts
+        readonly = has_request_context() and request.method in READ_ONLY_METHODS
+        g.db = get_pool(readonly).acquire(get_spans())
 
     return g.db
 
 
 def close_db(e=None):
-    """If this request connected to the database, close the
-    connection.
+    """If this request connected to the database, give the
+    connection back to the pool.
     """
     db = g.pop("db", None)
 
@@ -50,5 +251,6 @@ def init_app(app):
     """Register database functions with the Flask app.
     This is called by the application factory.
     """
+    app.extensions["db_pools"] = {}
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
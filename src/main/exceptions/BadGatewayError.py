@@ -0,0 +1,13 @@
+from src.main.models import HttpProblem
+
+
+class BadGatewayError(Exception):
+    HTTP_PROBLEM_TYPE = "bad-gateway-error"
+
+    """A service the request depends on (e.g. storage) failed to handle it."""
+    def __init__(self, title="A service the request depends on failed to handle it."):
+        self.title = title
+        super().__init__(self.title)
+
+    def to_http_problem(self):
+        return HttpProblem(BadGatewayError.HTTP_PROBLEM_TYPE, self.title)
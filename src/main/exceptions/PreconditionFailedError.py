@@ -0,0 +1,13 @@
+from src.main.models import HttpProblem
+
+
+class PreconditionFailedError(Exception):
+    HTTP_PROBLEM_TYPE = "precondition-failed-error"
+
+    """The requested data entity was modified since the version the request is conditioned on."""
+    def __init__(self, title="The entity was modified since the version the request is conditioned on."):
+        self.title = title
+        super().__init__(self.title)
+
+    def to_http_problem(self):
+        return HttpProblem(PreconditionFailedError.HTTP_PROBLEM_TYPE, self.title)
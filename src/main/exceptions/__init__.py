@@ -1,2 +1,4 @@
 from .ValidationError import ValidationError
 from .NoSuchInstanceError import NoSuchInstanceError
+from .PreconditionFailedError import PreconditionFailedError
+from .BadGatewayError import BadGatewayError
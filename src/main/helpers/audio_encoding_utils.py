@@ -0,0 +1,75 @@
+"""Compact binary encoding of the audio blobs, which also decodes the legacy JSON encoding.
+
+Binary audios start with a header made of the magic bytes, the format version and the ticks encoding, followed by the
+session_id, step_count and selected_tick, and the ticks. Ticks are encoded as centi-dB int16 whenever that is lossless
+(i.e. they have at most two decimals), otherwise as float64, so that the decoded audio is always the encoded one."""
+
+import struct
+
+from src.main.helpers import json_utils
+
+AUDIO_MAGIC = b"AUD"  # never the start of a JSON document
+AUDIO_FORMAT_VERSION = 1
+
+TICKS_CENTI_DB_INT16 = 0
+TICKS_FLOAT64 = 1
+
+AUDIO_MIMETYPE = "application/octet-stream"
+
+_header = struct.Struct("<3sBBqqhB")  # magic, version, ticks encoding, session_id, step_count, selected_tick, tick count
+_ticks_formats = {
+    TICKS_CENTI_DB_INT16: "h",
+    TICKS_FLOAT64: "d",
+}
+
+
+def is_legacy_audio(data):
+    return not data.startswith(AUDIO_MAGIC)
+
+
+def encode_ticks(ticks):
+    try:
+        centi_db_ticks = [round(tick * 100) for tick in ticks]
+    except (ValueError, OverflowError):  # not finite
+        return TICKS_FLOAT64, [float(tick) for tick in ticks]
+
+    if all(-32768 <= centi_db_tick <= 32767 and centi_db_tick / 100 == tick
+           for centi_db_tick, tick in zip(centi_db_ticks, ticks)):
+        return TICKS_CENTI_DB_INT16, centi_db_ticks
+
+    return TICKS_FLOAT64, [float(tick) for tick in ticks]
+
+
+def encode_audio(audio):
+    """Encode the audio dict, falling back to the legacy JSON encoding if its values do not fit the binary format."""
+    ticks_encoding, encoded_ticks = encode_ticks(audio["ticks"])
+    try:
+        return _header.pack(
+            AUDIO_MAGIC, AUDIO_FORMAT_VERSION, ticks_encoding,
+            audio["session_id"], audio["step_count"], audio["selected_tick"], len(encoded_ticks)
+        ) + struct.pack(f"<{len(encoded_ticks)}{_ticks_formats[ticks_encoding]}", *encoded_ticks)
+    except struct.error:
+        return json_utils.dumps(audio).encode("utf-8")
+
+
+def decode_audio(data):
+    """Decode the audio dict from either encoding."""
+    if is_legacy_audio(data):
+        return json_utils.loads(data)
+
+    magic, version, ticks_encoding, session_id, step_count, selected_tick, tick_count = _header.unpack_from(data)
+    if version != AUDIO_FORMAT_VERSION or ticks_encoding not in _ticks_formats:
+        raise ValueError(f"Unsupported audio format version {version} or ticks encoding {ticks_encoding}.")
+
+    encoded_ticks = struct.unpack_from(f"<{tick_count}{_ticks_formats[ticks_encoding]}", data, _header.size)
+    if ticks_encoding == TICKS_CENTI_DB_INT16:
+        ticks = [centi_db_tick / 100 for centi_db_tick in encoded_ticks]
+    else:
+        ticks = list(encoded_ticks)
+
+    return {
+        "session_id": session_id,
+        "ticks": ticks,
+        "selected_tick": selected_tick,
+        "step_count": step_count,
+    }
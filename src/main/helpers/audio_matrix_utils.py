@@ -0,0 +1,138 @@
+import threading
+import time
+
+import numpy as np
+
+TICK_COUNT = 15
+TICK_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def ticks_to_bytes(ticks):
+    return np.asarray(ticks, dtype="<f8").tobytes()
+
+
+def ticks_from_bytes(data):
+    return np.frombuffer(data, dtype="<f8")
+
+
+class AudioMatrix:
+    """Thread-safe, columnar in-memory matrix of the ticks (sessions x ticks), selected_ticks and step_counts of audios.
+
+    Audios are upserted and deleted in place (in amortized constant time, by moving the last row into the deleted
+    one), so that the matrix does not need to be rebuilt on every change. The matrix is empty until it is loaded."""
+
+    def __init__(self, tick_count=TICK_COUNT, timer=time.monotonic):
+        self.tick_count = tick_count
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._clear(0)
+
+    def _clear(self, capacity):
+        self._rows = {}  # by session_id
+        self._session_ids = np.empty(capacity, dtype=np.int64)
+        self._ticks = np.empty((capacity, self.tick_count), dtype=np.float64)
+        self._selected_ticks = np.empty(capacity, dtype=np.int64)
+        self._step_counts = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._session_ids))
+        self._session_ids = np.resize(self._session_ids, capacity)
+        self._ticks = np.resize(self._ticks, (capacity, self.tick_count))
+        self._selected_ticks = np.resize(self._selected_ticks, capacity)
+        self._step_counts = np.resize(self._step_counts, capacity)
+
+    def _upsert(self, session_id, ticks, selected_tick, step_count):
+        row = self._rows.get(session_id)
+        if row is None:
+            if self._size == len(self._session_ids):
+                self._grow()
+            row = self._size
+            self._size += 1
+            self._rows[session_id] = row
+            self._session_ids[row] = session_id
+
+        self._ticks[row] = ticks
+        self._selected_ticks[row] = selected_tick
+        self._step_counts[row] = step_count
+
+    def is_loaded_since(self, max_age):
+        return self._loaded_at is not None and self._timer() - self._loaded_at <= max_age
+
+    def load(self, load_audios):
+        """Replace the contents of the matrix with the (session_id, ticks, selected_tick, step_count) of the audios
+        returned by load_audios, which is called while holding the lock, so that no change is applied meanwhile."""
+        with self._lock:
+            audios = load_audios()
+            self._clear(len(audios))
+            for audio in audios:
+                self._upsert(*audio)
+            self._loaded_at = self._timer()
+
+    def unload(self):
+        with self._lock:
+            self._clear(0)
+            self._loaded_at = None
+
+    def upsert(self, session_id, ticks, selected_tick, step_count):
+        """Apply the creation or update of an audio, if the matrix is loaded (otherwise it is included when loaded)."""
+        if len(ticks) != self.tick_count:
+            return
+
+        with self._lock:
+            if self._loaded_at is not None:
+                self._upsert(session_id, ticks, selected_tick, step_count)
+
+    def delete(self, session_id):
+        with self._lock:
+            row = self._rows.pop(session_id, None)
+            if row is None:
+                return
+
+            last_row = self._size - 1
+            if row != last_row:
+                self._session_ids[row] = self._session_ids[last_row]
+                self._ticks[row] = self._ticks[last_row]
+                self._selected_ticks[row] = self._selected_ticks[last_row]
+                self._step_counts[row] = self._step_counts[last_row]
+                self._rows[int(self._session_ids[row])] = row
+            self._size = last_row
+
+    def stats(self, percentiles=TICK_PERCENTILES):
+        """Compute the aggregate statistics of the audios of the matrix."""
+        with self._lock:
+            ticks = self._ticks[:self._size].copy()
+            selected_ticks = self._selected_ticks[:self._size].copy()
+            step_counts = self._step_counts[:self._size].copy()
+
+        if len(ticks) == 0:
+            return {"count": 0, "ticks": None, "selected_tick": None, "step_count": None}
+
+        step_count_values, step_count_counts = np.unique(step_counts, return_counts=True)
+        valid_selected_ticks = selected_ticks[(selected_ticks >= 0) & (selected_ticks < self.tick_count)]
+
+        return {
+            "count": len(ticks),
+            "ticks": {
+                "mean": ticks.mean(axis=0).tolist(),
+                "min": ticks.min(axis=0).tolist(),
+                "max": ticks.max(axis=0).tolist(),
+                "percentiles": {
+                    str(percentile): values.tolist()
+                    for percentile, values in zip(percentiles, np.percentile(ticks, percentiles, axis=0))},
+            },
+            "selected_tick": {
+                "histogram": np.bincount(valid_selected_ticks, minlength=self.tick_count).tolist(),
+            },
+            "step_count": {
+                "mean": float(step_counts.mean()),
+                "min": int(step_counts.min()),
+                "max": int(step_counts.max()),
+                "percentiles": {
+                    str(percentile): float(value)
+                    for percentile, value in zip(percentiles, np.percentile(step_counts, percentiles))},
+                "histogram": {
+                    str(value): int(count) for value, count in zip(step_count_values, step_count_counts)},
+            },
+        }
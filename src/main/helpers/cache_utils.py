@@ -0,0 +1,70 @@
+import threading
+import time
+from cachetools import TTLCache
+
+
+class _EvictionCountingTTLCache(TTLCache):
+    def __init__(self, maxsize, ttl, timer, on_evict):
+        super().__init__(maxsize, ttl, timer=timer)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        # only called to make room for a new item, expired items are removed by expire()
+        item = super().popitem()
+        self._on_evict()
+        return item
+
+
+class ReadThroughCache:
+    """Size-bounded, thread-safe cache which evicts the least recently used items, and expires items after ttl seconds.
+
+    On a miss, the caller loads the item outside of the lock, so slow loads do not block other threads, and caches it with
+    the token returned by get(). A loaded item is not cached if the cache was invalidated while it was loading, as it may
+    be stale."""
+
+    def __init__(self, maxsize, ttl, timer=time.monotonic):
+        self._lock = threading.Lock()
+        self._cache = _EvictionCountingTTLCache(maxsize, ttl, timer, self._count_eviction)
+        self._invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _count_eviction(self):
+        self.evictions += 1
+
+    def get(self, key):
+        """Get the cached value, or None on a miss, along with the token to pass to set() to cache a loaded value."""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value, self._invalidations
+
+    def set(self, key, value, token):
+        with self._lock:
+            if token == self._invalidations:
+                self._cache[key] = value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._invalidations += 1
+            self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            self._cache.expire()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._cache),
+                "max_size": self._cache.maxsize,
+            }
@@ -0,0 +1,9 @@
+import configparser
+
+
+def is_enabled(value):
+    """Whether the value of a boolean config is true, including values set in the instance config file, which are
+    strings (e.g. 'true', 'on' or '1')."""
+    if isinstance(value, str):
+        return configparser.ConfigParser.BOOLEAN_STATES.get(value.lower(), False)
+    return bool(value)
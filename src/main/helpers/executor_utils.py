@@ -0,0 +1,41 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorRegistry:
+    """Process-wide registry of named, bounded thread pools.
+
+    Pools are shared by all request handling threads, which bounds the total number of concurrent background tasks
+    (e.g. Storage calls) made by the process. The registry must be reset in forked child processes, as threads are not
+    carried over to the child."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executors = {}
+
+    def get_executor(self, name, max_workers):
+        executor = self._executors.get(name)
+        if executor is not None:
+            return executor
+
+        with self._lock:
+            if name not in self._executors:
+                self._executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+            return self._executors[name]
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._executors = {}
+
+
+registry = ExecutorRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+def get_executor(name, max_workers):
+    """Get the thread pool with the given name, creating it with at most max_workers threads if it does not exist."""
+    return registry.get_executor(name, max_workers)
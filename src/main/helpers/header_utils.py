@@ -1,5 +1,32 @@
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlencode
+from flask import make_response
 
 
 def set_resource_uri_header(request, response, relative_path_to_resource):
     response.headers["Location"] = urljoin(request.base_url, relative_path_to_resource)
+
+
+def set_next_page_link_header(request, response, next_page_args):
+    """Link to the next page of the requested resources, with the same request query params besides the pagination ones."""
+    args = request.args.to_dict()
+    args.update(next_page_args)
+    response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+
+
+def is_not_modified(request, etag):
+    """Whether the entity tag matches the request If-None-Match header, using the weak comparison."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def make_not_modified_response(etag):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    return response
+
+
+def get_if_match_etags(request):
+    """Get the strong entity tags of the request If-Match header,
+    or None if the request is not conditioned on the entity tag (no header, or '*')."""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    return request.if_match.as_set()
@@ -0,0 +1,60 @@
+import io
+from PIL import Image, ImageOps
+
+from src.main.exceptions import ValidationError
+
+# the Pillow format and the mimetype of each format variants are encoded in, by file extension
+IMAGE_VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def open_image(file, max_pixels):
+    """Open the image of the file, only reading its header, checking that it is no larger than max_pixels so that
+    decoding it does not use an unbounded amount of memory."""
+    try:
+        image = Image.open(file)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError("Uploaded image file is not a valid JPEG or PNG image.")
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ValidationError(
+            f"Uploaded image is {width}x{height} pixels, images can have at most {max_pixels} pixels.")
+    return image
+
+
+def load_image(file, max_pixels, draft_size=None):
+    """Load the image from the file, rotated upright according to its EXIF orientation, if any. JPEG images are
+    downsampled while they are decoded, to the smallest scale which is still at least draft_size, if given."""
+    image = open_image(file, max_pixels)
+    if draft_size is not None:
+        image.draft(image.mode, draft_size)  # does nothing for other formats
+    image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def resize_image(image, width, height, crop):
+    """Resize the image to exactly width x height, cropping it around its center if crop is True, otherwise to fit
+    within width x height while keeping its aspect ratio (without enlarging it)."""
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def encode_image(image, extension, quality=80):
+    """Encode the image in the format of the extension, returning the encoded bytes and their mimetype."""
+    image_format, mimetype = IMAGE_VARIANT_FORMATS[extension]
+
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")  # JPEG has no alpha channel (or palette)
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    data = io.BytesIO()
+    image.save(data, image_format, quality=quality)
+    return data.getvalue(), mimetype
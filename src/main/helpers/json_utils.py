@@ -0,0 +1,101 @@
+"""JSON codec used to decode requests and stored data, and to encode responses.
+
+The codec is backed by orjson when it is installed (it is an optional dependency, see README), and otherwise by the
+standard library json module. Values which orjson does not support (e.g. integers larger than 64 bits, NaN) or encodes
+differently (non-finite floats, which it encodes as null, and datetimes, which it encodes in ISO 8601 rather than with
+default) are handled by the standard library, so both backends accept and produce the same documents. The exception
+is numpy arrays, which only orjson encodes."""
+
+import json
+import math
+
+from flask.json.provider import DefaultJSONProvider
+
+from src.main.helpers.metrics_utils import get_spans
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibJSONCodec:
+    name = "json"
+
+    def dumps(self, obj, sort_keys=False, default=None):
+        return json.dumps(obj, sort_keys=sort_keys, default=default, separators=(",", ":"))
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+def has_non_finite_float(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(has_non_finite_float(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(has_non_finite_float(value) for value in obj)
+    return False
+
+
+class OrjsonJSONCodec:
+    name = "orjson"
+
+    def __init__(self):
+        self._fallback = StdlibJSONCodec()
+
+    def dumps(self, obj, sort_keys=False, default=None):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            data = orjson.dumps(obj, default=default, option=option)
+        except TypeError:  # orjson.JSONEncodeError
+            return self._fallback.dumps(obj, sort_keys=sort_keys, default=default)
+        # orjson encodes non-finite floats as null, so only documents with a null need to be checked for them
+        if b"null" in data and has_non_finite_float(obj):
+            return self._fallback.dumps(obj, sort_keys=sort_keys, default=default)
+        return data.decode("utf-8")
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except ValueError:  # orjson.JSONDecodeError
+            # either not supported by orjson, or malformed, in which case the error is the standard library one
+            return self._fallback.loads(data)
+
+
+def get_default_codec():
+    return OrjsonJSONCodec() if orjson is not None else StdlibJSONCodec()
+
+
+codec = get_default_codec()
+
+
+def dumps(obj, sort_keys=False, default=None):
+    """Serialize obj to a JSON formatted str."""
+    return codec.dumps(obj, sort_keys=sort_keys, default=default)
+
+
+def loads(data):
+    """Deserialize the JSON document in the str, bytes or bytearray data.
+    Raises a json.JSONDecodeError if data is not a valid JSON document."""
+    return codec.loads(data)
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by the codec, so that jsonify and request.json use it too.
+    Calls are recorded as spans of the serialization phase."""
+
+    def dumps(self, obj, **kwargs):
+        with get_spans().span("serialization", "dumps"):
+            if kwargs.get("indent") is not None:  # pretty printed responses in debug mode
+                return super().dumps(obj, **kwargs)
+
+            return dumps(
+                obj, sort_keys=kwargs.get("sort_keys", self.sort_keys), default=kwargs.get("default", self.default))
+
+    def loads(self, s, **kwargs):
+        with get_spans().span("serialization", "loads"):
+            return loads(s)
@@ -0,0 +1,3 @@
+def chunks(items, size):
+    """Split the list of items into consecutive lists of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
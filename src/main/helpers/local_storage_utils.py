@@ -0,0 +1,253 @@
+"""Local filesystem implementation of the subset of the GCP Storage bucket and blob API used by the services.
+
+Each blob is stored in a file of the bucket directory, in one of 256 shard subdirectories (by hash of the blob name) so
+that directories stay small. The file starts with a header holding the generation and content type of the blob, which
+are thus replaced atomically with its contents: blobs are written to a temporary file which is then renamed over the
+blob file. Writes are serialized per shard with a file lock, so that generation preconditions hold across processes.
+Blob files are read through a memory map, without copying them in a read buffer first."""
+
+import hashlib
+import mmap
+import os
+import pathlib
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where only the threads of the process are synchronized
+    fcntl = None
+
+LIST_PAGE_SIZE = 1000
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_header = struct.Struct("<qH")  # generation, content type length (followed by the content type)
+_thread_lock = threading.Lock()  # only used if file locks are not available
+
+
+def encode_blob_filename(blob_name):
+    filename = quote(blob_name, safe="")
+    if filename.startswith("."):  # hidden files are reserved for locks and temporary files
+        filename = "%2E" + filename[1:]
+    return filename
+
+
+def decode_blob_filename(filename):
+    return unquote(filename)
+
+
+def get_shard(blob_name):
+    return hashlib.sha1(blob_name.encode("utf-8")).hexdigest()[:2]  # one of 256 shards
+
+
+def read_header(file):
+    generation, content_type_length = _header.unpack(file.read(_header.size))
+    content_type = file.read(content_type_length).decode("utf-8") or None
+    return generation, content_type, _header.size + content_type_length
+
+
+def build_header(generation, content_type):
+    content_type = (content_type or "").encode("utf-8")
+    return _header.pack(generation, len(content_type)) + content_type
+
+
+class LocalBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.generation = None
+        self.content_type = None
+        self.size = None
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.path, get_shard(self.name), encode_blob_filename(self.name))
+
+    @property
+    def media_link(self):
+        return pathlib.Path(os.path.abspath(self.path)).as_uri()
+
+    def reload(self):
+        """Load the generation, content type and size of the blob. Raises NotFound if it does not exist."""
+        try:
+            with open(self.path, "rb") as file:
+                self.generation, self.content_type, offset = read_header(file)
+                self.size = os.fstat(file.fileno()).st_size - offset
+        except FileNotFoundError:
+            raise NotFound(f"No such blob '{self.name}'.")
+
+    def _check_generation_match(self, if_generation_match):
+        try:
+            with open(self.path, "rb") as file:
+                generation, _, _ = read_header(file)
+        except FileNotFoundError:
+            generation = 0  # like GCS, a generation of 0 matches only if the blob does not exist
+        if if_generation_match is not None and if_generation_match != generation:
+            raise PreconditionFailed(f"Precondition failed for blob '{self.name}'.")
+        return generation
+
+    def _write(self, write_data, content_type, if_generation_match):
+        shard_path = os.path.dirname(self.path)
+        os.makedirs(shard_path, exist_ok=True)
+        temp_path = os.path.join(shard_path, f".tmp-{uuid.uuid4().hex}")
+        try:
+            with self.bucket.lock(shard_path):
+                current_generation = self._check_generation_match(if_generation_match)
+                # generations only increase, even if the clock goes backwards
+                generation = max(time.time_ns(), current_generation + 1)
+                with open(temp_path, "wb") as file:
+                    file.write(build_header(generation, content_type))
+                    write_data(file)
+                os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.generation = generation
+        self.content_type = content_type
+
+    def upload_from_string(self, data, content_type="text/plain", if_generation_match=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._write(lambda file: file.write(data), content_type, if_generation_match)
+        self.size = len(data)
+
+    def upload_from_file(self, file_obj, size=None, content_type=None, if_generation_match=None):
+        """Copy size bytes (or the rest) of the file, chunk_size bytes at a time, without reading it all in memory."""
+        chunk_size = self.chunk_size or COPY_CHUNK_SIZE
+
+        def write_data(file):
+            remaining = size
+            while remaining is None or remaining > 0:
+                chunk = file_obj.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                file.write(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+        self._write(write_data, content_type, if_generation_match)
+
+    @contextmanager
+    def _open_contents(self, if_generation_match=None):
+        """Memory map the blob file, yielding a memoryview of its contents."""
+        try:
+            file = open(self.path, "rb")
+        except FileNotFoundError:
+            raise NotFound(f"No such blob '{self.name}'.")
+
+        with file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            generation, content_type_length = _header.unpack_from(mapped_file)
+            if if_generation_match is not None and if_generation_match != generation:
+                raise PreconditionFailed(f"Precondition failed for blob '{self.name}'.")
+            self.generation = generation
+
+            contents = memoryview(mapped_file)[_header.size + content_type_length:]
+            try:
+                yield contents
+            finally:
+                contents.release()  # the map cannot be closed while it is exported
+
+    def download_as_bytes(self, if_generation_match=None):
+        with self._open_contents(if_generation_match) as contents:
+            return contents.tobytes()
+
+    def download_as_text(self, if_generation_match=None):
+        return self.download_as_bytes(if_generation_match).decode("utf-8")
+
+    def download_to_file(self, file_obj, if_generation_match=None):
+        with self._open_contents(if_generation_match) as contents:
+            file_obj.write(contents)
+
+
+class LocalBlobIterator:
+    """Lists the blobs in pages of at most LIST_PAGE_SIZE blobs, like the iterator of the GCS client."""
+
+    def __init__(self, bucket, names, max_results):
+        self._bucket = bucket
+        self._names = names[:max_results] if max_results is not None else names
+        self._has_more = max_results is not None and len(names) > max_results
+        self.next_page_token = None
+
+    @property
+    def pages(self):
+        for start in range(0, len(self._names), LIST_PAGE_SIZE):
+            page_names = self._names[start:start + LIST_PAGE_SIZE]
+            is_last_page = start + LIST_PAGE_SIZE >= len(self._names)
+            self.next_page_token = page_names[-1] if not is_last_page or self._has_more else None
+            yield iter(self._bucket.get_existing_blobs(page_names))
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class LocalBucket:
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+    @contextmanager
+    def lock(self, shard_path):
+        if fcntl is None:
+            with _thread_lock:
+                yield
+            return
+
+        with open(os.path.join(shard_path, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def blob(self, name, chunk_size=None):
+        return LocalBlob(self, name, chunk_size=chunk_size)
+
+    def get_blob(self, name):
+        blob = self.blob(name)
+        try:
+            blob.reload()
+        except NotFound:
+            return None
+        return blob
+
+    def get_existing_blobs(self, names):
+        return [blob for blob in map(self.get_blob, names) if blob is not None]
+
+    def list_blob_names(self):
+        if not os.path.isdir(self.path):
+            return []
+
+        names = []
+        for shard in os.scandir(self.path):
+            if shard.is_dir():
+                names.extend(decode_blob_filename(entry.name) for entry in os.scandir(shard.path)
+                             if not entry.name.startswith("."))
+        return names
+
+    def list_blobs(self, prefix="", max_results=None, page_token=None, **kwargs):
+        """List the blobs in lexicographic order of their names, starting after the page_token name.
+        As all shards are scanned, each call takes time linear in the number of blobs in the bucket."""
+        names = sorted(name for name in self.list_blob_names()
+                       if name.startswith(prefix or "") and (page_token is None or name > page_token))
+        return LocalBlobIterator(self, names, max_results)
+
+    def delete_blobs(self, names, on_error=None):
+        for name in names:
+            blob = self.blob(name)
+            shard_path = os.path.dirname(blob.path)
+            try:
+                with self.lock(shard_path):
+                    os.remove(blob.path)
+            except FileNotFoundError:
+                if on_error is None:
+                    raise NotFound(f"No such blob '{name}'.")
+                on_error(blob)
@@ -0,0 +1,198 @@
+"""Latency metrics of the process, exported in the Prometheus text format.
+
+Each request records its duration by endpoint, and the time it spent in each phase (database, storage, validation and
+serialization calls), which is measured by spans around these calls, as well as the number of round trips it made to the
+database and to storage. Metrics are kept in memory by each process, so each gunicorn worker exports its own."""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# in seconds, from sub-millisecond database calls to slow storage calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# phases whose round trips are counted by request, with the response header reporting them in debug mode
+ROUND_TRIP_HEADERS = {"db": "X-DB-Round-Trips", "storage": "X-Storage-Round-Trips"}
+
+
+def format_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Thread-safe histogram of observations, by combination of label values."""
+
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # by label values, the count of each bucket (and of +Inf), and the sum of the observations
+
+    def observe(self, label_values, value):
+        bucket_index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket_index] += 1
+            series[1] += value
+
+    def get_count(self, label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            return sum(series[0]) if series is not None else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self._series.items()]
+
+        for label_values, counts, total in sorted(series):
+            labels = ",".join(f'{label_name}="{format_label_value(label_value)}"'
+                              for label_name, label_value in zip(self.label_names, label_values))
+            cumulative_count = 0
+            for upper_bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative_count += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{upper_bound}"}} {cumulative_count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative_count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "Duration of the requests, by endpoint.",
+            ("endpoint", "method", "status"))
+        self.request_phase_duration = Histogram(
+            "http_request_phase_duration_seconds", "Time spent by each request in each phase, by endpoint.",
+            ("endpoint", "phase"))
+        self.span_duration = Histogram(
+            "app_span_duration_seconds", "Duration of the database, storage, validation and serialization calls.",
+            ("phase", "operation"))
+        self.request_round_trips = Histogram(
+            "http_request_round_trips", "Number of database and storage round trips made by each request, by endpoint.",
+            ("endpoint", "phase"), ROUND_TRIP_BUCKETS)
+
+    def render(self):
+        lines = []
+        for histogram in (self.request_duration, self.request_phase_duration, self.span_duration,
+                          self.request_round_trips):
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+class Spans:
+    """Records the duration of calls made in some phase. Those made for a request also add up to the time spent by the
+    request in the phase, and to its number of round trips in the phase, including when they are made by other threads
+    (e.g. concurrent storage calls)."""
+
+    def __init__(self, metrics, is_request=False):
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self.phase_durations = defaultdict(float) if is_request else None
+        self.round_trips = defaultdict(int) if is_request else None
+
+    @contextmanager
+    def span(self, phase, operation, round_trip=True):
+        """Record the call as a span, which also counts as a round trip unless round_trip is False (e.g. for fetches of
+        rows which were already read by the statement)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self._metrics.span_duration.observe((phase, operation), duration)
+            if self.phase_durations is not None:
+                with self._lock:
+                    self.phase_durations[phase] += duration
+                    if round_trip:
+                        self.round_trips[phase] += 1
+
+    def count_round_trip(self, phase):
+        if self.round_trips is not None:
+            with self._lock:
+                self.round_trips[phase] += 1
+
+
+class NullSpans:
+    @contextmanager
+    def span(self, phase, operation, round_trip=True):
+        yield
+
+    def count_round_trip(self, phase):
+        pass
+
+
+def get_spans():
+    """Get the spans of the current request, or of the app outside of requests (e.g. in background jobs)."""
+    if has_request_context() and "spans" in g:
+        return g.spans
+    if has_app_context():
+        return current_app.extensions["metrics_spans"]
+    return NullSpans()
+
+
+def spanned(phase):
+    """Decorate the function so that its calls are recorded as spans of the phase."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_spans().span(phase, fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    g.spans = Spans(current_app.extensions["metrics"], is_request=True)
+
+
+def record_request(response):
+    """Report the round trips made so far in the response headers (in debug mode), and record the metrics of the request
+    once its response is closed, so that those of streamed responses include the time spent producing their body."""
+    metrics = current_app.extensions["metrics"]
+    labels = (request.endpoint or "unmatched", request.method, str(response.status_code))
+    started_at = g.request_started_at
+    spans = g.spans
+
+    if current_app.debug or current_app.testing:
+        for phase, header in ROUND_TRIP_HEADERS.items():
+            response.headers[header] = str(spans.round_trips[phase])
+
+    response.call_on_close(lambda: observe_request(metrics, labels, started_at, spans))
+    return response
+
+
+def observe_request(metrics, labels, started_at, spans):
+    endpoint = labels[0]
+    metrics.request_duration.observe(labels, time.perf_counter() - started_at)
+    for phase, duration in list(spans.phase_durations.items()):
+        metrics.request_phase_duration.observe((endpoint, phase), duration)
+    for phase in ROUND_TRIP_HEADERS:
+        metrics.request_round_trips.observe((endpoint, phase), spans.round_trips[phase])
+
+
+def get_metrics():
+    return current_app.extensions["metrics"]
+
+
+def init_app(app):
+    """Register the metrics of the app, and the middleware timing each request.
+    This is called by the application factory."""
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+    app.extensions["metrics_spans"] = Spans(metrics)
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
@@ -0,0 +1,35 @@
+from flask import Response, stream_with_context
+
+from src.main.exceptions import ValidationError
+from src.main.helpers import json_utils
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def accepts_ndjson(request):
+    """Whether the client opted in to a streamed response, by preferring NDJSON over JSON in the Accept header."""
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def make_ndjson_response(records, status=200):
+    """Stream the records as newline-delimited JSON, one record per line, as they are produced by the iterable."""
+    def generate():
+        for record in records:
+            yield json_utils.dumps(record) + "\n"
+
+    # keep the request context (e.g. the database connection) around while the records are produced
+    return Response(stream_with_context(generate()), status=status, mimetype=NDJSON_MIMETYPE)
+
+
+def parse_ndjson(stream):
+    """Parse the newline-delimited JSON in the binary stream into the list of its records, skipping blank lines."""
+    records = []
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip() == b"":
+            continue
+        try:
+            records.append(json_utils.loads(line))
+        except ValueError as e:
+            raise ValidationError(f"Malformed JSON on line {line_number}: {e}")
+
+    return records
@@ -0,0 +1,193 @@
+"""On-demand profiling of single requests, to find where the time of a slow request type goes under real traffic.
+
+When PROFILING is enabled, a request sent with the PROFILING_SECRET in its X-Profile header is profiled, from its
+dispatch to the end of its response body (so that streamed responses are profiled too). By default it is profiled with
+cProfile, and its stats are saved as a pstats file (to read with the pstats module, or tools like snakeviz). With the
+'X-Profile-Mode: sample' header, the stack of the request thread is sampled every PROFILING_SAMPLE_INTERVAL seconds
+instead, which has a lower overhead, and the samples are saved as collapsed stacks (to render as a flame graph). Work
+done for the request by other threads (e.g. concurrent storage downloads) is not profiled.
+
+Profiles are saved in PROFILING_PATH (in the instance folder by default), and the name of the profile file of a request
+is returned in the X-Profile-File header of its response. When PROFILING is disabled, requests are not intercepted at
+all; when it is enabled, requests without the header only cost a header lookup."""
+
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from src.main.helpers.config_utils import is_enabled
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_MODE_HEADER = "HTTP_X_PROFILE_MODE"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+_unsafe_filename_characters = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class CProfileRecorder:
+    extension = "pstats"
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def save(self, filename):
+        self._profile.dump_stats(filename)
+
+
+def format_frame(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class SamplingRecorder:
+    """Samples the stack of the thread which started it from a background thread, and counts the samples of each
+    stack."""
+    extension = "collapsed"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stack_counts = defaultdict(int)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), name="profiling-sampler", daemon=True)
+        self._thread.start()
+
+    def _sample(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(format_frame(frame))
+                frame = frame.f_back
+            if len(stack) > 0:
+                self.stack_counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            for stack, count in sorted(self.stack_counts.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class ProfiledBody:
+    """Response body which stops the recorder and saves the profile once the response has been sent."""
+
+    def __init__(self, body, recorder, on_close):
+        self._body = body
+        self._recorder = recorder
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            self._recorder.stop()
+            self._on_close(self._recorder)
+
+
+def get_modification_time(filename):
+    try:
+        return os.path.getmtime(filename)
+    except FileNotFoundError:
+        return 0  # pruned by another process
+
+
+class ProfilingMiddleware:
+    """WSGI middleware profiling the requests which have the secret in their X-Profile header."""
+
+    def __init__(self, wsgi_app, secret, directory, sample_interval=0.001, max_profiles=100):
+        self.wsgi_app = wsgi_app
+        self.secret = secret.encode("utf-8")
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def is_triggered(self, environ):
+        trigger = environ.get(PROFILE_HEADER)
+        return trigger is not None and hmac.compare_digest(trigger.encode("utf-8"), self.secret)
+
+    def __call__(self, environ, start_response):
+        if not self.is_triggered(environ):
+            return self.wsgi_app(environ, start_response)
+
+        if environ.get(PROFILE_MODE_HEADER, "").lower() == "sample":
+            recorder = SamplingRecorder(self.sample_interval)
+        else:
+            recorder = CProfileRecorder()
+        profile_filename = self.make_profile_filename(environ, recorder.extension)
+
+        def start_profiled_response(status, headers, exc_info=None):
+            headers.append((PROFILE_FILE_HEADER, profile_filename))
+            return start_response(status, headers, exc_info)
+
+        def save_profile(stopped_recorder):
+            self.save_profile(stopped_recorder, profile_filename)
+
+        recorder.start()
+        try:
+            body = self.wsgi_app(environ, start_profiled_response)
+        except BaseException:
+            recorder.stop()
+            raise
+        return ProfiledBody(body, recorder, save_profile)
+
+    def make_profile_filename(self, environ, extension):
+        """Name the profile after the time and the request, e.g. '20240101T120000-GET-accounts-1a2b3c4d.pstats'."""
+        path = _unsafe_filename_characters.sub("_", environ.get("PATH_INFO", "").strip("/")) or "root"
+        return (f"{time.strftime('%Y%m%dT%H%M%S')}-{environ.get('REQUEST_METHOD', '')}-{path[:64]}-"
+                f"{uuid.uuid4().hex[:8]}.{extension}")
+
+    def save_profile(self, recorder, profile_filename):
+        os.makedirs(self.directory, exist_ok=True)
+        recorder.save(os.path.join(self.directory, profile_filename))
+        self.prune_profiles()
+
+    def prune_profiles(self):
+        """Delete the oldest profiles beyond max_profiles, so that profiles do not fill the disk."""
+        with self._lock:
+            filenames = [os.path.join(self.directory, filename) for filename in os.listdir(self.directory)]
+            filenames.sort(key=get_modification_time)
+            for filename in filenames[:max(0, len(filenames) - self.max_profiles)]:
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass  # pruned by another process
+
+
+def init_app(app):
+    """Wrap the dispatch of the Flask app with the profiling middleware, if PROFILING is enabled.
+    This is called by the application factory."""
+    if not is_enabled(app.config["PROFILING"]):
+        return
+
+    if not app.config["PROFILING_SECRET"]:
+        raise ValueError("PROFILING_SECRET must be set when PROFILING is enabled.")
+
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app,
+        app.config["PROFILING_SECRET"],
+        app.config["PROFILING_PATH"],
+        float(app.config["PROFILING_SAMPLE_INTERVAL"]),
+        int(app.config["PROFILING_MAX_PROFILES"]))
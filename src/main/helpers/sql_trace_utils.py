@@ -0,0 +1,345 @@
+"""Opt-in tracing of the SQL statements run on the database (see SQL_TRACE), to find slow statements and the full table
+scans which get slower as the tables grow.
+
+Statements run through get_db are timed, and aggregated by their text and the shape of their bound parameters (their
+types, never their values). The first time a statement is slower than SQL_TRACE_SLOW_THRESHOLD, its query plan is
+explained. Slow statements are also kept in a log of the most recent ones. SQLite reports every statement it runs to the
+trace callback, including implicit transaction statements and each execution of executemany and executescript, which
+are counted by their text with literal values masked.
+
+Each process keeps its own statistics, exposed at /debug/sql, and regularly saves them in SQL_TRACE_PATH (in the
+instance folder by default), where the 'sql-stats' command aggregates those of all processes."""
+
+import glob
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from src.main.helpers import json_utils
+from src.main.helpers.config_utils import is_enabled
+
+# the statistics statements can be sorted by, by the key of their statistic
+SORT_KEYS = {"total": "total_ms", "mean": "mean_ms", "max": "max_ms", "count": "count"}
+
+# statements with a variable number of parameters (e.g. IN lists) are aggregated whatever the number
+_parameter_list = re.compile(r"\?(\s*,\s*\?)+")
+_literal = re.compile(r"'(?:[^']|'')*'|\b[xX]'[0-9a-fA-F]*'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+
+
+def normalize_statement(sql):
+    return _parameter_list.sub("?, ...", " ".join(sql.split()))
+
+
+def mask_statement(sql):
+    """Replace the literal values of the statement (as reported by the trace callback, with its parameters expanded)
+    with placeholders, so that no data ends up in the statistics."""
+    return normalize_statement(_literal.sub("?", sql))
+
+
+def describe_parameters(parameters):
+    """Describe the shape of the parameters, e.g. '(str, int, ...)' or '{email: str}'."""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in sorted(parameters.items())) + "}"
+
+    type_names = [type(value).__name__ for value in parameters]
+    shape = []
+    for index, type_name in enumerate(type_names):
+        if index > 0 and type_name == type_names[index - 1]:
+            if shape[-1] != "...":
+                shape.append("...")
+            continue
+        shape.append(type_name)
+    return "(" + ", ".join(shape) + ")"
+
+
+def is_scan(plan_detail):
+    """Whether the step of a query plan visits every row of a table (or of an index), rather than searching it."""
+    return plan_detail.startswith("SCAN ")
+
+
+class StatementStats:
+    def __init__(self, sql, parameters_shape):
+        self.sql = sql
+        self.parameters_shape = parameters_shape
+        self.count = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.slow_count = 0
+        self.plan = None  # explained the first time the statement is slow
+
+    def to_dict(self):
+        return {
+            "sql": self.sql,
+            "parameters": self.parameters_shape,
+            "count": self.count,
+            "total_ms": self.total_duration * 1000,
+            "mean_ms": self.total_duration * 1000 / self.count if self.count > 0 else 0.0,
+            "max_ms": self.max_duration * 1000,
+            "slow_count": self.slow_count,
+            "plan": self.plan,
+            "scans": self.plan is not None and any(is_scan(detail) for detail in self.plan),
+        }
+
+
+class SqlTracer:
+    """Thread-safe statistics of the SQL statements run by the process."""
+
+    def __init__(self, directory, slow_threshold, slow_log_size=100, max_statements=1000):
+        self.directory = directory
+        self.slow_threshold = slow_threshold  # in seconds
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._statements = {}
+        self._executed = defaultdict(int)
+        self._slow_log = deque(maxlen=slow_log_size)
+        self.saved_at = time.monotonic()
+
+    def trace_callback(self, sql):
+        if sql.startswith("EXPLAIN QUERY PLAN"):
+            return  # run by the tracer itself
+        sql = mask_statement(sql)
+        with self._lock:
+            if sql in self._executed or len(self._executed) < self.max_statements:
+                self._executed[sql] += 1
+
+    def _get_statement_stats(self, sql, parameters_shape):
+        key = (sql, parameters_shape)
+        statement_stats = self._statements.get(key)
+        if statement_stats is None:
+            if len(self._statements) >= self.max_statements:
+                key = ("(other statements)", "")
+                if key not in self._statements:
+                    self._statements[key] = StatementStats(*key)
+                return self._statements[key]
+            statement_stats = self._statements[key] = StatementStats(sql, parameters_shape)
+        return statement_stats
+
+    @contextmanager
+    def trace(self, connection, sql, parameters=(), many=False):
+        """Time the statement run in the block on the connection, which is used to explain its plan if it is slow.
+        The parameters of executemany statements (if many is True) must be a sequence, rather than an iterator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            first_parameters = (parameters[0] if len(parameters) > 0 else ()) if many else parameters
+            parameters_shape = ("many " if many else "") + describe_parameters(first_parameters)
+            self.record(connection, sql, parameters_shape, first_parameters, duration)
+
+    def record(self, connection, sql, parameters_shape, parameters, duration):
+        is_slow = duration >= self.slow_threshold
+        with self._lock:
+            statement_stats = self._get_statement_stats(normalize_statement(sql), parameters_shape)
+            statement_stats.count += 1
+            statement_stats.total_duration += duration
+            statement_stats.max_duration = max(statement_stats.max_duration, duration)
+            if is_slow:
+                statement_stats.slow_count += 1
+            needs_plan = is_slow and statement_stats.plan is None
+
+        if not is_slow:
+            return
+
+        plan = explain_query_plan(connection, sql, parameters) if needs_plan else None
+        with self._lock:
+            if plan is not None:
+                statement_stats.plan = plan
+            self._slow_log.append({
+                "at": time.time(),
+                "sql": statement_stats.sql,
+                "parameters": parameters_shape,
+                "duration_ms": duration * 1000,
+            })
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "statements": [statement_stats.to_dict() for statement_stats in self._statements.values()],
+                "executed": dict(self._executed),
+                "slow_log": list(self._slow_log),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._executed.clear()
+            self._slow_log.clear()
+
+    def get_trace_filename(self):
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def is_save_due(self, save_interval):
+        """Whether the statistics were last saved at least save_interval seconds ago. If so, they are considered saved
+        now, so that a single one of the threads checking at the same time saves them."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self.saved_at < save_interval:
+                return False
+            self.saved_at = now
+            return True
+
+    def save(self):
+        """Save the statistics of the process in the trace directory, replacing those it saved before."""
+        with self._lock:
+            self.saved_at = time.monotonic()
+        with self._save_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_filename = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(json_utils.dumps(self.snapshot()))
+                os.replace(temp_filename, self.get_trace_filename())
+            except BaseException:
+                os.remove(temp_filename)
+                raise
+
+
+def explain_query_plan(connection, sql, parameters):
+    """Get the details of the steps of the query plan of the statement, or None if it cannot be explained."""
+    try:
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error:
+        return None
+    # rows are dicts with the row factory of the pool's connections, tuples otherwise
+    return [row["detail"] if isinstance(row, dict) else row[3] for row in rows]
+
+
+def merge_snapshots(snapshots, slow_log_size=100):
+    """Aggregate the statistics saved by several processes."""
+    statements = {}
+    executed = defaultdict(int)
+    slow_log = []
+    for snapshot in snapshots:
+        for statement in snapshot["statements"]:
+            key = (statement["sql"], statement["parameters"])
+            merged = statements.get(key)
+            if merged is None:
+                statements[key] = dict(statement)
+                continue
+            merged["count"] += statement["count"]
+            merged["total_ms"] += statement["total_ms"]
+            merged["mean_ms"] = merged["total_ms"] / merged["count"] if merged["count"] > 0 else 0.0
+            merged["max_ms"] = max(merged["max_ms"], statement["max_ms"])
+            merged["slow_count"] += statement["slow_count"]
+            if merged["plan"] is None:
+                merged["plan"], merged["scans"] = statement["plan"], statement["scans"]
+        for sql, count in snapshot["executed"].items():
+            executed[sql] += count
+        slow_log.extend(snapshot["slow_log"])
+
+    slow_log.sort(key=lambda entry: entry["at"], reverse=True)
+    return {"statements": list(statements.values()), "executed": dict(executed), "slow_log": slow_log[:slow_log_size]}
+
+
+def load_saved_snapshots(directory):
+    snapshots = []
+    for filename in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(filename, "rb") as f:
+            snapshots.append(json_utils.loads(f.read()))
+    return snapshots
+
+
+def get_top_statements(stats, sort="total", limit=20):
+    """Get the limit statements of the statistics with the largest sort statistic."""
+    return sorted(stats["statements"], key=lambda statement: statement[SORT_KEYS[sort]], reverse=True)[:limit]
+
+
+def get_sql_tracer():
+    """Get the SQL tracer of the app, or None if SQL tracing is not enabled."""
+    return current_app.extensions["sql_tracer"]
+
+
+def save_sql_trace_if_due(e=None):
+    tracer = current_app.extensions["sql_tracer"]
+    save_interval = float(current_app.config["SQL_TRACE_SAVE_INTERVAL"])
+    if tracer is None or not tracer.is_save_due(save_interval):
+        return
+    try:
+        tracer.save()
+    except OSError:
+        current_app.logger.exception(f"Could not save the SQL statistics in '{tracer.directory}'.")
+
+
+# tracers of all apps, so that the statistics inherited by forked child processes (e.g. gunicorn workers of a preloaded
+# app) are not counted twice
+_tracers = weakref.WeakSet()
+
+
+def _reset_tracers():
+    for tracer in list(_tracers):
+        tracer.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_tracers)
+
+
+def echo_stats(stats, sort, limit):
+    click.echo(f"{'count':>9} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'slow':>6}  statement")
+    for statement in get_top_statements(stats, sort, limit):
+        click.echo(f"{statement['count']:>9} {statement['total_ms']:>10.1f} {statement['mean_ms']:>9.3f} "
+                   f"{statement['max_ms']:>9.3f} {statement['slow_count']:>6}  {statement['sql']} "
+                   f"{statement['parameters']}")
+        if statement["plan"] is not None:
+            for detail in statement["plan"]:
+                click.echo(f"{'':>48}{'FULL SCAN ' if is_scan(detail) else ''}{detail}")
+
+    click.echo(f"\n{'executions':>10}  statement run by SQLite")
+    for sql, count in sorted(stats["executed"].items(), key=lambda item: item[1], reverse=True)[:limit]:
+        click.echo(f"{count:>10}  {sql}")
+
+    if len(stats["slow_log"]) > 0:
+        click.echo(f"\n{'ms':>10}  most recent slow statements")
+        for entry in stats["slow_log"][:limit]:
+            click.echo(f"{entry['duration_ms']:>10.1f}  {entry['sql']} {entry['parameters']}")
+
+
+@click.command("sql-stats")
+@click.option("--sort", type=click.Choice(list(SORT_KEYS)), default="total", show_default=True,
+              help="Statistic to sort the statements by.")
+@click.option("--limit", default=20, show_default=True, help="Number of statements to show.")
+@click.option("--reset", is_flag=True, help="Delete the saved statistics once shown.")
+@with_appcontext
+def sql_stats_command(sort, limit, reset):
+    """Show the statistics of the SQL statements saved by the processes of the app, when SQL_TRACE is enabled."""
+    directory = current_app.config["SQL_TRACE_PATH"]
+    snapshots = load_saved_snapshots(directory)
+    if len(snapshots) == 0:
+        click.echo(f"No SQL statistics were saved in '{directory}', make sure that SQL_TRACE is enabled.")
+        return
+
+    click.echo(f"SQL statistics saved by {len(snapshots)} processes in '{directory}':\n")
+    echo_stats(merge_snapshots(snapshots), sort, limit)
+
+    if reset:
+        for filename in glob.glob(os.path.join(directory, "*.json")):
+            os.remove(filename)
+
+
+def init_app(app):
+    """Register the SQL tracer with the Flask app, if SQL_TRACE is enabled, and the command showing its statistics.
+    This is called by the application factory."""
+    tracer = None
+    if is_enabled(app.config["SQL_TRACE"]):
+        tracer = SqlTracer(
+            app.config["SQL_TRACE_PATH"],
+            float(app.config["SQL_TRACE_SLOW_THRESHOLD"]) / 1000,
+            int(app.config["SQL_TRACE_SLOW_LOG_SIZE"]),
+            int(app.config["SQL_TRACE_MAX_STATEMENTS"]))
+        _tracers.add(tracer)
+    app.extensions["sql_tracer"] = tracer
+    app.teardown_appcontext(save_sql_trace_if_due)
+    app.cli.add_command(sql_stats_command)
@@ -1,13 +1,199 @@
+"""Storage buckets, as used by the services through the subset of the GCP Storage bucket and blob API implemented by
+both backends: GCP Storage itself ("gcs"), and the local filesystem ("local", see local_storage_utils), which is
+selected with the STORAGE_BACKEND config."""
+
 import os
+import threading
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
 from google.oauth2 import service_account
 from flask import current_app
+from requests.adapters import HTTPAdapter
+
+from src.main.helpers.local_storage_utils import LocalBucket
+from src.main.helpers.metrics_utils import get_spans
+
+CREDENTIALS_FILENAME = "google_application_credentials.json"
+
+STORAGE_BACKENDS = ("gcs", "local")
 
 
-def get_new_client_bucket(bucket_name):
+def build_client(credentials_path, pool_size):
+    """Instantiates a Storage client authorized with the service account credentials file, on top of an HTTP session
+    whose connection pool holds up to pool_size connections (one per concurrent request handling thread)."""
     credentials = service_account.Credentials.from_service_account_file(
-        os.path.join(current_app.instance_path, "google_application_credentials.json"))
-    # Instantiates a client
-    storage_client = storage.Client(credentials=credentials)
-    # Sets the bucket on client
-    return storage_client.bucket(bucket_name)
+        credentials_path, scopes=storage.Client.SCOPE)
+
+    # the authorized session refreshes the (shared) access token when it expires
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return storage.Client(project=credentials.project_id, credentials=credentials, _http=session)
+
+
+class StorageClientRegistry:
+    """Process-wide registry of Storage clients and bucket handles.
+
+    Clients are expensive to create (credentials file parsing, new HTTP session and TLS handshakes), so a single client
+    is created per credentials file for the lifetime of the process and shared between all request handling threads.
+    The registry must be reset in forked child processes, as connections cannot be shared across processes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._buckets = {}
+
+    def get_bucket(self, credentials_path, bucket_name, pool_size):
+        key = (credentials_path, bucket_name)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            return bucket
+
+        with self._lock:
+            if key not in self._buckets:
+                if credentials_path not in self._clients:
+                    self._clients[credentials_path] = build_client(credentials_path, pool_size)
+                self._buckets[key] = self._clients[credentials_path].bucket(bucket_name)
+
+            return self._buckets[key]
+
+    def reset(self):
+        # the lock may have been held by another thread of the parent process at the time of the fork
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._buckets = {}
+
+
+registry = StorageClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+def get_client_bucket(bucket_name):
+    """Get the handle of the bucket with the given name, on the Storage client shared by the whole process."""
+    return registry.get_bucket(
+        os.path.join(current_app.instance_path, CREDENTIALS_FILENAME),
+        bucket_name,
+        current_app.config["STORAGE_POOL_SIZE"])
+
+
+class SpannedBlob:
+    """Blob whose uploads and downloads are recorded as spans of the storage phase."""
+
+    def __init__(self, blob, spans):
+        self._blob = blob
+        self._spans = spans
+
+    def __getattr__(self, name):
+        return getattr(self._blob, name)
+
+    def upload_from_string(self, *args, **kwargs):
+        with self._spans.span("storage", "upload"):
+            return self._blob.upload_from_string(*args, **kwargs)
+
+    def upload_from_file(self, *args, **kwargs):
+        with self._spans.span("storage", "upload"):
+            return self._blob.upload_from_file(*args, **kwargs)
+
+    def download_as_bytes(self, *args, **kwargs):
+        with self._spans.span("storage", "download"):
+            return self._blob.download_as_bytes(*args, **kwargs)
+
+    def download_as_text(self, *args, **kwargs):
+        with self._spans.span("storage", "download"):
+            return self._blob.download_as_text(*args, **kwargs)
+
+    def download_to_file(self, *args, **kwargs):
+        with self._spans.span("storage", "download"):
+            return self._blob.download_to_file(*args, **kwargs)
+
+
+class SpannedBlobIterator:
+    """Blob listing whose page fetches are recorded as spans of the storage phase."""
+
+    def __init__(self, iterator, spans):
+        self._iterator = iterator
+        self._spans = spans
+
+    def __getattr__(self, name):
+        return getattr(self._iterator, name)  # e.g. next_page_token
+
+    @property
+    def pages(self):
+        pages = iter(self._iterator.pages)
+        while True:
+            # the end of the listing is known from the last page, without another round trip
+            with self._spans.span("storage", "list", round_trip=False):
+                page = next(pages, None)
+                if page is None:
+                    return
+                blobs = list(page)
+            self._spans.count_round_trip("storage")
+            yield iter([SpannedBlob(blob, self._spans) for blob in blobs])
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class SpannedBucket:
+    """Bucket whose calls are recorded as spans of the storage phase, of the request the bucket was got for (even if
+    the calls are made by other threads)."""
+
+    def __init__(self, bucket, spans):
+        self._bucket = bucket
+        self._spans = spans
+
+    def __getattr__(self, name):
+        return getattr(self._bucket, name)
+
+    def blob(self, *args, **kwargs):
+        return SpannedBlob(self._bucket.blob(*args, **kwargs), self._spans)
+
+    def get_blob(self, *args, **kwargs):
+        with self._spans.span("storage", "get"):
+            blob = self._bucket.get_blob(*args, **kwargs)
+        return SpannedBlob(blob, self._spans) if blob is not None else None
+
+    def list_blobs(self, *args, **kwargs):
+        return SpannedBlobIterator(self._bucket.list_blobs(*args, **kwargs), self._spans)
+
+    def delete_blobs(self, *args, **kwargs):
+        with self._spans.span("storage", "delete"):
+            return self._bucket.delete_blobs(*args, **kwargs)
+
+
+def get_bucket(bucket_name):
+    """Get the bucket with the given name, on the storage backend configured for the app."""
+    storage_backend = current_app.config["STORAGE_BACKEND"]
+    if storage_backend == "local":
+        bucket = LocalBucket(os.path.join(current_app.config["LOCAL_STORAGE_PATH"], bucket_name), bucket_name)
+    elif storage_backend == "gcs":
+        bucket = get_client_bucket(bucket_name)
+    else:
+        raise ValueError(f"Unknown storage backend '{storage_backend}', must be one of {STORAGE_BACKENDS}.")
+
+    return SpannedBucket(bucket, get_spans())
+
+
+def get_stream_size(stream):
+    """Get the number of bytes left to read in the seekable stream, without reading them."""
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END) - position
+    stream.seek(position)
+    return size
+
+
+def upload_from_stream(bucket, blob_name, stream, content_type, chunk_size, resumable_threshold):
+    """Upload the rest of the seekable stream to the blob with the given name, without reading it all in memory.
+
+    Streams of at least resumable_threshold bytes are uploaded in a resumable session, reading and sending chunk_size
+    bytes at a time (a multiple of 256 KiB), so that a failed chunk is retried on its own. Smaller streams are uploaded
+    in a single request."""
+    size = get_stream_size(stream)
+    blob = bucket.blob(blob_name, chunk_size=chunk_size if size >= resumable_threshold else None)
+    blob.upload_from_file(stream, size=size, content_type=content_type)
+    return blob
@@ -4,8 +4,9 @@ from src.main.exceptions import ValidationError
 from dataclasses import fields as get_fields
 
 from src.main.helpers.email_utils import is_valid_email, normalize_email
+from src.main.helpers.metrics_utils import spanned
 from src.main.models import UserInfo, Audio
-from marshmallow import EXCLUDE
+from marshmallow import EXCLUDE, ValidationError as MarshmallowValidationError
 from typing import List
 
 
@@ -14,78 +15,154 @@ def request_body_is_json(request):
         raise ValidationError("The request mimetype did not indicate JSON (application/json).")
 
 
-def validate_request_data_against_model(request_data, model_cls, exclude=[]):
-    fields = {field.name: field.type for field in get_fields(model_cls)}
+def validate_and_get_page_size(request_args, arg_name, default_page_size, max_page_size):
+    if arg_name not in request_args:
+        return default_page_size
 
-    errors = []
+    try:
+        page_size = int(request_args[arg_name])
+    except ValueError:
+        page_size = None
 
-    def missing_field(pfield_name):
-        errors.append({"detail": "Request is missing field '{}'".format(pfield_name), "pointer": pfield_name})
+    if page_size is None or page_size < 1 or page_size > max_page_size:
+        raise ValidationError(detailed_validation_errors=[{
+            "detail": f"'{request_args[arg_name]}' is not a valid value for request parameter '{arg_name}', "
+                      f"expected an integer between 1 and {max_page_size}.",
+            "pointer": arg_name}])
 
-    def wrong_field_type(pfield_name, expected_field_type, actual_field_value):
-        errors.append({
-            "detail": "'{}' is not a valid value for request field '{}', expected a {}.".format(
-                actual_field_value, pfield_name, expected_field_type.__name__),
-            "pointer": pfield_name})
-
-    for field_name, field_type in fields.items():
-        if field_name in exclude:
-            continue
-
-        if field_name not in request_data:
-            missing_field(field_name)
-            continue
-        if isinstance(field_type, type(List)):
-            if type(request_data[field_name]) != list:
-                wrong_field_type(field_name, field_type, request_data[field_name])
-            continue
+    return page_size
+
+
+def validate_and_get_after_id(request_args, arg_name):
+    if arg_name not in request_args:
+        return None
 
+    try:
+        after_id = int(request_args[arg_name])
+    except ValueError:
+        after_id = None
+
+    if after_id is None or after_id < 0:
+        raise ValidationError(detailed_validation_errors=[{
+            "detail": f"'{request_args[arg_name]}' is not a valid value for request parameter '{arg_name}', "
+                      f"expected a non-negative integer.",
+            "pointer": arg_name}])
+
+    return after_id
+
+
+class ModelValidator:
+    """Validator of the request data of a model, compiled once per model: the table of the fields to check (with their
+    type) and the schema the model is loaded with are built when the validator is created, and reused across requests."""
+
+    def __init__(self, model_cls, exclude=()):
+        self.fields = []
+        for field in get_fields(model_cls):
+            if field.name in exclude:
+                continue
+            is_list = isinstance(field.type, type(List))
+            self.fields.append((field.name, field.type, is_list, "list" if is_list else field.type.__name__))
+
+        # the schema of models with a List field without item type warns on creation
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.schema = model_cls.schema(unknown=EXCLUDE)
+
+    def validate(self, request_data):
+        errors = []
+
+        def missing_field(pfield_name):
+            errors.append({"detail": "Request is missing field '{}'".format(pfield_name), "pointer": pfield_name})
+
+        def wrong_field_type(pfield_name, expected_field_type_name, actual_field_value):
+            errors.append({
+                "detail": "'{}' is not a valid value for request field '{}', expected a {}.".format(
+                    actual_field_value, pfield_name, expected_field_type_name),
+                "pointer": pfield_name})
+
+        for field_name, field_type, is_list, field_type_name in self.fields:
+            if field_name not in request_data:
+                missing_field(field_name)
+                continue
+            if is_list:
+                if type(request_data[field_name]) != list:
+                    wrong_field_type(field_name, field_type_name, request_data[field_name])
+                continue
+
+            try:
+                field_type(request_data[field_name])
+            except (ValueError, TypeError):
+                wrong_field_type(field_name, field_type_name, request_data[field_name])
+
+        if len(errors) > 0:
+            raise ValidationError(detailed_validation_errors=errors)
+
+    def load(self, request_data, validated=False):
+        """Validate the request data, unless it was already validated, and load the model from it."""
+        if not validated:
+            self.validate(request_data)
         try:
-            field_type(request_data[field_name])
-        except ValueError:
-            wrong_field_type(field_name, field_type, request_data[field_name])
+            return self.schema.load(request_data)
+        except MarshmallowValidationError as e:
+            raise ValidationError(detailed_validation_errors=[
+                {"detail": "'{}' is not a valid value for request field '{}': {}".format(
+                    request_data.get(field_name), field_name, " ".join(messages)),
+                 "pointer": field_name}
+                for field_name, messages in e.normalized_messages().items()])
 
-    if len(errors) > 0:
-        raise ValidationError(detailed_validation_errors=errors)
 
+user_info_validator = ModelValidator(UserInfo, exclude=["id"])
 
+audio_validator = ModelValidator(Audio, exclude=["id"])
+
+
+@spanned("validation")
 def validate_and_get_user_info_model(data):
-    validate_request_data_against_model(data, UserInfo, exclude=["id"])
+    user_info_validator.validate(data)
     if not is_valid_email(data["email"]):
         raise ValidationError(detailed_validation_errors=[{
             "detail": f"'{data['email']}' is not a valid email.",
             "pointer": "email"}])
     data["email"] = normalize_email(data["email"])
-    return UserInfo.schema(unknown=EXCLUDE).load(data)
+    return user_info_validator.load(data, validated=True)
+
+
+def validate_audio_ticks(ticks, errors):
+    """Convert the ticks to floats, checking their count and range in the same pass."""
+    float_ticks = []
+    is_in_range = True
+    for tick in ticks:
+        try:
+            tick = float(tick)
+        except (ValueError, TypeError):
+            errors.append({
+                "detail": "'{}' is not a valid value for request field '{}', expected a list of {}s.".format(
+                    ticks, "ticks", float.__name__),
+                "pointer": "ticks"})
+            return ticks
+
+        is_in_range = is_in_range and -100 <= tick <= -10
+        float_ticks.append(tick)
+
+    if len(float_ticks) != 15 or not is_in_range:
+        errors.append({
+            "detail": f"'{float_ticks}' is not a valid value for request field 'ticks', must be 15 values and range from -10.0 to -100.0"})
+
+    return float_ticks
 
 
+@spanned("validation")
 def validate_and_get_audio_model(data):
-    validate_request_data_against_model(data, Audio, exclude=["id"])
     # we only perform domain-level business rule validation if the basic validation passes (does not throw)
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        audio_model = Audio.schema(unknown=EXCLUDE).load(data)
+    audio_model = audio_validator.load(data)
 
     errors = []
 
-    def wrong_type_in_list(pfield_name, expected_field_type, actual_field_value):
-        errors.append({
-            "detail": "'{}' is not a valid value for request field '{}', expected a list of {}s.".format(
-                actual_field_value, pfield_name, expected_field_type.__name__),
-            "pointer": pfield_name})
-
-    try:
-        audio_model.ticks = [float(tick) for tick in audio_model.ticks]
-    except ValueError:
-        wrong_type_in_list("ticks", float, audio_model.ticks)
-
-    if len(audio_model.ticks) != 15 or min(audio_model.ticks) < -100 or max(audio_model.ticks) > -10:
-        errors.append({
-            "detail": f"'{audio_model.ticks}' is not a valid value for request field 'ticks', must be 15 values and range from -10.0 to -100.0"})
+    audio_model.ticks = validate_audio_ticks(audio_model.ticks, errors)
 
     if audio_model.selected_tick < 0 or audio_model.selected_tick > 14:
         errors.append({
-            "detail": f"'{audio_model.ticks}' is not a valid value for request field 'selected_tick', must be between 0 and 14"})
+            "detail": f"'{audio_model.selected_tick}' is not a valid value for request field 'selected_tick', must be between 0 and 14"})
 
     if len(errors) > 0:
         raise ValidationError(detailed_validation_errors=errors)
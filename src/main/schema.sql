@@ -1,10 +1,38 @@
 DROP TABLE IF EXISTS user_info;
 DROP TABLE IF EXISTS audio;
+DROP TABLE IF EXISTS outbox;
 
 CREATE TABLE user_info (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   name TEXT NOT NULL,
   email TEXT UNIQUE NOT NULL,
   address TEXT NOT NULL,
-  image_hosted_link TEXT
+  image_hosted_link TEXT,
+  image_generation INTEGER, -- generation of the image blob, which the variants blob names are specific to
+  image_variant_links JSON, -- links to the variants of the image, by variant then by format
+  version INTEGER NOT NULL DEFAULT 1
 );
+
+-- indexes for searching user infos, emails are already indexed for uniqueness (and normalized before being stored)
+CREATE INDEX user_info_name_idx ON user_info (name);
+CREATE INDEX user_info_address_idx ON user_info (address);
+
+-- catalog of the audio files stored in the audio bucket, to look them up without listing the bucket
+CREATE TABLE audio (
+  session_id INTEGER PRIMARY KEY,
+  ticks BLOB NOT NULL, -- little-endian float64 array, loaded into the matrix of the audio stats
+  selected_tick INTEGER NOT NULL,
+  step_count INTEGER NOT NULL
+);
+
+-- blobs to delete from storage, added in the same transaction as the changes which orphaned them, see services/outbox.py
+CREATE TABLE outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  bucket TEXT NOT NULL,
+  blob_name TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at REAL NOT NULL DEFAULT 0, -- unix timestamp
+  last_error TEXT
+);
+
+CREATE INDEX outbox_next_attempt_at_idx ON outbox (next_attempt_at);
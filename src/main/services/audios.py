@@ -1,13 +1,24 @@
-import json
 import re
 
+from flask import current_app
+from google.api_core.exceptions import BadRequest, NotFound, PreconditionFailed
+
 from src.main.exceptions import ValidationError
+from src.main.data_sources.db import get_db, QUERY_PARAMS_CHUNK_SIZE
 from src.main.data_sources.buckets.audios import get_audio_bucket
-from src.main.exceptions import NoSuchInstanceError
+from src.main.exceptions import BadGatewayError, NoSuchInstanceError, PreconditionFailedError
+from src.main.helpers.audio_encoding_utils import AUDIO_MIMETYPE, encode_audio, decode_audio, is_legacy_audio
+from src.main.helpers.audio_matrix_utils import AudioMatrix, ticks_to_bytes, ticks_from_bytes
+from src.main.helpers.cache_utils import ReadThroughCache
+from src.main.helpers.executor_utils import get_executor
+from src.main.helpers.list_utils import chunks
+
+
+AUDIO_BLOB_NAME_PREFIX = "session_"
 
 
 def build_audio_blob_name(session_id):
-    return f"session_{str(session_id)}-audio.json"
+    return f"{AUDIO_BLOB_NAME_PREFIX}{str(session_id)}-audio.json"
 
 
 def extract_session_id(blob_name):
@@ -21,54 +32,334 @@ def extract_session_id(blob_name):
     raise ValueError("Blob name does not conform to expected format.")
 
 
+def audio_exists(session_id):
+    db = get_db()
+    return db.execute("SELECT 1 FROM audio WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+
+def get_existing_session_ids(session_ids):
+    """Get the subset of the given session_ids which have an audio in the catalog."""
+    db = get_db()
+    existing_session_ids = set()
+    for session_ids_chunk in chunks(list(session_ids), QUERY_PARAMS_CHUNK_SIZE):
+        existing_session_ids.update(row["session_id"] for row in db.execute(
+            f"SELECT session_id FROM audio WHERE session_id IN ({', '.join(['?'] * len(session_ids_chunk))})",
+            session_ids_chunk))
+
+    return existing_session_ids
+
+
+def save_audios_in_catalog(audio_models):
+    db = get_db()
+    db.executemany(
+        "INSERT OR REPLACE INTO audio (session_id, ticks, selected_tick, step_count) VALUES (?, ?, ?, ?)",
+        [(audio_model.session_id, ticks_to_bytes(audio_model.ticks), audio_model.selected_tick, audio_model.step_count)
+         for audio_model in audio_models]
+    )
+    db.commit()
+
+    audio_matrix = get_audio_matrix()
+    for audio_model in audio_models:
+        audio_matrix.upsert(audio_model.session_id, audio_model.ticks, audio_model.selected_tick, audio_model.step_count)
+
+
+def save_audio_in_catalog(audio_model):
+    save_audios_in_catalog((audio_model,))
+
+
+def upload_audio(audio_blob, audio, if_generation_match=None):
+    data = encode_audio(audio)
+    audio_blob.upload_from_string(
+        data, content_type="application/json" if is_legacy_audio(data) else AUDIO_MIMETYPE,
+        if_generation_match=if_generation_match)
+    return audio_blob.generation
+
+
+def upload_new_audio(audio_blob, audio_model):
+    # the generation precondition makes the upload fail if the blob exists, in case the catalog is out of date
+    return upload_audio(audio_blob, audio_model.to_dict(), if_generation_match=0)
+
+
 def create_audio(audio_model):
-    audio_bucket = get_audio_bucket()
+    if audio_exists(audio_model.session_id):
+        raise ValidationError(f"Audio file with session_id {audio_model.session_id} already exists.")
 
-    existing_blobs = audio_bucket.list_blobs()
-    existing_session_ids = [extract_session_id(blob.name) for blob in existing_blobs]
+    audio_bucket = get_audio_bucket()
 
-    if audio_model.session_id in existing_session_ids:
+    audio_blob = audio_bucket.blob(build_audio_blob_name(audio_model.session_id))
+    try:
+        generation = upload_new_audio(audio_blob, audio_model)
+    except PreconditionFailed:
         raise ValidationError(f"Audio file with session_id {audio_model.session_id} already exists.")
 
-    audio_bucket \
-        .blob(build_audio_blob_name(audio_model.session_id)) \
-        .upload_from_string(audio_model.to_json(), content_type="application/json")
+    save_audio_in_catalog(audio_model)
 
-    return audio_model.to_dict()
+    return audio_model.to_dict(), generation
 
 
-def get_audio(session_id):
+def create_audios(audio_models):
+    """Create all the audios, uploading their blobs concurrently.
+    Returns, for each audio in order, either the created audio and the generation of its blob, the ValidationError
+    for its session_id being already taken (by an existing audio, or by a previous audio in the batch), or the
+    BadGatewayError for its upload failing unexpectedly, which does not prevent the other audios from being saved."""
+    existing_session_ids = get_existing_session_ids(audio_model.session_id for audio_model in audio_models)
+
+    audio_bucket = get_audio_bucket()
+    executor = get_executor("storage", current_app.config["STORAGE_WORKERS"])
+
+    # the futures of the uploads, or the ValidationError of the audios which are not uploaded
+    uploads = []
+    for audio_model in audio_models:
+        if audio_model.session_id in existing_session_ids:
+            uploads.append(ValidationError(f"Audio file with session_id {audio_model.session_id} already exists."))
+        else:
+            existing_session_ids.add(audio_model.session_id)
+            audio_blob = audio_bucket.blob(build_audio_blob_name(audio_model.session_id))
+            uploads.append(executor.submit(upload_new_audio, audio_blob, audio_model))
+
+    results = []
+    uploaded_audio_models = []
+    for audio_model, upload in zip(audio_models, uploads):
+        if isinstance(upload, ValidationError):
+            results.append(upload)
+            continue
+
+        try:
+            results.append((audio_model.to_dict(), upload.result()))
+            uploaded_audio_models.append(audio_model)
+        except PreconditionFailed:
+            results.append(ValidationError(f"Audio file with session_id {audio_model.session_id} already exists."))
+        except Exception:
+            current_app.logger.exception(f"Could not upload the audio file with session_id {audio_model.session_id}.")
+            results.append(BadGatewayError(f"Audio file with session_id {audio_model.session_id} could not be saved."))
+
+    save_audios_in_catalog(uploaded_audio_models)
+
+    return results
+
+
+def download_audio(audio_blob):
+    return decode_audio(audio_blob.download_as_bytes())
+
+
+def download_listed_audios(executor, audio_blobs):
+    """Download the listed audio blobs concurrently, skipping those deleted since they were listed."""
+    def download_listed_audio(audio_blob):
+        try:
+            return download_audio(audio_blob)
+        except NotFound:
+            return None
+
+    return [audio for audio in executor.map(download_listed_audio, audio_blobs) if audio is not None]
+
+
+def get_audio_cache():
+    return current_app.extensions["audio_cache"]
+
+
+def get_existing_audio_blob(session_id):
     audio_bucket = get_audio_bucket()
 
     audio_blob = audio_bucket.get_blob(build_audio_blob_name(session_id))
     if audio_blob is None:
         raise NoSuchInstanceError(f"No audio file exists with session_id '{session_id}'.")
 
-    return json.loads(audio_blob.download_as_text())
+    return audio_blob
+
+
+def ensure_audio_exists(session_id):
+    """Raise NoSuchInstanceError if there is no audio with the given session_id, checked against the audio catalog rather
+    than the bucket, which saves a storage round trip."""
+    if not audio_exists(session_id):
+        raise NoSuchInstanceError(f"No audio file exists with session_id '{session_id}'.")
+
+
+def get_audio_generation(session_id):
+    """Get the current generation of the audio blob with the given session_id, bypassing the audio cache."""
+    return get_existing_audio_blob(session_id).generation
+
+
+def get_audio_and_generation(session_id, is_not_modified=None):
+    """Get the audio with the given session_id and the generation of its blob, from the audio cache if it was recently
+    read. The returned audio may be shared with other requests, so it must not be mutated.
+
+    If the audio is not cached and is_not_modified returns True for the generation of its blob, the blob is not
+    downloaded, and None is returned in place of the audio."""
+    audio_blob_name = build_audio_blob_name(session_id)
+    audio_cache = get_audio_cache()
+
+    audio_and_generation, token = audio_cache.get(audio_blob_name)
+    if audio_and_generation is not None:
+        return audio_and_generation
 
+    audio_blob = get_existing_audio_blob(session_id)
+    if is_not_modified is not None and is_not_modified(audio_blob.generation):
+        return None, audio_blob.generation
 
-def get_audios():
+    audio_and_generation = download_audio(audio_blob), audio_blob.generation
+    audio_cache.set(audio_blob_name, audio_and_generation, token)
+
+    return audio_and_generation
+
+
+def get_audio(session_id):
+    audio, _ = get_audio_and_generation(session_id)
+    return audio
+
+
+def get_audios(page_size, page_token=None):
+    """Get a page of at most page_size audios, starting from the page_token cursor (from the first audio if None).
+    Returns the audios and the cursor of the next page, or None if this is the last page."""
+    audio_bucket = get_audio_bucket()
+    try:
+        audio_blobs_iterator = audio_bucket.list_blobs(
+            prefix=AUDIO_BLOB_NAME_PREFIX, max_results=page_size, page_token=page_token)
+        audio_blobs = list(next(audio_blobs_iterator.pages, []))
+    except BadRequest:
+        # page tokens are opaque to the server, so malformed ones are only rejected by GCS
+        raise ValidationError(detailed_validation_errors=[{
+            "detail": f"'{page_token}' is not a valid value for request parameter 'page_token'.",
+            "pointer": "page_token"}])
+
+    # the sdk does not allow for batch downloading of bucket blobs, so the blobs of the page are downloaded concurrently
+    executor = get_executor("storage", current_app.config["STORAGE_WORKERS"])
+    audios = download_listed_audios(executor, audio_blobs)
+
+    return audios, audio_blobs_iterator.next_page_token
+
+
+def iter_audios():
+    """Lazily get all audios, downloading the blobs of one bucket listing page at a time."""
     audio_bucket = get_audio_bucket()
-    audio_blobs_iterator = audio_bucket.list_blobs()
+    executor = get_executor("storage", current_app.config["STORAGE_WORKERS"])
 
-    # this is potentially very slow since sdk does not seem to allow for batch downloading of bucket blobs
-    # at the minimum it should be paginated
-    # it is kept for completeness
-    return [json.loads(audio_blob.download_as_text()) for audio_blob in audio_blobs_iterator]
+    for audio_blobs_page in audio_bucket.list_blobs(prefix=AUDIO_BLOB_NAME_PREFIX).pages:
+        yield from download_listed_audios(executor, list(audio_blobs_page))
 
 
-def update_audio(_, audio_model):
+def update_audio(_, audio_model, if_generation_match=None):
+    """Overwrite the audio, only if its blob is still at the if_generation_match generation, if given."""
     # there are no "versioning" or "lifecycle" policies defined on the blob's bucket,
     # so upload will overwrite any existing contents anyway
     audio_bucket = get_audio_bucket()
 
-    audio_bucket \
-        .blob(build_audio_blob_name(audio_model.session_id)) \
-        .upload_from_string(audio_model.to_json(), content_type="application/json")
+    audio_blob_name = build_audio_blob_name(audio_model.session_id)
+    audio_blob = audio_bucket.blob(audio_blob_name)
+    try:
+        upload_audio(audio_blob, audio_model.to_dict(), if_generation_match=if_generation_match)
+    except PreconditionFailed:
+        raise PreconditionFailedError(f"Audio file with session_id {audio_model.session_id} was modified.")
+    finally:
+        get_audio_cache().invalidate(audio_blob_name)
+
+    save_audio_in_catalog(audio_model)
 
-    return audio_model.to_dict()
+    return audio_model.to_dict(), audio_blob.generation
 
 
 def delete_audio(session_id):
+    audio_blob_name = build_audio_blob_name(session_id)
+    audio_bucket = get_audio_bucket()
+    audio_bucket.delete_blobs((audio_blob_name,), on_error=lambda *args: None)  # suppress if does not exist
+    get_audio_cache().invalidate(audio_blob_name)
+
+    db = get_db()
+    db.execute("DELETE FROM audio WHERE session_id = ?", (session_id,))
+    db.commit()
+
+    get_audio_matrix().delete(session_id)
+
+
+def download_catalog_row(audio_blob):
+    """Download the audio blob as a row of the audio catalog, or None if it is not an audio file blob, or was deleted
+    since it was listed."""
+    try:
+        session_id = extract_session_id(audio_blob.name)
+        audio = download_audio(audio_blob)
+    except (ValueError, NotFound):
+        return None
+    return session_id, ticks_to_bytes(audio["ticks"]), audio["selected_tick"], audio["step_count"]
+
+
+def rebuild_audio_catalog():
+    """Replace the contents of the audio catalog with the audio files currently stored in the audio bucket, downloaded
+    concurrently. Returns the number of audio files in the rebuilt catalog."""
+    audio_bucket = get_audio_bucket()
+    executor = get_executor("storage", current_app.config["STORAGE_WORKERS"])
+
+    rows = []
+    for audio_blobs_page in audio_bucket.list_blobs(prefix=AUDIO_BLOB_NAME_PREFIX).pages:
+        rows.extend(row for row in executor.map(download_catalog_row, list(audio_blobs_page)) if row is not None)
+
+    db = get_db()
+    db.execute("DELETE FROM audio")
+    db.executemany("INSERT INTO audio (session_id, ticks, selected_tick, step_count) VALUES (?, ?, ?, ?)", rows)
+    db.commit()
+
+    get_audio_matrix().unload()
+
+    return len(rows)
+
+
+def get_audio_matrix():
+    return current_app.extensions["audio_matrix"]
+
+
+def load_audios_from_catalog():
+    db = get_db()
+    audios = []
+    for row in db.execute("SELECT session_id, ticks, selected_tick, step_count FROM audio"):
+        ticks = ticks_from_bytes(row["ticks"])
+        if len(ticks) == get_audio_matrix().tick_count:
+            audios.append((row["session_id"], ticks, row["selected_tick"], row["step_count"]))
+
+    return audios
+
+
+def get_audio_stats():
+    """Compute the aggregate statistics of all audios, from the in-memory matrix of the audios of the catalog.
+    The matrix is kept up to date with the changes made by this process, and reloaded from the catalog once it is older
+    than AUDIO_STATS_MAX_AGE seconds, to include the changes made by other processes."""
+    audio_matrix = get_audio_matrix()
+    if not audio_matrix.is_loaded_since(current_app.config["AUDIO_STATS_MAX_AGE"]):
+        audio_matrix.load(load_audios_from_catalog)
+
+    return audio_matrix.stats()
+
+
+def migrate_audio_blob(audio_blob):
+    """Re-encode the audio blob in the binary encoding, if it is in the legacy JSON encoding, unless it is modified
+    meanwhile. Returns whether the blob was migrated."""
+    data = audio_blob.download_as_bytes()
+    if not is_legacy_audio(data):
+        return False
+
+    try:
+        upload_audio(audio_blob, decode_audio(data), if_generation_match=audio_blob.generation)
+    except PreconditionFailed:
+        return False  # the blob was updated since it was listed, so it is already in the binary encoding
+
+    return True
+
+
+def migrate_audio_blobs():
+    """Re-encode all the audio blobs in the legacy JSON encoding in the binary encoding, concurrently.
+    Returns the number of migrated blobs and the number of audio blobs."""
     audio_bucket = get_audio_bucket()
-    audio_bucket.delete_blobs((build_audio_blob_name(session_id),), on_error=lambda *args: None)  # suppress if does not exist
+    executor = get_executor("storage", current_app.config["STORAGE_WORKERS"])
+
+    migrated_count = 0
+    audio_count = 0
+    for audio_blobs_page in audio_bucket.list_blobs(prefix=AUDIO_BLOB_NAME_PREFIX).pages:
+        for migrated in executor.map(migrate_audio_blob, list(audio_blobs_page)):
+            migrated_count += migrated
+            audio_count += 1
+
+    return migrated_count, audio_count
+
+
+def init_app(app):
+    """Register the audio cache and the audio matrix with the Flask app.
+    This is called by the application factory."""
+    app.extensions["audio_cache"] = ReadThroughCache(app.config["AUDIO_CACHE_MAX_SIZE"], app.config["AUDIO_CACHE_TTL"])
+    app.extensions["audio_matrix"] = AudioMatrix()
@@ -0,0 +1,163 @@
+"""Outbox of the blobs to delete from storage once the database changes which orphaned them are committed.
+
+Entries are added in the same transaction as those changes, so that requests do not wait on storage, and that blobs are
+eventually deleted even if storage is unavailable at the time. The outbox is drained in batches by a background worker
+of each process (or with the 'drain-outbox' command), which retries failed deletions with an exponential backoff."""
+
+import os
+import threading
+import time
+import weakref
+from itertools import groupby
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from src.main.data_sources.db import get_db
+from src.main.data_sources.buckets.images import get_image_bucket
+
+IMAGE_BUCKET = "images"
+
+
+def get_outbox_bucket(bucket):
+    if bucket == IMAGE_BUCKET:
+        return get_image_bucket()
+
+    raise ValueError(f"Unknown outbox bucket '{bucket}'.")
+
+
+def add_blob_deletions(db, bucket, blob_names):
+    """Add the deletion of the blobs to the outbox, as part of the current transaction of db, which is left to the
+    caller to commit (and to call notify_outbox() after)."""
+    db.executemany("INSERT INTO outbox (bucket, blob_name) VALUES (?, ?)", [(bucket, name) for name in blob_names])
+
+
+def drain_outbox(batch_size, max_attempts, retry_delay):
+    """Delete the blobs of the next batch of due outbox entries, with a single deletion call per bucket.
+    Entries whose blob was deleted (or did not exist) are removed, the others are retried after retry_delay seconds,
+    doubled on each attempt, unless they failed max_attempts times already.
+    Returns the number of entries of the batch."""
+    db = get_db()
+    now = time.time()
+
+    entries = db.execute(
+        "SELECT id, bucket, blob_name, attempts FROM outbox WHERE next_attempt_at <= ? AND attempts < ? "
+        "ORDER BY bucket, id LIMIT ?",
+        (now, max_attempts, batch_size)
+    ).fetchall()
+
+    done_entry_ids = []
+    failed_entries = []
+    for bucket, bucket_entries in groupby(entries, key=lambda entry: entry["bucket"]):
+        bucket_entries = list(bucket_entries)
+        try:
+            get_outbox_bucket(bucket).delete_blobs(
+                [entry["blob_name"] for entry in bucket_entries], on_error=lambda *args: None)  # already deleted
+            done_entry_ids.extend((entry["id"],) for entry in bucket_entries)
+        except Exception as e:
+            failed_entries.extend((entry, repr(e)) for entry in bucket_entries)
+
+    db.executemany("DELETE FROM outbox WHERE id = ?", done_entry_ids)
+    db.executemany(
+        "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+        [(now + retry_delay * 2 ** entry["attempts"], error, entry["id"]) for entry, error in failed_entries]
+    )
+    db.commit()
+
+    return len(entries)
+
+
+def drain_due_outbox_entries():
+    """Drain the outbox until no entries are due. Returns the number of processed entries (whether they failed or not)."""
+    processed_count = 0
+    while True:
+        batch_count = drain_outbox(
+            current_app.config["OUTBOX_BATCH_SIZE"],
+            current_app.config["OUTBOX_MAX_ATTEMPTS"],
+            current_app.config["OUTBOX_RETRY_DELAY"])
+        if batch_count == 0:
+            return processed_count
+        processed_count += batch_count
+
+
+class OutboxWorker:
+    """Background thread which drains the outbox when notified of new entries, and every poll_interval seconds to
+    retry failed entries. The thread is started on the first notification, including in forked child processes."""
+
+    def __init__(self, app, poll_interval):
+        self.app = app
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+                    self._thread.start()
+
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=self.poll_interval)
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    drain_due_outbox_entries()
+                except Exception:
+                    self.app.logger.exception("Could not drain the outbox.")
+
+    def reset(self):
+        # the lock may have been held by another thread of the parent process at the time of the fork
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+
+# workers of all apps, so that they can be reset in forked child processes
+_workers = weakref.WeakSet()
+
+
+def _reset_workers():
+    for worker in list(_workers):
+        worker.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_workers)
+
+
+def notify_outbox():
+    """Let the background worker drain the outbox, after new entries were committed."""
+    worker = current_app.extensions["outbox_worker"]
+    if worker is not None:
+        worker.notify()
+
+
+@click.command("drain-outbox")
+@with_appcontext
+def drain_outbox_command():
+    """Drain the due outbox entries."""
+    processed_count = drain_due_outbox_entries()
+    db = get_db()
+    pending_count = db.execute("SELECT COUNT() FROM outbox WHERE attempts < ?",
+                               (current_app.config["OUTBOX_MAX_ATTEMPTS"],)).fetchone()["COUNT()"]
+    failed_count = db.execute("SELECT COUNT() FROM outbox WHERE attempts >= ?",
+                              (current_app.config["OUTBOX_MAX_ATTEMPTS"],)).fetchone()["COUNT()"]
+    click.echo(f"Processed {processed_count} outbox entries, {pending_count} are pending a retry "
+               f"and {failed_count} failed too many times.")
+
+
+def init_app(app):
+    """Register the outbox worker and command with the Flask app.
+    This is called by the application factory."""
+    worker = None
+    if app.config["OUTBOX_WORKER"]:
+        worker = OutboxWorker(app, app.config["OUTBOX_POLL_INTERVAL"])
+        _workers.add(worker)
+    app.extensions["outbox_worker"] = worker
+    app.cli.add_command(drain_outbox_command)
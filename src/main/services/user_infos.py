@@ -1,7 +1,33 @@
+import tempfile
+
+from flask import current_app
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
 from src.main import ValidationError
-from src.main.data_sources.db import get_db
+from src.main.data_sources.db import get_db, QUERY_PARAMS_CHUNK_SIZE
 from src.main.data_sources.buckets.images import get_image_bucket
-from src.main.exceptions import NoSuchInstanceError
+from src.main.exceptions import NoSuchInstanceError, PreconditionFailedError
+from src.main.helpers import json_utils
+from src.main.helpers.executor_utils import get_executor
+from src.main.helpers.image_utils import IMAGE_VARIANT_FORMATS, load_image, resize_image, encode_image
+from src.main.helpers.list_utils import chunks
+from src.main.helpers.storage_utils import upload_from_stream
+from src.main.services.outbox import IMAGE_BUCKET, add_blob_deletions, notify_outbox
+
+# the row version is left out of listed user infos, as it is only exposed as the entity tag of a single user info
+# (and the image generation is internal)
+USER_INFO_COLUMNS = "id, name, email, address, image_hosted_link, image_variant_links"
+
+SEARCHABLE_COLUMNS = ("name", "email", "address")
+
+# the (width, height, crop) of each variant of the user images, which are stored in each of the IMAGE_VARIANT_FORMATS
+IMAGE_VARIANT_SIZES = {
+    "thumbnail": (128, 128, True),
+    "medium": (512, 512, False),
+}
+
+# images up to this size are downloaded in memory to generate their variants, larger ones to a temporary file
+IMAGE_SPOOL_MAX_SIZE = 1024 * 1024
 
 
 def create_user_info(user_info_model):
@@ -23,10 +49,56 @@ def create_user_info(user_info_model):
         raise ValidationError(f"Email '{user_info_model.email}' is already registered.")
 
 
+def create_user_infos(user_info_models):
+    """Create all the user infos in a single transaction.
+    Returns, for each user info in order, either the created user info, or the ValidationError for its email being
+    already registered (by an existing user info, or by a previous user info in the batch)."""
+    db = get_db()
+    emails = [user_info_model.email for user_info_model in user_info_models]
+
+    # lock the database for writing from the start, so that no other request registers any of the emails meanwhile
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        registered_emails = set()
+        for emails_chunk in chunks(emails, QUERY_PARAMS_CHUNK_SIZE):
+            registered_emails.update(row["email"] for row in db.execute(
+                f"SELECT email FROM user_info WHERE email IN ({', '.join(['?'] * len(emails_chunk))})", emails_chunk))
+
+        results = []
+        new_user_info_models = []
+        for user_info_model in user_info_models:
+            if user_info_model.email in registered_emails:
+                results.append(ValidationError(f"Email '{user_info_model.email}' is already registered."))
+            else:
+                registered_emails.add(user_info_model.email)
+                new_user_info_models.append(user_info_model)
+                results.append(None)
+
+        db.executemany(
+            "INSERT INTO user_info (name, email, address) VALUES (?, ?, ?)",
+            [(user_info_model.name, user_info_model.email, user_info_model.address)
+             for user_info_model in new_user_info_models]
+        )
+
+        new_emails = [user_info_model.email for user_info_model in new_user_info_models]
+        user_infos_by_email = {}
+        for emails_chunk in chunks(new_emails, QUERY_PARAMS_CHUNK_SIZE):
+            user_infos_by_email.update((row["email"], row) for row in db.execute(
+                f"SELECT {USER_INFO_COLUMNS}, version FROM user_info "
+                f"WHERE email IN ({', '.join(['?'] * len(emails_chunk))})", emails_chunk))
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return [result if result is not None else user_infos_by_email[email] for result, email in zip(results, emails)]
+
+
 def get_user_info(user_id):
     db = get_db()
     user_info = db.execute(
-        "SELECT * FROM user_info WHERE id = ?", (user_id,)
+        f"SELECT {USER_INFO_COLUMNS}, version FROM user_info WHERE id = ?", (user_id,)
     ).fetchone()
 
     if user_info is None:
@@ -35,25 +107,84 @@ def get_user_info(user_id):
     return user_info
 
 
-def get_user_infos(search):
+def build_user_infos_query(search, after_id=None, limit=None):
+    """Build the query selecting the user infos which match all the search terms, along with its bound parameters.
+    The columns are always matched in the same order, so that the same query (and prepared statement) is reused for
+    a given combination of search terms. Each searchable column is indexed (see schema.sql).
+
+    If given, only the first limit user infos with an id greater than after_id are selected, in order of id. As the
+    indexes also sort their entries by id, the page is found with a seek at any depth (keyset pagination)."""
+    conjunction_condition_terms = []
+    params = []
+    for column in SEARCHABLE_COLUMNS:
+        if column in search:
+            conjunction_condition_terms.append(f"{column} = ?")
+            params.append(search[column])
+
+    if after_id is not None:
+        conjunction_condition_terms.append("id > ?")
+        params.append(after_id)
+
+    where_clause = " WHERE " + " AND ".join(conjunction_condition_terms) if len(conjunction_condition_terms) > 0 else ""
+    query = f"SELECT {USER_INFO_COLUMNS} FROM user_info{where_clause} ORDER BY id"
+
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    return query, params
+
+
+def select_user_infos(search, after_id=None, limit=None):
     db = get_db()
+    return db.execute(*build_user_infos_query(search, after_id, limit))
+
+
+def get_user_infos(search):
+    return select_user_infos(search).fetchall()
+
+
+def get_user_infos_page(search, limit, after_id=None):
+    """Get a page of at most limit user infos matching the search, with an id greater than after_id (if given).
+    Returns the user infos and the id to get the next page after, or None if this is the last page."""
+    user_infos = select_user_infos(search, after_id, limit + 1).fetchall()  # one more to know if there is a next page
+
+    if len(user_infos) > limit:
+        user_infos = user_infos[:limit]
+        return user_infos, user_infos[-1]["id"]
+
+    return user_infos, None
 
-    conjunction_condition_terms = [f"{k} = '{v}'" for k, v in search.items()]
-    where_clause = "WHERE " + " AND ".join(conjunction_condition_terms)
-    return db.execute(f"SELECT * FROM user_info{' ' + where_clause if len(conjunction_condition_terms) > 0 else ''}").fetchall()
 
+def iter_user_infos(search, batch_size=500):
+    """Lazily get the user infos matching the search, fetching the rows from the database in batches."""
+    cursor = select_user_infos(search)
+    rows = cursor.fetchmany(batch_size)
+    while len(rows) > 0:
+        yield from rows
+        rows = cursor.fetchmany(batch_size)
 
-def update_user_info(user_id, user_info_model):
+
+def update_user_info(user_id, user_info_model, if_version_in=None):
+    """Update the user info, only if its current version is one of if_version_in, if given."""
     db = get_db()
+
+    params = [user_info_model.name, user_info_model.address, user_info_model.email, user_id]
+    version_condition = ""
+    if if_version_in is not None:
+        version_condition = f" AND version IN ({', '.join(['?'] * len(if_version_in))})"
+        params.extend(if_version_in)
+
     try:
         cursor = db.execute(
-            "UPDATE user_info SET name = ?, address = ?, email = ? WHERE id = ?",
-            (user_info_model.name, user_info_model.address, user_info_model.email, user_id)
+            "UPDATE user_info SET name = ?, address = ?, email = ?, version = version + 1 WHERE id = ?" + version_condition,
+            params
         )
         db.commit()
 
         if cursor.rowcount == 0:
-            raise NoSuchInstanceError(f"No user info exists with id '{user_id}'.")
+            get_user_info(user_id)  # raises if it does not exist
+            raise PreconditionFailedError(f"User info with id '{user_id}' was modified.")
 
         return get_user_info(user_id)
     except db.IntegrityError:
@@ -62,37 +193,140 @@ def update_user_info(user_id, user_info_model):
 
 def delete_user_info(user_id):
     db = get_db()
-    db.execute("DELETE FROM user_info WHERE id = ?", (user_id,))
-    db.commit()
-
-    image_bucket = get_image_bucket()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        user_info = db.execute("SELECT image_generation FROM user_info WHERE id = ?", (user_id,)).fetchone()
+        db.execute("DELETE FROM user_info WHERE id = ?", (user_id,))
+        if user_info is not None and user_info["image_generation"] is not None:
+            add_blob_deletions(db, IMAGE_BUCKET, build_image_blob_names(user_id, user_info["image_generation"]))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
-    image_bucket.delete_blobs(build_image_blob_name(user_id), on_error=lambda *args: None)  # suppress if does not exist
+    notify_outbox()
 
 
 def build_image_blob_name(user_id):
     return f"user_{str(user_id)}-image"  # filename omitted, as it won't be known at retrieval time, and does not matter
 
 
+def build_image_variant_blob_name(user_id, image_generation, variant, extension):
+    # variants are specific to a generation of the image, so that those of a replaced image can be deleted in the
+    # background without risking to delete those of the new image
+    return f"{build_image_blob_name(user_id)}-{image_generation}-{variant}.{extension}"
+
+
+def build_image_variant_blob_names(user_id, image_generation):
+    return [build_image_variant_blob_name(user_id, image_generation, variant, extension)
+            for variant in IMAGE_VARIANT_SIZES for extension in IMAGE_VARIANT_FORMATS]
+
+
+def build_image_blob_names(user_id, image_generation):
+    """Get the names of the blobs of the image of the user and of all the variants of the given generation."""
+    return [build_image_blob_name(user_id)] + build_image_variant_blob_names(user_id, image_generation)
+
+
 def upload_user_image(user_id, image_file):
     get_user_info(user_id)  # assert that the basic user info has been created first
 
     image_bucket = get_image_bucket()
 
-    image_blob_name = build_image_blob_name(user_id)
+    # replaces the existing image in place, if any
+    # large images are spooled to a temporary file by werkzeug, and streamed from it to the bucket in chunks
+    image_blob = upload_from_stream(
+        image_bucket, build_image_blob_name(user_id), image_file.stream, image_file.mimetype,
+        current_app.config["IMAGE_UPLOAD_CHUNK_SIZE"], current_app.config["IMAGE_RESUMABLE_UPLOAD_THRESHOLD"])
 
-    # replace existing image, if any
-    image_bucket.delete_blobs((image_blob_name,), on_error=lambda *args: None)  # suppress if does not exist
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    is_latest_image = False
+    try:
+        user_info = db.execute("SELECT image_generation FROM user_info WHERE id = ?", (user_id,)).fetchone()
+        if user_info is None:
+            # the user info was deleted during the upload, along with the image it had then
+            add_blob_deletions(db, IMAGE_BUCKET, (build_image_blob_name(user_id),))
+        else:
+            # the variants of the previous image are outdated, until the ones of the new image are generated, unless a
+            # newer image was uploaded concurrently and saved first
+            cursor = db.execute(
+                "UPDATE user_info SET image_hosted_link = ?, image_generation = ?, image_variant_links = NULL, "
+                "version = version + 1 WHERE id = ? AND (image_generation IS NULL OR image_generation < ?)",
+                (image_blob.media_link, image_blob.generation, user_id, image_blob.generation)
+            )
+            is_latest_image = cursor.rowcount > 0
+            if not is_latest_image:
+                # this image was already replaced, so its variants are not generated (should any be, they are deleted)
+                add_blob_deletions(db, IMAGE_BUCKET, build_image_variant_blob_names(user_id, image_blob.generation))
+            elif user_info["image_generation"] is not None:
+                add_blob_deletions(
+                    db, IMAGE_BUCKET, build_image_variant_blob_names(user_id, user_info["image_generation"]))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
-    image_blob = image_bucket.blob(image_blob_name)
+    notify_outbox()
+
+    if user_info is None:
+        raise NoSuchInstanceError(f"No user info exists with id '{user_id}'.")
+
+    if is_latest_image:
+        # resizing is left to the background, so the upload request does not wait on it
+        get_executor("images", current_app.config["IMAGE_WORKERS"]).submit(
+            run_image_variants_job, current_app._get_current_object(), user_id, image_blob.generation)
+
+    return get_user_info(user_id)
+
+
+def get_image_draft_size():
+    """Get the smallest size images can be decoded at to generate all their variants."""
+    return (max(width for width, _, _ in IMAGE_VARIANT_SIZES.values()),
+            max(height for _, height, _ in IMAGE_VARIANT_SIZES.values()))
 
-    image_blob.upload_from_string(image_file.read(), image_file.mimetype)
+
+def generate_image_variants(user_id, image_generation):
+    """Generate and store the variants of the image of the user, at the given generation of its blob, and save their
+    links in the user info, unless the image was replaced (or the user info deleted) meanwhile, in which case the
+    variants are deleted in the background."""
+    image_bucket = get_image_bucket()
+
+    with tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_MAX_SIZE) as image_file:
+        try:
+            image_bucket.blob(build_image_blob_name(user_id)).download_to_file(
+                image_file, if_generation_match=image_generation)
+        except (NotFound, PreconditionFailed):
+            return
+
+        image_file.seek(0)
+        image = load_image(image_file, current_app.config["IMAGE_MAX_PIXELS"], get_image_draft_size())
+
+    image_variant_links = {}
+    for variant, (width, height, crop) in IMAGE_VARIANT_SIZES.items():
+        resized_image = resize_image(image, width, height, crop)
+        image_variant_links[variant] = {}
+        for extension in IMAGE_VARIANT_FORMATS:
+            data, mimetype = encode_image(resized_image, extension)
+            variant_blob = image_bucket.blob(build_image_variant_blob_name(user_id, image_generation, variant, extension))
+            variant_blob.upload_from_string(data, content_type=mimetype)
+            image_variant_links[variant][extension] = variant_blob.media_link
 
     db = get_db()
-    db.execute(
-        "UPDATE user_info SET image_hosted_link = ? WHERE id = ?",
-        (image_blob.media_link, user_id)
+    cursor = db.execute(
+        "UPDATE user_info SET image_variant_links = ?, version = version + 1 WHERE id = ? AND image_generation = ?",
+        (json_utils.dumps(image_variant_links), user_id, image_generation)
     )
+    if cursor.rowcount == 0:
+        add_blob_deletions(db, IMAGE_BUCKET, build_image_variant_blob_names(user_id, image_generation))
     db.commit()
 
-    return get_user_info(user_id)
+    if cursor.rowcount == 0:
+        notify_outbox()
+
+
+def run_image_variants_job(app, user_id, image_generation):
+    with app.app_context():
+        try:
+            generate_image_variants(user_id, image_generation)
+        except Exception:
+            app.logger.exception(f"Could not generate the variants of the image of user {user_id}.")
@@ -3,4 +3,5 @@
 flask --app src.main init-db
 flask --app src.main configure-gcp-credentials
 flask --app src.main configure-buckets
+flask --app src.main rebuild-audio-catalog
 gunicorn --bind :$1 --workers 1 --threads 8 --timeout 0 'src.main:create_app()'
@@ -0,0 +1 @@
+"""In-process micro-benchmarks of the request hot paths, run with: python -m tests.benchmarks (see README)."""
@@ -0,0 +1,86 @@
+import logging
+import os
+import sys
+from contextlib import nullcontext
+
+import click
+
+from tests.benchmarks.harness import run_benchmark, load_baseline, save_baseline, compare_to_baseline
+from tests.benchmarks.suite import BenchmarkEnvironment, get_benchmarks
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def parse_row_counts(ctx, param, value):
+    try:
+        return [int(row_count) for row_count in value.split(",") if row_count]
+    except ValueError:
+        raise click.BadParameter("must be a comma-separated list of integers.")
+
+
+@click.command()
+@click.option("-k", "--filter", "name_filter", default="", help="Only run the benchmarks whose name contains this.")
+@click.option("--rows", "search_row_counts", default="10000,100000,1000000", callback=parse_row_counts,
+              help="Comma-separated numbers of user infos to run the search benchmarks against.")
+@click.option("--scale", default=1.0, help="Factor applied to the number of iterations of each benchmark.")
+@click.option("--baseline", "baseline_path", default=DEFAULT_BASELINE_PATH, show_default=True,
+              help="Baseline results file to compare the results to.")
+@click.option("--tolerance", default=0.2, show_default=True,
+              help="Relative increase of the median latency over the baseline reported as a regression.")
+@click.option("--save-baseline", "save_baseline_results", is_flag=True, help="Save the results as the new baseline.")
+def main(name_filter, search_row_counts, scale, baseline_path, tolerance, save_baseline_results):
+    """Run the benchmarks, reporting the ops/sec and latency percentiles of each, and comparing them to the baseline.
+    Exits with status 1 if any benchmark regressed."""
+    logging.disable(logging.WARNING)  # e.g. the errors logged by the app are not part of the report
+
+    baseline = None if save_baseline_results else load_baseline(baseline_path)
+    if baseline is None and not save_baseline_results:
+        click.echo(f"No baseline at '{baseline_path}', run with --save-baseline to create it.")
+
+    benchmarks = [benchmark for benchmark in get_benchmarks(search_row_counts) if name_filter in benchmark.name]
+
+    click.echo(f"{'benchmark':<52} {'ops/sec':>10} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10} {'vs baseline':>12}")
+    results = []
+    regressions = []
+    environment = None
+    try:
+        for benchmark in benchmarks:
+            # only one environment is alive at a time, as each patches the buckets of the services
+            if environment is None or (environment.row_count, environment.with_audios) != \
+                    (benchmark.row_count, benchmark.with_audios):
+                if environment is not None:
+                    environment.close()
+                environment = BenchmarkEnvironment(benchmark.row_count, benchmark.with_audios)
+
+            iterations = max(1, round(benchmark.iterations * scale))
+            warmup = max(1, iterations // 10)
+            with environment.app.app_context() if benchmark.in_app_context else nullcontext():
+                op = benchmark.make_op(environment, warmup + iterations)
+                result = run_benchmark(benchmark.name, op, iterations, warmup)
+            results.append(result)
+
+            comparison = ""
+            if baseline is not None and result.name in baseline:
+                change, is_regression = compare_to_baseline(result, baseline[result.name], tolerance)
+                comparison = f"{change:+.1%}" + (" !" if is_regression else "")
+                if is_regression:
+                    regressions.append(result.name)
+
+            click.echo(f"{result.name:<52} {result.ops_per_sec:>10.0f} {result.p50_us:>10.1f} {result.p95_us:>10.1f} "
+                       f"{result.p99_us:>10.1f} {comparison:>12}")
+    finally:
+        if environment is not None:
+            environment.close()
+        logging.disable(logging.NOTSET)
+
+    if save_baseline_results:
+        save_baseline(baseline_path, results)
+        click.echo(f"Saved the results as the baseline at '{baseline_path}'.")
+
+    if len(regressions) > 0:
+        click.echo(f"{len(regressions)} benchmarks regressed by more than {tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
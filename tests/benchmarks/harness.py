@@ -0,0 +1,69 @@
+"""Times benchmark operations, and compares their results to a stored baseline."""
+
+import gc
+import json
+import time
+from dataclasses import dataclass, asdict
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    ops_per_sec: float
+    p50_us: float
+    p95_us: float
+    p99_us: float
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of the sorted values."""
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(name, durations_ns):
+    """Summarize the durations of the iterations of a benchmark, in nanoseconds."""
+    sorted_durations_us = sorted(duration / 1000 for duration in durations_ns)
+    total_s = sum(durations_ns) / 1e9
+    p50_us, p95_us, p99_us = (percentile(sorted_durations_us, percent) for percent in PERCENTILES)
+    return BenchmarkResult(name, len(durations_ns), len(durations_ns) / total_s, p50_us, p95_us, p99_us)
+
+
+def run_benchmark(name, op, iterations, warmup):
+    """Call op(i) for each iteration i (after warmup calls, which are not timed), timing each call."""
+    for i in range(warmup):
+        op(i)
+
+    durations_ns = []
+    gc.collect()  # so that collections of the garbage of the setup or of the previous benchmark are not timed
+    for i in range(warmup, warmup + iterations):
+        start = time.perf_counter_ns()
+        op(i)
+        durations_ns.append(time.perf_counter_ns() - start)
+
+    return summarize(name, durations_ns)
+
+
+def load_baseline(path):
+    """Load the results of the baseline by benchmark name, or None if there is no baseline file."""
+    try:
+        with open(path) as baseline_file:
+            return {result["name"]: BenchmarkResult(**result) for result in json.load(baseline_file)}
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    with open(path, "w") as baseline_file:
+        json.dump([asdict(result) for result in results], baseline_file, indent=2)
+        baseline_file.write("\n")
+
+
+def compare_to_baseline(result, baseline_result, tolerance):
+    """Compare the median latency of the result to that of the baseline result.
+    Returns the relative change, and whether it is a regression (slower by more than the tolerance)."""
+    change = result.p50_us / baseline_result.p50_us - 1
+    return change, change > tolerance
@@ -0,0 +1,263 @@
+"""Benchmarks of the request hot paths, run in process through the test client of an app backed by a temporary
+database and in-memory buckets, so that they measure the cost of the application code rather than of storage.
+
+The search benchmarks run against a database seeded with each of the given numbers of user infos. The other benchmarks
+share an app seeded with ENDPOINTS_ROW_COUNT user infos and audios."""
+
+import io
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Callable
+from unittest import mock
+
+from PIL import Image
+
+from src.main import create_app
+from src.main.data_sources.db import get_db, init_db
+from src.main.helpers import json_utils
+from src.main.helpers.audio_encoding_utils import encode_audio, decode_audio
+from src.main.helpers.audio_matrix_utils import ticks_to_bytes
+from src.main.parse_request import validate_and_get_audio_model, validate_and_get_user_info_model
+from src.main.services import user_infos as user_info_service
+from src.main.services.audios import build_audio_blob_name
+from tests.helpers.fake_executor import RecordingExecutor
+from tests.helpers.fake_storage import FakeBucket
+
+ENDPOINTS_ROW_COUNT = 1000
+SEARCH_MATCH_COUNT = 10  # number of user infos matching each name or address, whatever the number of rows
+SEED_BATCH_SIZE = 10000
+
+TICKS = [-96.33, -96.33, -93.47, -89.04, -84.61, -80.18, -75.75, -71.32, -66.89, -62.46, -58.03, -53.6, -49.17,
+         -44.74, -40.31]
+
+
+def make_audio(session_id, step_count=1):
+    return {"session_id": session_id, "ticks": TICKS, "selected_tick": 5, "step_count": step_count}
+
+
+def make_user_info(user_id, distinct_count):
+    return {
+        "name": f"User {user_id % distinct_count}",
+        "email": f"user{user_id}@example.com",
+        "address": f"{user_id % distinct_count} Main Road",
+    }
+
+
+def make_png(width, height):
+    data = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 0, 0)).save(data, "PNG")
+    return data.getvalue()
+
+
+class BenchmarkEnvironment:
+    """App backed by a temporary database seeded with row_count user infos (and audios, if with_audios is True), and
+    by in-memory buckets. Background image jobs are recorded but never run."""
+
+    def __init__(self, row_count, with_audios):
+        self.row_count = row_count
+        self.with_audios = with_audios
+        self._directory = tempfile.mkdtemp(prefix="benchmarks-")
+        self._exit_stack = ExitStack()
+
+        self.app = create_app({
+            "TESTING": True,
+            "DATABASE": os.path.join(self._directory, "db.sqlite"),
+            "OUTBOX_WORKER": False,
+            "AUDIO_BUCKET": "audios",
+            "IMAGE_BUCKET": "images",
+        })
+        self.client = self.app.test_client()
+
+        self.audio_bucket = FakeBucket("audios")
+        self.image_bucket = FakeBucket("images")
+        self.image_executor = RecordingExecutor()
+        for target, value in (("src.main.services.audios.get_audio_bucket", lambda: self.audio_bucket),
+                              ("src.main.services.user_infos.get_image_bucket", lambda: self.image_bucket),
+                              ("src.main.services.outbox.get_image_bucket", lambda: self.image_bucket),
+                              ("src.main.services.user_infos.get_executor",
+                               lambda name, max_workers: self.image_executor)):
+            self._exit_stack.enter_context(mock.patch(target, value))
+
+        with self.app.app_context():
+            init_db()
+            self.seed_user_infos()
+            if with_audios:
+                self.seed_audios()
+
+    def seed_user_infos(self):
+        db = get_db()
+        distinct_count = max(1, self.row_count // SEARCH_MATCH_COUNT)
+        for start in range(1, self.row_count + 1, SEED_BATCH_SIZE):
+            db.executemany(
+                "INSERT INTO user_info (id, name, email, address) VALUES (?, ?, ?, ?)",
+                [(user_id, *make_user_info(user_id, distinct_count).values())
+                 for user_id in range(start, min(start + SEED_BATCH_SIZE, self.row_count + 1))])
+        db.commit()
+
+    def seed_audios(self):
+        rows = []
+        for session_id in range(1, self.row_count + 1):
+            self.audio_bucket.blob(build_audio_blob_name(session_id)).upload_from_string(
+                encode_audio(make_audio(session_id)))
+            rows.append((session_id, ticks_to_bytes(TICKS), 5, 1))
+
+        db = get_db()
+        db.executemany("INSERT INTO audio (session_id, ticks, selected_tick, step_count) VALUES (?, ?, ?, ?)", rows)
+        db.commit()
+
+    def close(self):
+        self._exit_stack.close()
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+
+@dataclass
+class Benchmark:
+    name: str
+    # called with the environment and the number of calls of the op (warmup included), returns the op, which is called
+    # with the index of the call
+    make_op: Callable
+    iterations: int
+    in_app_context: bool = False
+    row_count: int = ENDPOINTS_ROW_COUNT
+    with_audios: bool = True
+
+
+def get_benchmarks(search_row_counts):
+    """Get the benchmarks, with the search benchmarks for each of the search_row_counts."""
+    benchmarks = [
+        Benchmark("validate_and_get_audio_model", make_static_op(validate_audio), 5000),
+        Benchmark("validate_and_get_user_info_model", make_static_op(validate_user_info), 5000),
+        Benchmark("json dumps page of 100 user infos", make_dumps_user_infos_op, 1000, in_app_context=True),
+        Benchmark("json dumps page of 100 audios", make_static_op(dumps_audios), 1000),
+        Benchmark("encode_audio", make_static_op(lambda i: encode_audio(AUDIO)), 10000),
+        Benchmark("decode_audio", make_static_op(lambda i: decode_audio(ENCODED_AUDIO)), 10000),
+
+        Benchmark("POST /accounts/", make_create_user_info_op, 500),
+        Benchmark("POST /accounts:batch (100 user infos)", make_create_user_infos_op, 50),
+        Benchmark("GET /accounts/<id>", make_get_op("/accounts/{id}"), 1000),
+        Benchmark("GET /accounts/?name=", make_get_op("/accounts/?name=User 7"), 1000),
+        Benchmark("GET /accounts/?limit=100", make_get_op("/accounts/?limit=100"), 500),
+        Benchmark("PUT /accounts/<id>", make_update_user_info_op, 500),
+        Benchmark("DELETE /accounts/<id>", make_delete_user_info_op, 500),
+        Benchmark("POST /accounts/<id>/upload-image", make_upload_image_op, 200),
+
+        Benchmark("POST /audios/", make_create_audio_op, 500),
+        Benchmark("POST /audios:batch (100 audios)", make_create_audios_op, 50),
+        Benchmark("GET /audios/<session_id>", make_get_op("/audios/{id}"), 1000),
+        Benchmark("GET /audios/?page_size=100", make_get_op("/audios/?page_size=100"), 200),
+        Benchmark("GET /audios/stats", make_get_op("/audios/stats"), 1000),
+        Benchmark("PUT /audios/<session_id>", make_update_audio_op, 500),
+        Benchmark("DELETE /audios/<session_id>", make_delete_audio_op, 500),
+    ]
+
+    for row_count in search_row_counts:
+        benchmarks.extend(
+            Benchmark(f"{name} [{row_count} rows]", make_op, 2000, in_app_context=True, row_count=row_count,
+                      with_audios=False)
+            for name, make_op in (
+                ("get_user_infos by email", make_search_op("email")),
+                ("get_user_infos by name", make_search_op("name")),
+                ("get_user_infos by name and address", make_search_op("name", "address")),
+                ("get_user_infos_page of the last 100", make_last_page_op),
+            ))
+
+    return benchmarks
+
+
+def make_static_op(op):
+    return lambda env, call_count: op
+
+
+def make_get_op(path):
+    """Make the op getting the path, where {id} is replaced by the id of one of the seeded resources."""
+    return lambda env, call_count: lambda i: env.client.get(path.format(id=i % env.row_count + 1))
+
+
+AUDIO = make_audio(3448)
+ENCODED_AUDIO = encode_audio(AUDIO)
+
+
+def validate_audio(i):
+    validate_and_get_audio_model(dict(AUDIO))
+
+
+def validate_user_info(i):
+    validate_and_get_user_info_model(make_user_info(i, 100))
+
+
+def dumps_audios(i):
+    json_utils.dumps([AUDIO] * 100)
+
+
+def make_dumps_user_infos_op(env, call_count):
+    user_infos = user_info_service.get_user_infos_page({}, 100)[0]
+    return lambda i: json_utils.dumps(user_infos)
+
+
+# ids of the resources created by the benchmarks start after the seeded ones, and are unique across benchmarks
+def new_id(env, i, offset):
+    return env.row_count + offset * 1_000_000 + i + 1
+
+
+def make_create_user_info_op(env, call_count):
+    return lambda i: env.client.post("/accounts/", json=make_user_info(new_id(env, i, 1), 100))
+
+
+def make_create_user_infos_op(env, call_count):
+    return lambda i: env.client.post(
+        "/accounts:batch", json=[make_user_info(new_id(env, i * 100 + j, 2), 100) for j in range(100)])
+
+
+def make_update_user_info_op(env, call_count):
+    return lambda i: env.client.put(
+        f"/accounts/{i % env.row_count + 1}", json=make_user_info(i % env.row_count + 1, 10))
+
+
+def make_delete_user_info_op(env, call_count):
+    created_ids = [env.client.post("/accounts/", json=make_user_info(new_id(env, i, 3), 100)).json["id"]
+                   for i in range(call_count)]
+    return lambda i: env.client.delete(f"/accounts/{created_ids[i]}")
+
+
+def make_upload_image_op(env, call_count):
+    image = make_png(640, 480)
+    return lambda i: env.client.post(
+        f"/accounts/{i % env.row_count + 1}/upload-image",
+        data={"image": (io.BytesIO(image), "image.png")}, content_type="multipart/form-data")
+
+
+def make_create_audio_op(env, call_count):
+    return lambda i: env.client.post("/audios/", json=make_audio(new_id(env, i, 1)))
+
+
+def make_create_audios_op(env, call_count):
+    return lambda i: env.client.post(
+        "/audios:batch", json=[make_audio(new_id(env, i * 100 + j, 2)) for j in range(100)])
+
+
+def make_update_audio_op(env, call_count):
+    return lambda i: env.client.put(
+        f"/audios/{i % env.row_count + 1}", json=make_audio(i % env.row_count + 1, step_count=i % 10))
+
+
+def make_delete_audio_op(env, call_count):
+    created_session_ids = [new_id(env, i, 3) for i in range(call_count)]
+    for session_id in created_session_ids:
+        env.client.post("/audios/", json=make_audio(session_id))
+    return lambda i: env.client.delete(f"/audios/{created_session_ids[i]}")
+
+
+def make_search_op(*columns):
+    def make_op(env, call_count):
+        distinct_count = max(1, env.row_count // SEARCH_MATCH_COUNT)
+        return lambda i: user_info_service.get_user_infos({
+            column: value for column, value in make_user_info(i % env.row_count + 1, distinct_count).items()
+            if column in columns})
+    return make_op
+
+
+def make_last_page_op(env, call_count):
+    return lambda i: user_info_service.get_user_infos_page({}, 100, env.row_count - 100)
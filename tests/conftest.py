@@ -17,6 +17,7 @@ def app():
     app = create_app({
         "TESTING": True,
         "DATABASE": db_path,
+        "OUTBOX_WORKER": False,  # tests drain the outbox explicitly
     })
 
     with app.app_context():
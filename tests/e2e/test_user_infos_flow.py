@@ -9,6 +9,7 @@ pytestmark = [pytest.mark.uses_server]
 def with_null_image_hosted_link(user_info):
     d = dict(user_info)
     d["image_hosted_link"] = None
+    d["image_variant_links"] = None
     return d
 
 
@@ -0,0 +1,19 @@
+"""Stand-in for the thread pools of the executor registry, to control when background tasks run."""
+
+from concurrent.futures import Future
+
+
+class RecordingExecutor:
+    """Records the submitted tasks without running them, until run_all is called."""
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.tasks.append((future, fn, args, kwargs))
+        return future
+
+    def run_all(self):
+        tasks, self.tasks = self.tasks, []
+        for future, fn, args, kwargs in tasks:
+            future.set_result(fn(*args, **kwargs))
@@ -0,0 +1,106 @@
+"""In-memory stand-in for the subset of the GCP Storage bucket and blob API used by the services."""
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.generation = None
+        self.content_type = None
+        self.read_sizes = []  # the size of each read of the file of upload_from_file
+
+    @property
+    def media_link(self):
+        return f"https://storage.example.com/{self.bucket.name}/{self.name}"
+
+    def upload_from_string(self, data, content_type="text/plain", if_generation_match=None):
+        self.bucket.calls += 1
+        existing = self.bucket.blobs.get(self.name)
+        if if_generation_match is not None \
+                and if_generation_match != (existing.generation if existing is not None else 0):
+            raise PreconditionFailed(f"Precondition failed for blob '{self.name}'.")
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket.generation += 1
+        self.generation = self.bucket.generation
+        self.content_type = content_type
+        self.bucket.blobs[self.name] = self
+        self.bucket.contents[self.name] = data
+
+    def upload_from_file(self, file_obj, size=None, content_type=None, if_generation_match=None):
+        # like the real blob, the file is read chunk by chunk in a resumable upload if the chunk size is set
+        if self.chunk_size is None:
+            chunks = [file_obj.read(size) if size is not None else file_obj.read()]
+        else:
+            chunks = list(iter(lambda: file_obj.read(self.chunk_size), b""))
+        self.read_sizes.extend(len(chunk) for chunk in chunks)
+        self.upload_from_string(b"".join(chunks), content_type=content_type, if_generation_match=if_generation_match)
+
+    def download_as_bytes(self):
+        self.bucket.calls += 1
+        if self.name not in self.bucket.contents:
+            raise NotFound(f"No such blob '{self.name}'.")
+        return self.bucket.contents[self.name]
+
+    def download_to_file(self, file_obj, if_generation_match=None):
+        existing = self.bucket.blobs.get(self.name)
+        if existing is None:
+            raise NotFound(f"No such blob '{self.name}'.")
+        if if_generation_match is not None and if_generation_match != existing.generation:
+            raise PreconditionFailed(f"Precondition failed for blob '{self.name}'.")
+        file_obj.write(self.download_as_bytes())
+
+    def download_as_text(self):
+        return self.download_as_bytes().decode("utf-8")
+
+
+class FakeBlobIterator:
+    """Lists the blobs as a single page of at most max_results blobs, like a real iterator with max_results set."""
+    def __init__(self, blobs, max_results):
+        self._blobs = blobs[:max_results] if max_results is not None else blobs
+        self.next_page_token = None
+        if max_results is not None and len(blobs) > max_results:
+            self._next_page_token = self._blobs[-1].name
+        else:
+            self._next_page_token = None
+
+    @property
+    def pages(self):
+        self.next_page_token = self._next_page_token
+        yield iter(self._blobs)
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+
+class FakeBucket:
+    def __init__(self, name="bucket"):
+        self.name = name
+        self.blobs = {}
+        self.contents = {}
+        self.generation = 0
+        self.calls = 0
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size=chunk_size)
+
+    def get_blob(self, name):
+        self.calls += 1
+        return self.blobs.get(name)
+
+    def list_blobs(self, prefix="", max_results=None, page_token=None, **kwargs):
+        self.calls += 1
+        names = [name for name in sorted(self.blobs) if name.startswith(prefix or "")]
+        if page_token is not None:
+            names = [name for name in names if name > page_token]
+        return FakeBlobIterator([self.blobs[name] for name in names], max_results)
+
+    def delete_blobs(self, names, on_error=None):
+        self.calls += 1
+        for name in names:
+            self.blobs.pop(name, None)
+            self.contents.pop(name, None)
@@ -0,0 +1,7 @@
+import re
+
+
+def get_next_page_link(response):
+    """Get the URL of the next page from the 'Link' header of a paginated response, or None if it is the last page."""
+    match = re.match(r'^<(.+)>; rel="next"$', response.headers.get("Link", ""))
+    return match.group(1) if match else None
@@ -0,0 +1 @@
+"""HTTP load tests replaying the e2e flows as weighted scenarios, run with: python -m tests.loadtest (see README)."""
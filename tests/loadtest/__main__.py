@@ -0,0 +1,96 @@
+import click
+
+from tests.loadtest.runner import LoadTest
+from tests.loadtest.scenarios import SCENARIOS
+from tests.loadtest.server import LocalServer
+
+SATURATION_RATIO = 0.9  # a stage whose throughput is below this ratio of its offered rate is saturated
+
+
+def parse_weights(ctx, param, value):
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise click.BadParameter(f"unknown scenario '{name}', must be one of {', '.join(SCENARIOS)}.")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise click.BadParameter(f"the weight of '{name}' must be a number.")
+    return weights
+
+
+def parse_rates(ctx, param, value):
+    if value is None:
+        return [None]
+    try:
+        return [float(rate) for rate in value.split(",")]
+    except ValueError:
+        raise click.BadParameter("must be a comma-separated list of numbers.")
+
+
+def echo_stage_result(result):
+    rate = "closed loop" if result.rate is None else f"{result.rate:g} scenarios/sec offered"
+    click.echo(f"\nStage: {result.concurrency} threads, {rate}, {result.elapsed_s:.1f} s")
+    click.echo(f"  {len(result.stats.scenario_durations_ms)} scenarios ({result.scenarios_per_sec:.1f}/sec), "
+               f"{result.stats.request_count} requests ({result.requests_per_sec:.1f}/sec), "
+               f"error rate {result.error_rate:.2%}")
+    for failure, count in sorted(result.stats.scenario_failures.items()):
+        click.echo(f"  {count} failed scenarios: {failure}")
+
+    click.echo(f"  {'endpoint':<36} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, (p50, p95, p99) in result.endpoint_percentiles().items():
+        endpoint_stats = result.stats.endpoints[endpoint]
+        click.echo(f"  {endpoint:<36} {len(endpoint_stats.durations_ms):>9} {endpoint_stats.errors:>7} "
+                   f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+
+def is_saturated(result):
+    return result.rate is not None and result.scenarios_per_sec < SATURATION_RATIO * result.rate
+
+
+@click.command()
+@click.option("--server-url", help="URL of the server to load test. If not given, a local server is started with "
+                                   "gunicorn, a temporary database and local filesystem storage.")
+@click.option("--workers", default=1, show_default=True, help="Number of worker processes of the local server.")
+@click.option("--threads", default=8, show_default=True, help="Number of threads per worker of the local server.")
+@click.option("--scenarios", "weights", default="audios=1,user_infos=1,browse=2", show_default=True,
+              callback=parse_weights, help="Comma-separated scenarios to run, with their relative weight.")
+@click.option("--concurrency", default=16, show_default=True, help="Number of concurrent client threads.")
+@click.option("--rate", "rates", callback=parse_rates,
+              help="Comma-separated scenario arrival rates per second, run as successive stages (to find the rate at "
+                   "which the server saturates). If not given, threads run scenarios back to back.")
+@click.option("--duration", default=10.0, show_default=True, help="Duration of each stage, in seconds.")
+@click.option("--seed", type=int, help="Seed of the random choice of scenarios and arrival times.")
+def main(server_url, workers, threads, weights, concurrency, rates, duration, seed):
+    """Load test the server with the e2e flows, reporting the throughput, error rate and latency percentiles of each
+    endpoint, for each stage."""
+    local_server = None
+    if server_url is None:
+        local_server = LocalServer(workers, threads)
+        local_server.start()
+        server_url = local_server.url
+        click.echo(f"Started a local server with {workers} workers and {threads} threads at {server_url}.")
+
+    try:
+        load_test = LoadTest(server_url, [SCENARIOS[name] for name in weights], list(weights.values()), seed)
+        results = []
+        for rate in rates:
+            result = load_test.run_stage(concurrency, duration, rate)
+            echo_stage_result(result)
+            results.append(result)
+    finally:
+        if local_server is not None:
+            local_server.stop()
+
+    if len(results) > 1:
+        click.echo(f"\n{'offered/sec':>12} {'scenarios/sec':>14} {'requests/sec':>13} {'errors':>7} "
+                   f"{'p95 scenario ms':>16}")
+        for result in results:
+            click.echo(f"{result.rate:>12g} {result.scenarios_per_sec:>14.1f} {result.requests_per_sec:>13.1f} "
+                       f"{result.error_rate:>7.2%} {result.scenario_percentile(95):>16.1f}"
+                       + ("  saturated" if is_saturated(result) else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Drives the scenarios against a server from a pool of threads, each with its own HTTP session, and records the
+latency and outcome of every request by endpoint."""
+
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from requests import RequestException
+from requests_toolbelt import sessions
+
+from tests.benchmarks.harness import percentile
+from tests.loadtest.scenarios import next_id
+
+_id_segment = re.compile(r"/\d+(?=/|$)")
+
+
+def get_endpoint(method, url):
+    """The endpoint of the request, with ids replaced by a placeholder, e.g. 'GET /audios/<id>'."""
+    path = urlsplit(url).path.rstrip("/") or "/"
+    return f"{method.upper()} {_id_segment.sub('/<id>', path)}"
+
+
+@dataclass
+class EndpointStats:
+    durations_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+
+
+class LoadStats:
+    """Thread-safe record of the requests and scenario runs of a load test stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointStats] = defaultdict(EndpointStats)
+        self.scenario_durations_ms = []
+        self.scenario_failures = defaultdict(int)
+
+    def record_request(self, endpoint, duration_ms, is_error):
+        with self._lock:
+            endpoint_stats = self.endpoints[endpoint]
+            endpoint_stats.durations_ms.append(duration_ms)
+            endpoint_stats.errors += is_error
+
+    def record_scenario(self, duration_ms, failure=None):
+        with self._lock:
+            self.scenario_durations_ms.append(duration_ms)
+            if failure is not None:
+                self.scenario_failures[failure] += 1
+
+    @property
+    def request_count(self):
+        return sum(len(endpoint_stats.durations_ms) for endpoint_stats in self.endpoints.values())
+
+    @property
+    def error_count(self):
+        return sum(endpoint_stats.errors for endpoint_stats in self.endpoints.values())
+
+
+class RecordingSession(sessions.BaseUrlSession):
+    """Session recording the latency of each request, and whether it failed (server error or no response)."""
+
+    def __init__(self, base_url, stats):
+        super().__init__(base_url=base_url)
+        self.stats = stats
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = get_endpoint(method, url)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except RequestException:
+            self.stats.record_request(endpoint, (time.perf_counter() - start) * 1000, True)
+            raise
+        self.stats.record_request(endpoint, (time.perf_counter() - start) * 1000, response.status_code >= 500)
+        return response
+
+
+@dataclass
+class StageResult:
+    concurrency: int
+    rate: float  # offered scenario arrivals per second, None for a closed loop
+    elapsed_s: float
+    stats: LoadStats
+
+    @property
+    def scenarios_per_sec(self):
+        return len(self.stats.scenario_durations_ms) / self.elapsed_s
+
+    @property
+    def requests_per_sec(self):
+        return self.stats.request_count / self.elapsed_s
+
+    @property
+    def error_rate(self):
+        return self.stats.error_count / max(1, self.stats.request_count)
+
+    def scenario_percentile(self, percent):
+        """The percentile of the latency of the scenarios in milliseconds, queueing included."""
+        if len(self.stats.scenario_durations_ms) == 0:
+            return float("nan")
+        return percentile(sorted(self.stats.scenario_durations_ms), percent)
+
+    def endpoint_percentiles(self, percents=(50, 95, 99)):
+        """The latency percentiles in milliseconds of each endpoint."""
+        return {endpoint: [percentile(sorted(endpoint_stats.durations_ms), percent) for percent in percents]
+                for endpoint, endpoint_stats in sorted(self.stats.endpoints.items())}
+
+
+class LoadTest:
+    def __init__(self, server_url, scenarios, weights, seed=None):
+        self.server_url = server_url
+        self.scenarios = scenarios
+        self.weights = weights
+        self._random = random.Random(seed)
+        self._local = threading.local()
+
+    def _get_session(self, stats):
+        # sessions (and their connection pools) are not thread-safe, so each thread has its own
+        if getattr(self._local, "stats", None) is not stats:
+            self._local.session = RecordingSession(self.server_url, stats)
+            self._local.stats = stats
+        return self._local.session
+
+    def _run_scenario(self, stats, scenario, arrived_at):
+        """Run the scenario, recording its duration from its arrival, so that time spent queued for a free thread is
+        included in it once the server is saturated."""
+        failure = None
+        try:
+            scenario(self._get_session(stats), next_id)
+        except AssertionError:
+            failure = f"{scenario.__name__}: unexpected response"
+        except RequestException as e:
+            failure = f"{scenario.__name__}: {type(e).__name__}"
+        stats.record_scenario((time.perf_counter() - arrived_at) * 1000, failure)
+
+    def _choose_scenario(self):
+        return self._random.choices(self.scenarios, weights=self.weights)[0]
+
+    def run_stage(self, concurrency, duration_s, rate=None):
+        """Run scenarios for duration_s seconds on concurrency threads, then wait for the running ones to finish.
+
+        If rate is None, each thread runs scenarios back to back (closed loop). Otherwise scenarios arrive at random
+        (as a Poisson process) at rate per second whether or not earlier ones completed (open loop), and wait for a
+        free thread, which shows how latency grows as the offered load approaches the capacity of the server."""
+        stats = LoadStats()
+        start = time.perf_counter()
+        deadline = start + duration_s
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadtest") as executor:
+            if rate is None:
+                def run_until_deadline():
+                    while time.perf_counter() < deadline:
+                        self._run_scenario(stats, self._choose_scenario(), time.perf_counter())
+
+                for _ in range(concurrency):
+                    executor.submit(run_until_deadline)
+            else:
+                next_arrival = start
+                while True:
+                    next_arrival += self._random.expovariate(rate)
+                    if next_arrival >= deadline:
+                        break
+                    time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                    executor.submit(self._run_scenario, stats, self._choose_scenario(), next_arrival)
+
+        return StageResult(concurrency, rate, time.perf_counter() - start, stats)
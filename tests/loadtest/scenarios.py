@@ -0,0 +1,84 @@
+"""Scenarios replaying the e2e flows with the same requests and assertions, on resources unique to each run, so that
+any number of runs can proceed concurrently against a server which already holds data.
+
+A scenario is called with the HTTP session and a function returning a new unique id, and fails with an AssertionError
+if the server does not respond as in the e2e flows."""
+
+import itertools
+import time
+
+from tests.e2e.test_audios_flow import get_audio, get_audios, post_audio, update_audio, delete_audio
+from tests.e2e.test_user_infos_flow import get_user_info, get_user_infos, post_user_info, update_user_info, \
+    delete_user_info
+from tests.helpers.requests_assertion import assert_ok, assert_not_found, assert_data_has_id, \
+    assert_data_matches_resource, assert_data_matches_resource_ignore_id
+
+# unique across the runs of the scenarios, and across load tests against the same server (as long as they start at
+# least a second apart)
+_ids = itertools.count(int(time.time()) * 1000)
+
+
+def next_id():
+    return next(_ids)
+
+
+def make_audio(session_id, step_count=1):
+    return {"ticks": [-96.33, -96.33, -93.47, -89.04, -84.61, -80.18, -75.75, -71.32, -66.89, -62.46, -58.03, -53.6,
+                      -49.17, -44.74, -40.31],
+            "selected_tick": 5, "session_id": session_id, "step_count": step_count}
+
+
+def make_user_info(user_id):
+    return {"name": f"Load Test {user_id}", "email": f"load.test.{user_id}@dummy.com",
+            "address": f"{user_id} Load Test Road"}
+
+
+def audios_flow(s, next_id):
+    """Create, get, list, update and delete an audio."""
+    audio = make_audio(next_id())
+    session_id = audio["session_id"]
+
+    assert_ok(post_audio(s, audio))
+    assert_data_matches_resource(assert_ok(get_audio(s, session_id)), audio)
+    assert_ok(get_audios(s))
+
+    updated_audio = make_audio(session_id, step_count=2)
+    assert_ok(update_audio(s, session_id, updated_audio))
+    assert_data_matches_resource(assert_ok(get_audio(s, session_id)), updated_audio)
+
+    assert_ok(delete_audio(s, session_id))
+    assert_not_found(get_audio(s, session_id))
+
+
+def user_infos_flow(s, next_id):
+    """Create, get, search, update and delete an account."""
+    user_info = make_user_info(next_id())
+
+    res = assert_data_has_id(assert_ok(post_user_info(s, user_info)))
+    user_id = res.json()["id"]
+    assert_ok(get_user_info(s, user_id))
+    assert_ok(get_user_infos(s, {"name": user_info["name"]}))
+    assert_ok(get_user_infos(s, {"email": user_info["email"]}))
+
+    updated_user_info = dict(user_info, address=f"{user_id} Updated Road")
+    assert_ok(update_user_info(s, user_id, updated_user_info))
+    res = assert_ok(get_user_info(s, user_id))
+    assert_data_matches_resource_ignore_id(res, dict(updated_user_info, image_hosted_link=None,
+                                                     image_variant_links=None))
+
+    assert_ok(delete_user_info(s, user_id))
+    assert_not_found(get_user_info(s, user_id))
+
+
+def browse_flow(s, next_id):
+    """List the first pages of the resources, and get the audio stats."""
+    assert_ok(get_user_infos(s))
+    assert_ok(get_audios(s))
+    assert_ok(s.get("/audios/stats"))
+
+
+SCENARIOS = {
+    "audios": audios_flow,
+    "user_infos": user_infos_flow,
+    "browse": browse_flow,
+}
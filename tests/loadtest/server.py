@@ -0,0 +1,81 @@
+"""Local server to load test, run with gunicorn as in start.sh, against a temporary database and local filesystem
+storage (so that no GCP project is needed, and storage round trips stay small next to the cost of the server)."""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from src.main import create_app
+from src.main.data_sources.db import init_db
+
+STARTUP_TIMEOUT = 30  # in seconds
+
+
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    def __init__(self, workers, threads, port=None):
+        self.workers = workers
+        self.threads = threads
+        self.port = port or get_free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._directory = None
+        self._process = None
+
+    def start(self):
+        self._directory = tempfile.mkdtemp(prefix="loadtest-")
+        config = {
+            "DATABASE": os.path.join(self._directory, "db.sqlite"),
+            "STORAGE_BACKEND": "local",
+            "LOCAL_STORAGE_PATH": os.path.join(self._directory, "storage"),
+        }
+
+        with create_app(config).app_context():
+            init_db()
+
+        # gunicorn evaluates the literal arguments of the app factory call
+        self._process = subprocess.Popen([
+            sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{self.port}", "--workers", str(self.workers),
+            "--threads", str(self.threads), "--timeout", "0", "--log-level", "warning",
+            f"src.main:create_app({config!r})"])
+        self._wait_until_ready()
+
+    def _wait_until_ready(self):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"The server exited with status {self._process.returncode}.")
+            try:
+                requests.get(f"{self.url}/ping", timeout=1)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError(f"The server did not start within {STARTUP_TIMEOUT} seconds.")
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,298 @@
+import io
+import json
+
+import pytest as pytest
+from PIL import Image
+
+from src.main.services import user_infos as user_info_service
+from tests.helpers.fake_executor import RecordingExecutor
+from tests.helpers.fake_storage import FakeBucket
+from tests.helpers.pagination_utils import get_next_page_link
+
+
+def test_list_user_infos_json(client):
+    response = client.get("/accounts/")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert len(response.json) == 2
+
+
+def test_list_user_infos_ndjson(client):
+    response = client.get("/accounts/", headers={"Accept": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+    user_infos = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [user_info["email"] for user_info in user_infos] == ["test.user@dummy.com", "second.user@dummy.com"]
+
+
+def test_list_user_infos_ndjson_search(client):
+    response = client.get("/accounts/?name=Second User", headers={"Accept": "application/x-ndjson"})
+
+    user_infos = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [user_info["name"] for user_info in user_infos] == ["Second User"]
+
+
+def test_get_user_info_etag_is_row_version(client):
+    response = client.get("/accounts/1")
+
+    assert response.status_code == 200
+    assert response.get_etag() == ("1", False)
+    assert "version" not in response.json
+
+
+def test_get_user_info_not_modified(client):
+    response = client.get("/accounts/1", headers={"If-None-Match": '"1"'})
+
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+
+def test_update_user_info_if_match(client):
+    user_info = {"name": "New Name", "email": "test.user@dummy.com", "address": "1234 Main Road"}
+
+    response = client.put("/accounts/1", json=user_info, headers={"If-Match": '"1"'})
+
+    assert response.status_code == 200
+    assert response.get_etag() == ("2", False)
+    assert client.get("/accounts/1", headers={"If-None-Match": '"1"'}).status_code == 200
+
+
+def test_update_user_info_if_match_outdated(client):
+    user_info = {"name": "New Name", "email": "test.user@dummy.com", "address": "1234 Main Road"}
+    client.put("/accounts/1", json=user_info)
+
+    response = client.put("/accounts/1", json=dict(user_info, name="Newer Name"), headers={"If-Match": '"1"'})
+
+    assert response.status_code == 412
+    assert client.get("/accounts/1").json["name"] == "New Name"
+
+
+def test_update_user_info_if_match_nonexisting(client):
+    user_info = {"name": "New Name", "email": "new.user@dummy.com", "address": "1234 Main Road"}
+
+    response = client.put("/accounts/100", json=user_info, headers={"If-Match": '"1"'})
+
+    assert response.status_code == 404
+
+
+def test_list_user_infos_follows_next_page_links(client):
+    for i in range(3):
+        client.post("/accounts/", json={"name": "Foo Bar", "email": f"foo.bar{i}@dummy.com", "address": "1 Main Road"})
+
+    ids = []
+    url = "/accounts/?name=Foo Bar&limit=2"
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(response.json) <= 2
+        ids.extend(user_info["id"] for user_info in response.json)
+        url = get_next_page_link(response)
+
+    assert ids == [3, 4, 5]
+
+
+@pytest.mark.parametrize("query_string", ["limit=0", "limit=1001", "limit=abc", "after_id=-1", "after_id=abc"])
+def test_list_user_infos_invalid_pagination(client, query_string):
+    response = client.get(f"/accounts/?{query_string}")
+
+    assert response.status_code == 400
+
+
+def test_insert_user_infos_batch_json(client):
+    response = client.post("/accounts:batch", json=[
+        {"name": "Foo Bar", "email": "foo.bar@DUMMY.com", "address": "1 Main Road"},
+        {"name": "Foo Bar", "email": "no.domain", "address": "1 Main Road"},
+        {"name": "Foo Bar", "email": "test.user@dummy.com", "address": "1 Main Road"},
+        "not a user info",
+    ])
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json] == [201, 400, 400, 400]
+    assert response.json[0]["resource"] == {
+        "id": 3, "name": "Foo Bar", "email": "foo.bar@dummy.com", "address": "1 Main Road", "image_hosted_link": None,
+        "image_variant_links": None}
+    assert response.json[2]["problem"]["type"] == "validation-error"
+    assert client.get("/accounts/3").status_code == 200
+
+
+def test_insert_user_infos_batch_ndjson(client):
+    data = "\n".join(json.dumps({"name": f"User {i}", "email": f"user{i}@dummy.com", "address": "1 Main Road"})
+                     for i in range(3)) + "\n"
+
+    response = client.post("/accounts:batch", data=data, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    assert [result["resource"]["id"] for result in response.json] == [3, 4, 5]
+
+
+def test_insert_user_infos_batch_malformed_ndjson(client):
+    response = client.post("/accounts:batch", data='{"name": "Foo"}\n{', content_type="application/x-ndjson")
+
+    assert response.status_code == 400
+
+
+def test_insert_user_infos_batch_not_an_array(client):
+    response = client.post("/accounts:batch", json={"name": "Foo Bar"})
+
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def image_bucket(monkeypatch):
+    bucket = FakeBucket("images")
+    monkeypatch.setattr("src.main.services.user_infos.get_image_bucket", lambda: bucket)
+    monkeypatch.setattr("src.main.services.outbox.get_image_bucket", lambda: bucket)
+    return bucket
+
+
+@pytest.fixture
+def image_executor(monkeypatch):
+    executor = RecordingExecutor()
+    monkeypatch.setattr("src.main.services.user_infos.get_executor", lambda name, max_workers: executor)
+    return executor
+
+
+def make_png(width, height):
+    data = io.BytesIO()
+    Image.new("RGBA", (width, height), (255, 0, 0, 128)).save(data, "PNG")
+    return data.getvalue()
+
+
+def test_upload_user_image_is_streamed_in_chunks(app, client, image_bucket, image_executor):
+    app.config.update(IMAGE_UPLOAD_CHUNK_SIZE=256 * 1024, IMAGE_RESUMABLE_UPLOAD_THRESHOLD=512 * 1024)
+    image = make_png(16, 16) + b"x" * (600 * 1024)
+
+    response = client.post("/accounts/1/upload-image", data={"image": (io.BytesIO(image), "image.png", "image/png")},
+                           content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    image_blob = image_bucket.blobs["user_1-image"]
+    assert response.json["image_hosted_link"] == image_blob.media_link
+    assert image_blob.content_type == "image/png"
+    assert max(image_blob.read_sizes) == 256 * 1024
+    assert image_bucket.contents["user_1-image"] == image
+
+
+def test_upload_user_image_too_large(app, client, image_bucket):
+    app.config.update(MAX_CONTENT_LENGTH=1024)
+
+    response = client.post("/accounts/1/upload-image",
+                           data={"image": (io.BytesIO(b"x" * 2048), "image.png", "image/png")},
+                           content_type="multipart/form-data")
+
+    assert response.status_code == 413
+    assert response.json["code"] == 413
+    assert image_bucket.calls == 0
+
+
+@pytest.mark.parametrize("image", [b"\x89PNG" + b"x" * 100, make_png(200, 100)])
+def test_upload_user_image_not_decodable(app, client, image_bucket, image):
+    app.config.update(IMAGE_MAX_PIXELS=200 * 99)
+
+    response = client.post("/accounts/1/upload-image", data={"image": (io.BytesIO(image), "image.png", "image/png")},
+                           content_type="multipart/form-data")
+
+    assert response.status_code == 400
+    assert image_bucket.calls == 0
+
+
+def upload_image(client, image, user_id=1):
+    return client.post(f"/accounts/{user_id}/upload-image",
+                       data={"image": (io.BytesIO(image), "image.png", "image/png")},
+                       content_type="multipart/form-data")
+
+
+def test_upload_user_image_generates_variants_in_background(client, image_bucket, image_executor):
+    response = upload_image(client, make_png(1000, 600))
+
+    # the upload does not wait for the variants
+    assert response.status_code == 200
+    assert response.json["image_variant_links"] is None
+    assert len(image_executor.tasks) == 1
+
+    image_executor.run_all()
+
+    generation = image_bucket.blobs["user_1-image"].generation
+    image_variant_links = client.get("/accounts/1").json["image_variant_links"]
+    assert image_variant_links == {
+        variant: {
+            extension: image_bucket.blobs[f"user_1-image-{generation}-{variant}.{extension}"].media_link
+            for extension in ("webp", "jpeg")}
+        for variant in ("thumbnail", "medium")}
+    assert image_bucket.blobs[f"user_1-image-{generation}-thumbnail.jpeg"].content_type == "image/jpeg"
+    assert Image.open(io.BytesIO(image_bucket.contents[f"user_1-image-{generation}-thumbnail.webp"])).size == (128, 128)
+    assert Image.open(io.BytesIO(image_bucket.contents[f"user_1-image-{generation}-medium.jpeg"])).size == (512, 307)
+
+
+def test_upload_user_image_replaced_before_variants_are_generated(client, image_bucket, image_executor):
+    upload_image(client, make_png(200, 200))
+    upload_image(client, make_png(200, 200))
+
+    image_executor.run_all()
+
+    # only the job of the latest upload generated the variants
+    generation = image_bucket.blobs["user_1-image"].generation
+    assert sorted(image_bucket.blobs) == ["user_1-image"] + sorted(
+        f"user_1-image-{generation}-{variant}.{extension}"
+        for variant in ("thumbnail", "medium") for extension in ("webp", "jpeg"))
+    assert client.get("/accounts/1").json["image_variant_links"] is not None
+
+
+def test_upload_user_image_replacement_deletes_previous_variants(runner, client, image_bucket, image_executor):
+    upload_image(client, make_png(200, 200))
+    image_executor.run_all()
+    previous_generation = image_bucket.blobs["user_1-image"].generation
+
+    upload_image(client, make_png(300, 300))
+    image_executor.run_all()
+    result = runner.invoke(args=["drain-outbox"])
+
+    assert "Processed 4 outbox entries" in result.output
+    assert not any(f"-{previous_generation}-" in name for name in image_bucket.blobs)
+    assert len(image_bucket.blobs) == 5
+
+
+def test_upload_user_image_saved_after_a_newer_upload_is_ignored(runner, client, image_bucket, image_executor,
+                                                                 monkeypatch):
+    upload_from_stream = user_info_service.upload_from_stream
+
+    def upload_then_let_newer_upload_be_saved(*args):
+        image_blob = upload_from_stream(*args)
+        monkeypatch.setattr(user_info_service, "upload_from_stream", upload_from_stream)
+        assert upload_image(client, make_png(300, 300)).status_code == 200
+        return image_blob
+
+    monkeypatch.setattr(user_info_service, "upload_from_stream", upload_then_let_newer_upload_be_saved)
+
+    response = upload_image(client, make_png(200, 200))
+
+    assert response.status_code == 200
+    latest_image_blob = image_bucket.blobs["user_1-image"]
+    assert response.json["image_hosted_link"] == latest_image_blob.media_link
+    assert len(image_executor.tasks) == 1  # only the variants of the newer image are generated
+
+    image_executor.run_all()
+    runner.invoke(args=["drain-outbox"])
+
+    user_info = client.get("/accounts/1").json
+    assert user_info["image_hosted_link"] == latest_image_blob.media_link
+    assert user_info["image_variant_links"]["thumbnail"]["webp"] == \
+        image_bucket.blobs[f"user_1-image-{latest_image_blob.generation}-thumbnail.webp"].media_link
+    assert len(image_bucket.blobs) == 5
+
+
+def test_delete_user_info_deletes_image_in_background(runner, client, image_bucket, image_executor):
+    upload_image(client, make_png(200, 200))
+    image_executor.run_all()
+
+    response = client.delete("/accounts/1")
+
+    assert response.status_code == 200
+    assert len(image_bucket.blobs) == 5  # the request does not wait on storage
+
+    runner.invoke(args=["drain-outbox"])
+
+    assert image_bucket.blobs == {}
@@ -0,0 +1,57 @@
+import json
+
+import pytest as pytest
+
+from src.main.helpers.audio_encoding_utils import encode_audio, decode_audio, is_legacy_audio
+
+
+def get_valid_audio(ticks=None, session_id=3448):
+    return {
+        "session_id": session_id,
+        "ticks": ticks or [-96.33, -96.33, -93.47, -89.04, -84.61, -80.18, -75.75, -71.32, -66.89, -62.46, -58.03,
+                           -53.6, -49.17, -44.74, -40.31],
+        "selected_tick": 5,
+        "step_count": 1
+    }
+
+
+def test_encode_audio_with_centi_db_ticks():
+    audio = get_valid_audio()
+
+    data = encode_audio(audio)
+
+    assert not is_legacy_audio(data)
+    assert decode_audio(data) == audio
+    assert len(data) * 3 < len(json.dumps(audio))
+
+
+def test_encode_audio_with_float_ticks():
+    audio = get_valid_audio(ticks=[-96.333] * 15)
+
+    data = encode_audio(audio)
+
+    assert not is_legacy_audio(data)
+    assert decode_audio(data) == audio  # lossless
+
+
+def test_encode_audio_falls_back_to_json():
+    audio = get_valid_audio(session_id=2 ** 64)
+
+    data = encode_audio(audio)
+
+    assert is_legacy_audio(data)
+    assert decode_audio(data) == audio
+
+
+def test_decode_legacy_audio():
+    audio = get_valid_audio()
+
+    assert decode_audio(json.dumps(audio, indent=2).encode("utf-8")) == audio
+
+
+def test_decode_audio_unsupported_version():
+    data = bytearray(encode_audio(get_valid_audio()))
+    data[3] = 99
+
+    with pytest.raises(ValueError):
+        decode_audio(bytes(data))
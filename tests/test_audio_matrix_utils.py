@@ -0,0 +1,58 @@
+import numpy as np
+
+from src.main.helpers.audio_matrix_utils import AudioMatrix
+
+
+def get_ticks(offset):
+    return [-100.0 + offset + tick_index for tick_index in range(15)]
+
+
+def load_audios(session_ids):
+    return lambda: [(session_id, get_ticks(session_id), session_id % 15, session_id) for session_id in session_ids]
+
+
+def test_upsert_is_ignored_until_loaded():
+    audio_matrix = AudioMatrix()
+
+    audio_matrix.upsert(1, get_ticks(1), 1, 1)
+    assert audio_matrix.stats()["count"] == 0
+
+    audio_matrix.load(load_audios([]))
+    audio_matrix.upsert(1, get_ticks(1), 1, 1)
+    assert audio_matrix.stats()["count"] == 1
+
+
+def test_upsert_and_delete_in_place():
+    audio_matrix = AudioMatrix()
+    audio_matrix.load(load_audios(range(1, 41)))  # grows past the initial capacity below
+
+    for session_id in range(41, 51):
+        audio_matrix.upsert(session_id, get_ticks(session_id), session_id % 15, session_id)
+    audio_matrix.upsert(1, get_ticks(0), 0, 100)  # update
+    audio_matrix.delete(2)  # moves the last row
+    audio_matrix.delete(50)  # last row
+    audio_matrix.delete(1000)  # does not exist
+
+    stats = audio_matrix.stats()
+
+    expected_step_counts = np.array([100] + list(range(3, 50)))
+    assert stats["count"] == 48
+    assert stats["step_count"]["mean"] == expected_step_counts.mean()
+    assert stats["step_count"]["max"] == 100
+    assert stats["step_count"]["histogram"]["100"] == 1
+    assert "2" not in stats["step_count"]["histogram"]
+    assert stats["ticks"]["min"] == get_ticks(0)
+    assert stats["ticks"]["max"] == get_ticks(49)
+
+
+def test_stats():
+    audio_matrix = AudioMatrix()
+    audio_matrix.load(load_audios([1, 2, 3, 16]))
+
+    stats = audio_matrix.stats()
+
+    ticks = np.array([get_ticks(session_id) for session_id in (1, 2, 3, 16)])
+    assert stats["ticks"]["mean"] == ticks.mean(axis=0).tolist()
+    assert stats["ticks"]["percentiles"]["50"] == np.median(ticks, axis=0).tolist()
+    assert stats["selected_tick"]["histogram"] == [0, 2, 1, 1] + [0] * 11
+    assert stats["step_count"]["percentiles"]["50"] == 2.5
@@ -0,0 +1,224 @@
+import io
+import json
+
+import pytest as pytest
+from google.api_core.exceptions import BadRequest
+
+from src.main.models import Audio
+from src.main.services.audios import build_audio_blob_name, save_audios_in_catalog
+from tests.helpers.fake_storage import FakeBucket
+from tests.helpers.pagination_utils import get_next_page_link
+
+
+def get_valid_audio_dict(session_id):
+    return {
+        "ticks": [-96.33, -96.33, -93.47, -89.04, -84.61, -80.18, -75.75, -71.32, -66.89, -62.46, -58.03, -53.6, -49.17,
+                  -44.74, -40.31],
+        "selected_tick": 5,
+        "session_id": session_id,
+        "step_count": 1
+    }
+
+
+@pytest.fixture
+def audio_bucket(app, monkeypatch):
+    bucket = FakeBucket("audios")
+    monkeypatch.setattr("src.main.services.audios.get_audio_bucket", lambda: bucket)
+    audio_models = [Audio.from_dict(get_valid_audio_dict(session_id)) for session_id in range(1, 6)]
+    for audio_model in audio_models:
+        bucket.blob(build_audio_blob_name(audio_model.session_id)).upload_from_string(audio_model.to_json())
+    with app.app_context():
+        save_audios_in_catalog(audio_models)
+    return bucket
+
+
+def test_list_audios_follows_next_page_links(client, audio_bucket):
+    session_ids = []
+    url = "/audios/?page_size=2"
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        session_ids.extend(audio["session_id"] for audio in response.json)
+        url = get_next_page_link(response)
+
+    assert session_ids == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("page_size", ["0", "-1", "abc", "1001"])
+def test_list_audios_invalid_page_size(client, audio_bucket, page_size):
+    response = client.get(f"/audios/?page_size={page_size}")
+
+    assert response.status_code == 400
+
+
+def test_list_audios_invalid_page_token(client, audio_bucket, monkeypatch):
+    def list_blobs(**kwargs):
+        raise BadRequest("Invalid page token.")
+
+    monkeypatch.setattr(audio_bucket, "list_blobs", list_blobs)
+
+    response = client.get("/audios/?page_token=abc")
+
+    assert response.status_code == 400
+    assert response.json["errors"][0]["pointer"] == "page_token"
+
+
+def test_list_audios_ndjson(client, audio_bucket):
+    response = client.get("/audios/", headers={"Accept": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    audios = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [audio["session_id"] for audio in audios] == [1, 2, 3, 4, 5]
+
+
+def test_cache_stats(client, audio_bucket):
+    client.get("/audios/1")
+    client.get("/audios/1")
+
+    response = client.get("/debug/caches")
+
+    assert response.status_code == 200
+    assert response.json["audios"]["hits"] == 1
+    assert response.json["audios"]["misses"] == 1
+
+
+def test_get_audio_etag(client, audio_bucket):
+    response = client.get("/audios/1")
+
+    assert response.status_code == 200
+    assert response.get_etag() == (str(audio_bucket.blobs[build_audio_blob_name(1)].generation), False)
+
+
+def test_get_audio_not_modified_is_not_downloaded(client, audio_bucket, monkeypatch):
+    etag = client.get("/audios/2").get_etag()[0]
+    client.application.extensions["audio_cache"].clear()
+
+    def fail_download(audio_blob):
+        raise AssertionError("The audio blob should not be downloaded.")
+
+    monkeypatch.setattr("src.main.services.audios.download_audio", fail_download)
+    response = client.get("/audios/2", headers={"If-None-Match": f'"{etag}"'})
+
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+    assert response.get_data() == b""
+
+
+def test_update_audio_if_match(client, audio_bucket):
+    etag = client.get("/audios/3").get_etag()[0]
+    updated_audio = dict(get_valid_audio_dict(3), step_count=2)
+
+    response = client.put("/audios/3", json=updated_audio, headers={"If-Match": f'"{etag}"'})
+
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    assert client.get("/audios/3").json["step_count"] == 2
+
+
+def test_update_audio_if_match_outdated(client, audio_bucket):
+    etag = client.get("/audios/3").get_etag()[0]
+    client.put("/audios/3", json=dict(get_valid_audio_dict(3), step_count=2))
+
+    response = client.put("/audios/3", json=dict(get_valid_audio_dict(3), step_count=3), headers={"If-Match": f'"{etag}"'})
+
+    assert response.status_code == 412
+    assert client.get("/audios/3").json["step_count"] == 2
+
+
+def test_insert_audios_batch_json(client, audio_bucket):
+    response = client.post("/audios:batch", json=[
+        get_valid_audio_dict(10),
+        get_valid_audio_dict(1),  # blob already exists
+        get_valid_audio_dict(10),  # duplicate in the batch
+        dict(get_valid_audio_dict(11), selected_tick=20),
+        "not an audio",
+        get_valid_audio_dict(12),
+    ])
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json] == [201, 400, 400, 400, 400, 201]
+    assert response.json[0]["resource"] == get_valid_audio_dict(10)
+    assert response.json[1]["problem"]["type"] == "validation-error"
+    assert client.get("/audios/12").status_code == 200
+
+    # the created audios were saved in the catalog, so they are rejected without uploading
+    calls = audio_bucket.calls
+    response = client.post("/audios:batch", json=[get_valid_audio_dict(10), get_valid_audio_dict(12)])
+    assert [result["status"] for result in response.json] == [400, 400]
+    assert audio_bucket.calls == calls
+
+
+def test_insert_audios_batch_files(client, audio_bucket):
+    response = client.post("/audios:batch", data={"audio": [
+        (io.BytesIO(json.dumps(get_valid_audio_dict(10)).encode()), "session_10.json"),
+        (io.BytesIO(b"{"), "malformed.json"),
+        (io.BytesIO(json.dumps(get_valid_audio_dict(11)).encode()), "session_11.txt"),
+        (io.BytesIO(json.dumps(get_valid_audio_dict(12)).encode()), "session_12.json"),
+    ]}, content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json] == [201, 400, 400, 201]
+    assert [result["resource"]["session_id"] for result in response.json if result["status"] == 201] == [10, 12]
+
+
+def test_insert_audios_batch_not_an_array(client, audio_bucket):
+    response = client.post("/audios:batch", json=get_valid_audio_dict(10))
+
+    assert response.status_code == 400
+
+
+def test_audio_stats_are_updated_in_place(client, monkeypatch):
+    bucket = FakeBucket("audios")
+    monkeypatch.setattr("src.main.services.audios.get_audio_bucket", lambda: bucket)
+    client.post("/audios:batch", json=[dict(get_valid_audio_dict(session_id), step_count=session_id)
+                                       for session_id in (10, 11, 12)])
+
+    response = client.get("/audios/stats")
+
+    assert response.status_code == 200
+    assert response.json["count"] == 3
+    assert response.json["ticks"]["min"] == get_valid_audio_dict(10)["ticks"]
+    assert response.json["selected_tick"]["histogram"][5] == 3
+    assert response.json["step_count"]["histogram"] == {"10": 1, "11": 1, "12": 1}
+
+    def fail_load_audios_from_catalog():
+        raise AssertionError("The audio catalog should not be reloaded.")
+
+    monkeypatch.setattr("src.main.services.audios.load_audios_from_catalog", fail_load_audios_from_catalog)
+    client.put("/audios/10", json=dict(get_valid_audio_dict(10), step_count=20))
+    client.delete("/audios/11")
+
+    response = client.get("/audios/stats")
+
+    assert response.json["count"] == 2
+    assert response.json["step_count"]["histogram"] == {"12": 1, "20": 1}
+
+
+def test_insert_audios_batch_reports_failed_uploads(client, audio_bucket, monkeypatch):
+    def fail_upload_new_audio(audio_blob, audio_model):
+        raise ConnectionError("Storage is unavailable.")
+
+    monkeypatch.setattr("src.main.services.audios.upload_new_audio", fail_upload_new_audio)
+
+    response = client.post("/audios:batch", json=[get_valid_audio_dict(1), get_valid_audio_dict(10)])
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json] == [400, 502]
+    assert response.json[1]["problem"]["type"] == "bad-gateway-error"
+
+
+def test_delete_audio_with_leading_zeros_deletes_it_from_bucket_and_catalog(client, audio_bucket):
+    response = client.delete("/audios/003")
+
+    assert response.status_code == 200
+    assert client.get("/audios/3").status_code == 404
+    assert client.put("/audios/3", json=get_valid_audio_dict(3)).status_code == 404
+    assert client.post("/audios/", json=get_valid_audio_dict(3)).status_code == 201
+
+
+@pytest.mark.parametrize("method", ["get", "put", "delete"])
+def test_audio_with_non_integer_session_id_is_not_found(client, audio_bucket, method):
+    response = getattr(client, method)("/audios/abc", json=get_valid_audio_dict(1))
+
+    assert response.status_code == 404
@@ -1,10 +1,19 @@
-"""There is nothing really to test. We would need to completely mock all functionality of the GCP lib
- relied on by this service, and even then we would only really be able to check that methods are indeed called.
+"""Most code paths in the service depend on behaviour of the GCP Storage service, so these are tested against an
+ in-memory stand-in for the bucket, mainly to check that the audio catalog is kept in sync with the bucket, and against
+ the local filesystem storage backend."""
+import os
 
- There are very few code paths in the service, and all of them depend on behaviour of the GCP Storage service."""
 import pytest as pytest
 
+from src.main.data_sources.db import get_db
+from src.main.exceptions import BadGatewayError, NoSuchInstanceError, ValidationError
+from src.main.helpers.audio_encoding_utils import encode_audio, decode_audio, is_legacy_audio
+from src.main.helpers.audio_matrix_utils import ticks_to_bytes
+from src.main.models import Audio
+from src.main.services import audios as audios_service
 from src.main.services.audios import build_audio_blob_name, extract_session_id
+from tests.helpers.fake_storage import FakeBucket
+from tests.helpers.list_utils import is_lists_equal
 
 
 @pytest.mark.parametrize("test_input,expected", [(3448, "session_3448-audio.json"), (1, "session_1-audio.json")])
@@ -20,3 +29,209 @@ def test_extract_session_id(test_input, expected):
 def test_extract_session_id_from_invalid_blob_name():
     with pytest.raises(ValueError):
         print(extract_session_id("not_a_valid_format_123.json"))
+
+
+def get_valid_audio_model(session_id=3448):
+    return Audio.from_dict({
+        "ticks": [-96.33, -96.33, -93.47, -89.04, -84.61, -80.18, -75.75, -71.32, -66.89, -62.46, -58.03, -53.6, -49.17,
+                  -44.74, -40.31],
+        "selected_tick": 5,
+        "session_id": session_id,
+        "step_count": 1
+    })
+
+
+@pytest.fixture
+def audio_bucket(monkeypatch):
+    bucket = FakeBucket("audios")
+    monkeypatch.setattr("src.main.services.audios.get_audio_bucket", lambda: bucket)
+    return bucket
+
+
+def test_create_audio_saves_in_catalog(app, audio_bucket):
+    audio_model = get_valid_audio_model()
+    with app.app_context():
+        audio, generation = audios_service.create_audio(audio_model)
+        catalog_row = get_db().execute("SELECT * FROM audio WHERE session_id = ?", (audio_model.session_id,)).fetchone()
+
+    assert audio["session_id"] == audio_model.session_id
+    assert generation == audio_bucket.blobs[build_audio_blob_name(audio_model.session_id)].generation
+    assert build_audio_blob_name(audio_model.session_id) in audio_bucket.blobs
+    assert catalog_row == {"session_id": audio_model.session_id, "ticks": ticks_to_bytes(audio_model.ticks),
+                           "selected_tick": 5, "step_count": 1}
+
+
+def test_create_audio_duplicate_session_id_does_not_list_bucket(app, audio_bucket, monkeypatch):
+    def fail_list_blobs(**kwargs):
+        raise AssertionError("The audio bucket should not be listed.")
+
+    monkeypatch.setattr(audio_bucket, "list_blobs", fail_list_blobs)
+
+    with app.app_context():
+        audios_service.create_audio(get_valid_audio_model())
+        with pytest.raises(ValidationError):
+            audios_service.create_audio(get_valid_audio_model())
+
+
+def test_create_audio_existing_blob_missing_from_catalog(app, audio_bucket):
+    audio_bucket.blob(build_audio_blob_name(3448)).upload_from_string("{}")
+
+    with app.app_context():
+        with pytest.raises(ValidationError):
+            audios_service.create_audio(get_valid_audio_model())
+        assert not audios_service.audio_exists(3448)
+
+
+def test_create_audios_saves_uploaded_audios_despite_failed_upload(app, audio_bucket, monkeypatch):
+    upload_new_audio = audios_service.upload_new_audio
+
+    def fail_upload_new_audio(audio_blob, audio_model):
+        if audio_model.session_id == 2:
+            raise ConnectionError("Storage is unavailable.")
+        return upload_new_audio(audio_blob, audio_model)
+
+    monkeypatch.setattr("src.main.services.audios.upload_new_audio", fail_upload_new_audio)
+
+    with app.app_context():
+        results = audios_service.create_audios([get_valid_audio_model(session_id) for session_id in (1, 2, 3)])
+        assert audios_service.get_existing_session_ids([1, 2, 3]) == {1, 3}
+
+    assert isinstance(results[1], BadGatewayError)
+    assert [result[0]["session_id"] for result in (results[0], results[2])] == [1, 3]
+
+
+def test_delete_audio_removes_from_catalog(app, audio_bucket):
+    with app.app_context():
+        audios_service.create_audio(get_valid_audio_model())
+        audios_service.delete_audio(3448)
+
+        assert not audios_service.audio_exists(3448)
+    assert build_audio_blob_name(3448) not in audio_bucket.blobs
+
+
+def test_rebuild_audio_catalog(app, audio_bucket):
+    for session_id in (1, 2, 3):
+        audio_bucket.blob(build_audio_blob_name(session_id)).upload_from_string(
+            get_valid_audio_model(session_id).to_json())
+    audio_bucket.blob("not-an-audio.txt").upload_from_string("")
+    audio_bucket.blob("session_1-notes.txt").upload_from_string("")
+
+    with app.app_context():
+        get_db().execute("INSERT INTO audio (session_id, ticks, selected_tick, step_count) VALUES (4, x'', 0, 0)")
+        assert audios_service.rebuild_audio_catalog() == 3
+        session_ids = [row["session_id"] for row in get_db().execute("SELECT session_id FROM audio").fetchall()]
+
+    assert is_lists_equal(session_ids, [1, 2, 3])
+
+
+def test_rebuild_audio_catalog_command(runner, audio_bucket):
+    audio_bucket.blob(build_audio_blob_name(1)).upload_from_string(get_valid_audio_model(1).to_json())
+
+    result = runner.invoke(args=["rebuild-audio-catalog"])
+
+    assert "1 audio files" in result.output
+
+
+def test_create_audio_uses_binary_encoding(app, audio_bucket):
+    audio_model = get_valid_audio_model()
+    with app.app_context():
+        audios_service.create_audio(audio_model)
+        audio = audios_service.get_audio(audio_model.session_id)
+
+    assert not is_legacy_audio(audio_bucket.contents[build_audio_blob_name(audio_model.session_id)])
+    assert audio == audio_model.to_dict()
+
+
+def test_migrate_audio_blobs_command(runner, audio_bucket):
+    audio_bucket.blob(build_audio_blob_name(1)).upload_from_string(get_valid_audio_model(1).to_json())
+    audio_bucket.blob(build_audio_blob_name(2)).upload_from_string(encode_audio(get_valid_audio_model(2).to_dict()))
+    binary_generation = audio_bucket.blobs[build_audio_blob_name(2)].generation
+
+    result = runner.invoke(args=["migrate-audio-blobs"])
+
+    assert "Migrated 1 of the 2 audio files" in result.output
+    assert not is_legacy_audio(audio_bucket.contents[build_audio_blob_name(1)])
+    assert audio_bucket.blobs[build_audio_blob_name(2)].generation == binary_generation  # not rewritten
+    assert decode_audio(audio_bucket.contents[build_audio_blob_name(1)]) == get_valid_audio_model(1).to_dict()
+
+
+def test_get_audios_pages(app, audio_bucket):
+    for session_id in (1, 2, 3):
+        audio_bucket.blob(build_audio_blob_name(session_id)).upload_from_string(
+            get_valid_audio_model(session_id).to_json())
+
+    with app.app_context():
+        first_page, next_page_token = audios_service.get_audios(2)
+        second_page, last_page_token = audios_service.get_audios(2, next_page_token)
+
+    assert [audio["session_id"] for audio in first_page] == [1, 2]
+    assert [audio["session_id"] for audio in second_page] == [3]
+    assert last_page_token is None
+
+
+def test_get_audio_is_cached_until_updated(app, audio_bucket):
+    with app.app_context():
+        audios_service.create_audio(get_valid_audio_model())
+        audios_service.get_audio(3448)
+
+        calls = audio_bucket.calls
+        assert audios_service.get_audio("3448")["step_count"] == 1
+        assert audio_bucket.calls == calls  # served from the cache
+
+        updated_audio_model = get_valid_audio_model()
+        updated_audio_model.step_count = 2
+        audios_service.update_audio(3448, updated_audio_model)
+
+        assert audios_service.get_audio(3448)["step_count"] == 2
+
+
+def test_get_audio_is_not_cached_once_deleted(app, audio_bucket):
+    with app.app_context():
+        audios_service.create_audio(get_valid_audio_model())
+        audios_service.get_audio(3448)
+        audios_service.delete_audio(3448)
+
+        with pytest.raises(NoSuchInstanceError):
+            audios_service.get_audio(3448)
+
+
+def test_audio_lifecycle_on_local_storage(app, tmp_path):
+    app.config.update(STORAGE_BACKEND="local", LOCAL_STORAGE_PATH=str(tmp_path), AUDIO_BUCKET="audios")
+
+    with app.app_context():
+        for session_id in (1, 2, 3):
+            audios_service.create_audio(get_valid_audio_model(session_id))
+
+        updated_audio_model = get_valid_audio_model(2)
+        updated_audio_model.step_count = 2
+        _, generation = audios_service.update_audio(2, updated_audio_model)
+        audios_service.delete_audio(3)
+
+        first_page, next_page_token = audios_service.get_audios(1)
+        second_page, last_page_token = audios_service.get_audios(1, next_page_token)
+        assert audios_service.get_audio_and_generation(2) == (updated_audio_model.to_dict(), generation)
+
+    assert [audio["session_id"] for audio in first_page + second_page] == [1, 2]
+    assert second_page[0]["step_count"] == 2
+    assert last_page_token is None
+    assert os.path.isdir(tmp_path / "audios")
+
+
+def test_get_audios_skips_audios_deleted_since_listed(app, audio_bucket, monkeypatch):
+    for session_id in (1, 2):
+        audio_bucket.blob(build_audio_blob_name(session_id)).upload_from_string(
+            encode_audio(get_valid_audio_model(session_id).to_dict()))
+
+    list_blobs = audio_bucket.list_blobs
+
+    def list_then_delete_blobs(*args, **kwargs):
+        iterator = list_blobs(*args, **kwargs)
+        audio_bucket.delete_blobs([build_audio_blob_name(1)])  # deleted by a concurrent request
+        return iterator
+
+    monkeypatch.setattr(audio_bucket, "list_blobs", list_then_delete_blobs)
+
+    with app.app_context():
+        audios, _ = audios_service.get_audios(10)
+
+    assert [audio["session_id"] for audio in audios] == [2]
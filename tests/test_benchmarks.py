@@ -0,0 +1,40 @@
+import json
+
+from click.testing import CliRunner
+
+from tests.benchmarks.__main__ import main
+from tests.benchmarks.harness import BenchmarkResult, summarize, compare_to_baseline
+
+
+def test_summarize():
+    result = summarize("op", [1000 * (i + 1) for i in range(100)])  # 1 to 100 us
+
+    assert result.iterations == 100
+    assert (result.p50_us, result.p95_us, result.p99_us) == (50, 95, 99)
+    assert round(result.ops_per_sec) == round(100 / (5050 / 1e6))
+
+
+def test_compare_to_baseline():
+    baseline_result = BenchmarkResult("op", 100, 1000, 100, 200, 300)
+
+    change, is_regression = compare_to_baseline(BenchmarkResult("op", 100, 1000, 110, 200, 300), baseline_result, 0.2)
+    assert round(change, 2) == 0.1
+    assert not is_regression
+
+    change, is_regression = compare_to_baseline(BenchmarkResult("op", 100, 1000, 130, 200, 300), baseline_result, 0.2)
+    assert round(change, 2) == 0.3
+    assert is_regression
+
+
+def test_run_benchmarks_against_baseline(tmp_path):
+    baseline_path = str(tmp_path / "baseline.json")
+    args = ["-k", "GET /accounts/<id>", "--rows", "", "--scale", "0.01", "--baseline", baseline_path]
+
+    result = CliRunner().invoke(main, args + ["--save-baseline"])
+    assert result.exit_code == 0, result.output
+    with open(baseline_path) as baseline_file:
+        assert [result["name"] for result in json.load(baseline_file)] == ["GET /accounts/<id>"]
+
+    result = CliRunner().invoke(main, args + ["--tolerance", "-1"])  # any result is a regression
+    assert result.exit_code == 1
+    assert "1 benchmarks regressed" in result.output
@@ -0,0 +1,71 @@
+from src.main.helpers.cache_utils import ReadThroughCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def get_or_load(cache, key, loader):
+    """Read through the cache, as the services do."""
+    value, token = cache.get(key)
+    if value is None:
+        value = loader()
+        cache.set(key, value, token)
+    return value
+
+
+def test_cache_hit_and_miss():
+    cache = ReadThroughCache(maxsize=2, ttl=60)
+
+    assert get_or_load(cache, "a", lambda: 1) == 1
+    assert get_or_load(cache, "a", lambda: 2) == 1
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ReadThroughCache(maxsize=2, ttl=60)
+    get_or_load(cache, "a", lambda: 1)
+    get_or_load(cache, "b", lambda: 2)
+    get_or_load(cache, "a", lambda: 1)
+    get_or_load(cache, "c", lambda: 3)
+
+    assert get_or_load(cache, "b", lambda: 4) == 4  # evicted
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["size"] == 2
+
+
+def test_cache_expires_items():
+    timer = FakeTimer()
+    cache = ReadThroughCache(maxsize=2, ttl=60, timer=timer)
+    get_or_load(cache, "a", lambda: 1)
+
+    timer.now = 61
+
+    assert get_or_load(cache, "a", lambda: 2) == 2
+    assert cache.stats()["evictions"] == 0
+
+
+def test_cache_invalidate():
+    cache = ReadThroughCache(maxsize=2, ttl=60)
+    get_or_load(cache, "a", lambda: 1)
+
+    cache.invalidate("a")
+
+    assert get_or_load(cache, "a", lambda: 2) == 2
+
+
+def test_cache_does_not_store_item_loaded_during_invalidation():
+    cache = ReadThroughCache(maxsize=2, ttl=60)
+
+    def load_stale():
+        cache.invalidate("a")  # e.g. concurrent update
+        return 1
+
+    assert get_or_load(cache, "a", load_stale) == 1
+    assert get_or_load(cache, "a", lambda: 2) == 2
@@ -28,3 +28,33 @@ def test_init_db_command(runner, monkeypatch):
     result = runner.invoke(args=['init-db'])
     assert 'Initialized' in result.output
     assert Recorder.called
+
+
+def test_get_db_reuses_pooled_connection(app):
+    with app.app_context():
+        connection = get_db()._connection
+
+    with app.app_context():
+        assert get_db()._connection is connection
+
+
+def test_get_db_wal_mode(app):
+    with app.app_context():
+        assert get_db().execute("PRAGMA journal_mode").fetchone()["journal_mode"] == "wal"
+
+
+def test_get_db_read_only_for_get_requests(app):
+    with app.test_request_context("/accounts/", method="GET"):
+        with pytest.raises(sqlite3.OperationalError):
+            get_db().execute("DELETE FROM user_info")
+
+    with app.test_request_context("/accounts/1", method="DELETE"):
+        get_db().execute("DELETE FROM user_info WHERE id = 1")
+
+
+def test_close_db_rolls_back_uncommitted_changes(app):
+    with app.app_context():
+        get_db().execute("DELETE FROM user_info")
+
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT() FROM user_info").fetchone()["COUNT()"] == 2
@@ -13,3 +13,23 @@ def test_config():
 def test_ping(client):
     response = client.get("/ping")
     assert response.status_code == 200
+
+
+def test_debug_routes_are_not_served_in_production():
+    app = create_app({"OUTBOX_WORKER": False})
+
+    assert app.test_client().get("/debug/caches").status_code == 404
+    assert app.test_client().delete("/debug/sql").status_code == 404
+
+
+def test_debug_routes_require_the_secret_in_production():
+    app = create_app({"OUTBOX_WORKER": False, "DEBUG_ROUTES": True, "DEBUG_SECRET": "debug-secret"})
+
+    assert app.test_client().get("/debug/caches").status_code == 404
+    assert app.test_client().get("/debug/caches", headers={"X-Debug-Secret": "wrong-secret"}).status_code == 404
+    assert app.test_client().get("/debug/caches", headers={"X-Debug-Secret": "debug-secret"}).status_code == 200
+
+
+def test_debug_routes_require_a_secret():
+    with pytest.raises(ValueError):
+        create_app({"OUTBOX_WORKER": False, "DEBUG_ROUTES": True})
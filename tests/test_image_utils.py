@@ -0,0 +1,31 @@
+import io
+
+import pytest
+from PIL import Image
+
+from src.main import ValidationError
+from src.main.helpers.image_utils import load_image, resize_image
+
+
+def make_image_file(width, height, image_format):
+    data = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 0, 0)).save(data, image_format)
+    data.seek(0)
+    return data
+
+
+def test_load_image_downsamples_jpeg_while_decoding():
+    image = load_image(make_image_file(4096, 2048, "JPEG"), 10 * 1000 * 1000, draft_size=(512, 512))
+
+    assert image.size == (1024, 512)  # decoded at 1/4 scale, the smallest one at least 512x512
+    assert resize_image(image, 512, 512, False).size == (512, 256)
+
+
+def test_load_image_does_not_downsample_png():
+    assert load_image(make_image_file(2000, 1000, "PNG"), 10 * 1000 * 1000, draft_size=(512, 512)).size == (2000, 1000)
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG"])
+def test_load_image_too_large(image_format):
+    with pytest.raises(ValidationError):
+        load_image(make_image_file(2000, 1000, image_format), 2000 * 1000 - 1)
@@ -0,0 +1,95 @@
+"""Budgets of the database and storage round trips of each endpoint, which fail when a change makes an endpoint call
+the database or storage more often than it needs to (e.g. a call per item of a page or batch).
+
+Requests run against the local filesystem storage backend, whose calls are counted like those to GCP Storage."""
+import io
+
+import pytest
+
+from tests.helpers.fake_executor import RecordingExecutor
+
+
+def get_valid_audio_dict(session_id, step_count=1):
+    return {"ticks": [-96.33] * 15, "selected_tick": 5, "session_id": session_id, "step_count": step_count}
+
+
+def get_valid_user_info_dict(index):
+    return {"name": f"User {index}", "email": f"user{index}@example.com", "address": f"{index} Main Road"}
+
+
+def get_png():
+    return (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00"
+            b"\x00\x00\x0cIDATx\x9cc\xf8\xcf\xc0\x00\x00\x03\x01\x01\x00\xc9\xfe\x92\xef\x00\x00\x00\x00IEND\xaeB`\x82")
+
+
+@pytest.fixture
+def client(app, tmp_path, monkeypatch):
+    app.config.update(STORAGE_BACKEND="local", LOCAL_STORAGE_PATH=str(tmp_path), AUDIO_BUCKET="audios",
+                      IMAGE_BUCKET="images")
+    # image variants are generated by background jobs, whose storage calls are not made by the request
+    monkeypatch.setattr("src.main.services.user_infos.get_executor", lambda name, max_workers: RecordingExecutor())
+
+    client = app.test_client()
+    for session_id in (1, 2, 3):
+        assert client.post("/audios/", json=get_valid_audio_dict(session_id)).status_code == 201
+    return client
+
+
+def get_round_trips(response):
+    return int(response.headers["X-DB-Round-Trips"]), int(response.headers["X-Storage-Round-Trips"])
+
+
+# each request, with the maximum number of database and storage round trips it may make
+BUDGETS = [
+    ("POST /audios/", lambda client: client.post("/audios/", json=get_valid_audio_dict(10)), 3, 1),
+    ("POST /audios:batch", lambda client: client.post(
+        "/audios:batch", json=[get_valid_audio_dict(session_id) for session_id in (10, 11, 12)]), 3, 3),
+    ("GET /audios/<session_id>", lambda client: client.get("/audios/1"), 0, 2),
+    ("GET /audios/", lambda client: client.get("/audios/?page_size=2"), 0, 3),  # list, then download each audio
+    ("GET /audios/stats", lambda client: client.get("/audios/stats"), 1, 0),
+    ("PUT /audios/<session_id>", lambda client: client.put("/audios/1", json=get_valid_audio_dict(1, 2)), 3, 1),
+    ("PUT /audios/<session_id> with If-Match", lambda client: client.put(
+        "/audios/1", json=get_valid_audio_dict(1, 2), headers={"If-Match": client.get("/audios/1").headers["ETag"]}),
+     2, 2),
+    ("DELETE /audios/<session_id>", lambda client: client.delete("/audios/1"), 2, 1),
+
+    ("POST /accounts/", lambda client: client.post("/accounts/", json=get_valid_user_info_dict(10)), 3, 0),
+    ("POST /accounts:batch", lambda client: client.post(
+        "/accounts:batch", json=[get_valid_user_info_dict(index) for index in (10, 11, 12)]), 5, 0),
+    ("GET /accounts/<user_id>", lambda client: client.get("/accounts/1"), 1, 0),
+    ("GET /accounts/", lambda client: client.get("/accounts/"), 1, 0),
+    ("PUT /accounts/<user_id>", lambda client: client.put("/accounts/1", json=get_valid_user_info_dict(10)), 3, 0),
+    ("DELETE /accounts/<user_id>", lambda client: client.delete("/accounts/1"), 4, 0),
+    ("POST /accounts/<user_id>/upload-image", lambda client: client.post(
+        "/accounts/1/upload-image", data={"image": (io.BytesIO(get_png()), "image.png")},
+        content_type="multipart/form-data"), 6, 1),
+]
+
+
+@pytest.mark.parametrize("send_request,db_budget,storage_budget",
+                         [budget[1:] for budget in BUDGETS], ids=[budget[0] for budget in BUDGETS])
+def test_endpoint_round_trips_are_within_budget(client, send_request, db_budget, storage_budget):
+    response = send_request(client)
+
+    assert response.status_code < 300
+    db_round_trips, storage_round_trips = get_round_trips(response)
+    assert db_round_trips <= db_budget
+    assert storage_round_trips <= storage_budget
+
+
+def test_update_missing_audio_makes_no_storage_round_trip(client):
+    response = client.put("/audios/10", json=get_valid_audio_dict(10))
+
+    assert response.status_code == 404
+    assert get_round_trips(response)[1] == 0
+
+
+@pytest.mark.parametrize("path,make_item", [
+    ("/accounts:batch", get_valid_user_info_dict),
+    ("/audios:batch", get_valid_audio_dict),
+])
+def test_batch_db_round_trips_do_not_grow_with_batch_size(client, path, make_item):
+    small_batch_response = client.post(path, json=[make_item(index) for index in range(10, 12)])
+    large_batch_response = client.post(path, json=[make_item(index) for index in range(100, 150)])
+
+    assert get_round_trips(large_batch_response)[0] == get_round_trips(small_batch_response)[0]
@@ -0,0 +1,93 @@
+import datetime
+import json
+
+import numpy as np
+import pytest as pytest
+
+from src.main.helpers import json_utils
+from src.main.helpers.json_utils import StdlibJSONCodec, OrjsonJSONCodec
+
+codecs = [StdlibJSONCodec()]
+if json_utils.orjson is not None:
+    codecs.append(OrjsonJSONCodec())
+
+
+def get_document():
+    return {
+        "session_id": 3448,
+        "ticks": [-96.33, -93.47, 0.0, 1e-7],
+        "name": "Jöhn \"Doe\"",
+        "empty": [],
+        "nested": {"b": None, "a": True},
+    }
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_round_trip(codec):
+    document = get_document()
+
+    data = codec.dumps(document)
+
+    assert isinstance(data, str)
+    assert json.loads(data) == document
+    assert codec.loads(data) == document
+    assert codec.loads(data.encode("utf-8")) == document
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_sort_keys(codec):
+    assert codec.dumps({"b": 1, "a": 2}, sort_keys=True) == '{"a":2,"b":1}'
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_default(codec):
+    assert codec.loads(codec.dumps({"values": {1, 2}}, default=sorted)) == {"values": [1, 2]}
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_big_int(codec):
+    document = {"session_id": 2 ** 70}
+
+    assert codec.loads(codec.dumps(document)) == document
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_loads_nan(codec):
+    assert np.isnan(codec.loads("[NaN]")[0])
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_loads_malformed(codec):
+    with pytest.raises(json.JSONDecodeError) as e:
+        codec.loads('{"session_id": ')
+
+    assert e.value.msg == "Expecting value"
+
+
+@pytest.mark.parametrize("document", [
+    {"a": float("nan"), "b": None},
+    [float("inf"), -float("inf"), "null"],
+    {"ticks": [1.5, 2 ** 70], "b": None},
+])
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_dumps_like_the_standard_library(codec, document):
+    assert codec.dumps(document) == json.dumps(document, separators=(",", ":"))
+
+
+@pytest.mark.parametrize("codec", codecs, ids=lambda codec: codec.name)
+def test_codec_dumps_datetime_with_default(codec):
+    document = {"at": datetime.datetime(2024, 1, 1, 12, 30)}
+
+    with pytest.raises(TypeError):
+        codec.dumps(document)
+    assert codec.dumps(document, default=str) == '{"at":"2024-01-01 12:30:00"}'
+
+
+@pytest.mark.skipif(json_utils.orjson is None, reason="orjson is not installed")
+def test_orjson_codec_numpy():
+    assert json.loads(OrjsonJSONCodec().dumps({"ticks": np.array([1.5, 2.5])})) == {"ticks": [1.5, 2.5]}
+
+
+def test_provider(app):
+    with app.app_context():
+        assert app.json.loads(app.json.dumps({"b": [1, 2], "a": None})) == {"a": None, "b": [1, 2]}
@@ -0,0 +1,45 @@
+import pytest as pytest
+
+from tests.loadtest.runner import LoadTest, get_endpoint
+
+
+@pytest.mark.parametrize("method,url,expected", [
+    ("get", "/audios", "GET /audios"),
+    ("GET", "/audios/", "GET /audios"),
+    ("PUT", "/audios/3448", "PUT /audios/<id>"),
+    ("POST", "/accounts/12/upload-image", "POST /accounts/<id>/upload-image"),
+    ("GET", "http://127.0.0.1:9090/accounts?name=Foo", "GET /accounts"),
+])
+def test_get_endpoint(method, url, expected):
+    assert get_endpoint(method, url) == expected
+
+
+def passing_scenario(s, next_id):
+    s.stats.record_request("GET /audios", 1.0, False)
+    s.stats.record_request("GET /audios/<id>", 2.0, True)
+
+
+def failing_scenario(s, next_id):
+    assert False
+
+
+def test_run_stage_closed_loop():
+    load_test = LoadTest("http://127.0.0.1:9090", [passing_scenario, failing_scenario], [1, 1], seed=0)
+
+    result = load_test.run_stage(concurrency=2, duration_s=0.1)
+
+    scenario_count = len(result.stats.scenario_durations_ms)
+    failure_count = result.stats.scenario_failures["failing_scenario: unexpected response"]
+    assert 0 < failure_count < scenario_count
+    assert result.stats.request_count == 2 * (scenario_count - failure_count)
+    assert result.error_rate == 0.5
+    assert set(result.endpoint_percentiles()) == {"GET /audios", "GET /audios/<id>"}
+
+
+def test_run_stage_open_loop():
+    load_test = LoadTest("http://127.0.0.1:9090", [passing_scenario], [1], seed=0)
+
+    result = load_test.run_stage(concurrency=2, duration_s=0.2, rate=100)
+
+    assert 0 < len(result.stats.scenario_durations_ms) < 100
+    assert result.endpoint_percentiles()["GET /audios"] == [1.0, 1.0, 1.0]
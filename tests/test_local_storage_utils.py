@@ -0,0 +1,113 @@
+import io
+import os
+
+import pytest as pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from src.main.helpers import local_storage_utils
+from src.main.helpers.local_storage_utils import LocalBucket, get_shard
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return LocalBucket(str(tmp_path / "audios"), "audios")
+
+
+def test_upload_and_download(bucket):
+    blob = bucket.blob("session_1-audio.json")
+    blob.upload_from_string(b"contents", content_type="application/octet-stream")
+
+    stored_blob = bucket.get_blob("session_1-audio.json")
+    assert stored_blob.generation == blob.generation
+    assert stored_blob.content_type == "application/octet-stream"
+    assert stored_blob.size == len(b"contents")
+    assert stored_blob.download_as_bytes() == b"contents"
+    assert bucket.blob("session_1-audio.json").download_as_text() == "contents"
+
+
+def test_blobs_are_sharded(bucket):
+    blob = bucket.blob("users/user_1-image")
+    blob.upload_from_string("contents")
+
+    assert os.path.dirname(blob.path) == os.path.join(bucket.path, get_shard("users/user_1-image"))
+    assert sorted(os.listdir(os.path.dirname(blob.path))) == [".lock", "users%2Fuser_1-image"]  # no temporary file is left
+
+
+def test_upload_generation_match(bucket):
+    blob = bucket.blob("session_1-audio.json")
+    blob.upload_from_string("1", if_generation_match=0)
+    generation = blob.generation
+
+    with pytest.raises(PreconditionFailed):
+        bucket.blob("session_1-audio.json").upload_from_string("2", if_generation_match=0)
+
+    blob.upload_from_string("2", if_generation_match=generation)
+    assert blob.generation > generation
+
+    with pytest.raises(PreconditionFailed):
+        bucket.blob("session_1-audio.json").upload_from_string("3", if_generation_match=generation)
+    assert blob.download_as_text() == "2"
+
+
+def test_upload_from_file_in_chunks(bucket, monkeypatch):
+    file = io.BytesIO(b"header" + b"x" * 100)
+    file.seek(len(b"header"))
+    read_sizes = []
+    read = file.read
+    monkeypatch.setattr(file, "read", lambda size=-1: read_sizes.append(size) or read(size))
+
+    bucket.blob("user_1-image", chunk_size=32).upload_from_file(file, size=100, content_type="image/png")
+
+    assert bucket.blob("user_1-image").download_as_bytes() == b"x" * 100
+    assert max(read_sizes) == 32
+
+
+def test_download_missing_blob(bucket):
+    assert bucket.get_blob("session_1-audio.json") is None
+    with pytest.raises(NotFound):
+        bucket.blob("session_1-audio.json").download_as_bytes()
+
+
+def test_download_to_file_generation_match(bucket):
+    blob = bucket.blob("user_1-image")
+    blob.upload_from_string(b"image")
+
+    file = io.BytesIO()
+    bucket.blob("user_1-image").download_to_file(file, if_generation_match=blob.generation)
+    assert file.getvalue() == b"image"
+
+    with pytest.raises(PreconditionFailed):
+        bucket.blob("user_1-image").download_to_file(io.BytesIO(), if_generation_match=blob.generation - 1)
+
+
+def test_list_blobs_in_pages(bucket, monkeypatch):
+    monkeypatch.setattr(local_storage_utils, "LIST_PAGE_SIZE", 2)
+    for session_id in range(5):
+        bucket.blob(f"session_{session_id}-audio.json").upload_from_string(str(session_id))
+    bucket.blob("user_1-image").upload_from_string("image")
+
+    iterator = bucket.list_blobs(prefix="session_", max_results=3)
+    first_page = [blob.name for blob in next(iterator.pages)]
+    assert first_page == ["session_0-audio.json", "session_1-audio.json"]
+    assert iterator.next_page_token == "session_1-audio.json"
+
+    assert [blob.name for blob in bucket.list_blobs(prefix="session_", max_results=3)] == [
+        "session_0-audio.json", "session_1-audio.json", "session_2-audio.json"]
+
+    iterator = bucket.list_blobs(prefix="session_", max_results=3, page_token="session_2-audio.json")
+    assert [blob.name for blob in next(iterator.pages)] == ["session_3-audio.json", "session_4-audio.json"]
+    assert iterator.next_page_token is None
+
+    assert len(list(bucket.list_blobs())) == 6
+
+
+def test_delete_blobs(bucket):
+    bucket.blob("user_1-image").upload_from_string("image")
+
+    with pytest.raises(NotFound):
+        bucket.delete_blobs(["user_1-image", "user_2-image"])
+    assert bucket.get_blob("user_1-image") is None
+
+    missing = []
+    bucket.delete_blobs(["user_1-image"], on_error=missing.append)
+    assert [blob.name for blob in missing] == ["user_1-image"]
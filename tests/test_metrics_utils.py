@@ -0,0 +1,90 @@
+from src.main.helpers.metrics_utils import Histogram
+
+
+def get_metric_value(metrics_text, sample):
+    for line in metrics_text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_histogram_render():
+    histogram = Histogram("test_seconds", "Test histogram.", ("endpoint",), buckets=(0.1, 1))
+    histogram.observe(("a",), 0.05)
+    histogram.observe(("a",), 0.5)
+    histogram.observe(("a",), 5)
+    histogram.observe(("b\"",), 0.1)
+
+    assert histogram.render() == [
+        "# HELP test_seconds Test histogram.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{endpoint="a",le="0.1"} 1',
+        'test_seconds_bucket{endpoint="a",le="1"} 2',
+        'test_seconds_bucket{endpoint="a",le="+Inf"} 3',
+        'test_seconds_sum{endpoint="a"} 5.55',
+        'test_seconds_count{endpoint="a"} 3',
+        'test_seconds_bucket{endpoint="b\\"",le="0.1"} 1',
+        'test_seconds_bucket{endpoint="b\\"",le="1"} 1',
+        'test_seconds_bucket{endpoint="b\\"",le="+Inf"} 1',
+        'test_seconds_sum{endpoint="b\\""} 0.1',
+        'test_seconds_count{endpoint="b\\""} 1',
+    ]
+
+
+def test_metrics_record_requests_and_phases(app, client, tmp_path):
+    app.config.update(STORAGE_BACKEND="local", LOCAL_STORAGE_PATH=str(tmp_path), AUDIO_BUCKET="audios")
+    audio = {"ticks": [-96.33] * 15, "selected_tick": 5, "session_id": 3448, "step_count": 1}
+
+    assert client.post("/audios/", json=audio, buffered=True).status_code == 201
+    assert client.get("/accounts/1", buffered=True).status_code == 200
+    assert client.get("/accounts/0", buffered=True).status_code == 404
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    metrics = response.get_data(as_text=True)
+    for sample in ['http_request_duration_seconds_count{endpoint="audios.insert_audio",method="POST",status="201"}',
+                   'http_request_duration_seconds_count{endpoint="accounts.get_user_info",method="GET",status="200"}',
+                   'http_request_duration_seconds_count{endpoint="accounts.get_user_info",method="GET",status="404"}']:
+        assert get_metric_value(metrics, sample) == 1, sample
+    for phase in ("db", "storage", "validation", "serialization"):
+        sample = f'http_request_phase_duration_seconds_count{{endpoint="audios.insert_audio",phase="{phase}"}}'
+        assert get_metric_value(metrics, sample) == 1, sample
+    assert get_metric_value(metrics, 'app_span_duration_seconds_count{phase="storage",operation="upload"}') == 1
+    assert get_metric_value(metrics, 'app_span_duration_seconds_count{phase="db",operation="commit"}') >= 1
+
+
+def test_metrics_of_streamed_responses_are_recorded_once_they_are_closed(client):
+    response = client.get("/accounts/", headers={"Accept": "application/x-ndjson"})
+    sample = 'http_request_phase_duration_seconds_count{endpoint="accounts.list_user_infos",phase="db"}'
+
+    assert get_metric_value(client.get("/metrics").get_data(as_text=True), sample) is None
+
+    assert response.get_data(as_text=True).count("\n") == 2
+    response.close()
+
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert get_metric_value(metrics, sample) == 1
+    assert get_metric_value(
+        metrics, 'http_request_round_trips_sum{endpoint="accounts.list_user_infos",phase="db"}') >= 1
+
+
+def test_round_trips_are_reported_in_debug_mode_only(app, client, tmp_path):
+    app.config.update(STORAGE_BACKEND="local", LOCAL_STORAGE_PATH=str(tmp_path), AUDIO_BUCKET="audios")
+    audio = {"ticks": [-96.33] * 15, "selected_tick": 5, "session_id": 3448, "step_count": 1}
+    assert client.post("/audios/", json=audio).status_code == 201
+
+    response = client.get("/audios/3448", buffered=True)
+
+    assert response.headers["X-Storage-Round-Trips"] == "2"  # get the blob's metadata, then download it
+    assert response.headers["X-DB-Round-Trips"] == "0"
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert get_metric_value(
+        metrics, 'http_request_round_trips_sum{endpoint="audios.get_audio",phase="storage"}') == 2
+
+    app.testing = False
+    response = client.get("/accounts/1")
+
+    assert "X-DB-Round-Trips" not in response.headers
+    assert "X-Storage-Round-Trips" not in response.headers
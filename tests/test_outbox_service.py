@@ -0,0 +1,84 @@
+from src.main.data_sources.db import get_db
+from src.main.services import outbox as outbox_service
+from tests.helpers.fake_storage import FakeBucket
+
+
+class UnavailableBucket:
+    def __init__(self):
+        self.calls = 0
+
+    def delete_blobs(self, blob_names, on_error=None):
+        self.calls += 1
+        raise ConnectionError("Storage is unavailable.")
+
+
+def add_blob_deletions(blob_names):
+    db = get_db()
+    outbox_service.add_blob_deletions(db, outbox_service.IMAGE_BUCKET, blob_names)
+    db.commit()
+
+
+def get_outbox_entries():
+    return get_db().execute("SELECT * FROM outbox ORDER BY id").fetchall()
+
+
+def test_drain_outbox_in_batches(app, monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr("src.main.services.outbox.get_image_bucket", lambda: bucket)
+    for name in ("a", "b", "c"):
+        bucket.blob(name).upload_from_string(name)
+
+    with app.app_context():
+        add_blob_deletions(["a", "b", "c", "missing"])
+        calls = bucket.calls
+
+        assert outbox_service.drain_outbox(batch_size=3, max_attempts=1, retry_delay=0) == 3
+        assert outbox_service.drain_outbox(batch_size=3, max_attempts=1, retry_delay=0) == 1
+        assert outbox_service.drain_outbox(batch_size=3, max_attempts=1, retry_delay=0) == 0
+        assert get_outbox_entries() == []
+
+    assert bucket.blobs == {}
+    assert bucket.calls - calls == 2  # one deletion call per batch
+
+
+def test_drain_outbox_retries_failed_deletions_later(app, monkeypatch):
+    bucket = UnavailableBucket()
+    monkeypatch.setattr("src.main.services.outbox.get_image_bucket", lambda: bucket)
+
+    with app.app_context():
+        add_blob_deletions(["a"])
+
+        assert outbox_service.drain_outbox(batch_size=10, max_attempts=3, retry_delay=60) == 1
+        # not due until the retry delay passed
+        assert outbox_service.drain_outbox(batch_size=10, max_attempts=3, retry_delay=60) == 0
+        entry, = get_outbox_entries()
+
+    assert entry["attempts"] == 1
+    assert "Storage is unavailable." in entry["last_error"]
+    assert bucket.calls == 1
+
+
+def test_drain_outbox_gives_up_after_max_attempts(app, monkeypatch):
+    bucket = UnavailableBucket()
+    monkeypatch.setattr("src.main.services.outbox.get_image_bucket", lambda: bucket)
+
+    with app.app_context():
+        add_blob_deletions(["a"])
+        app.config.update(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_DELAY=0)
+
+        assert outbox_service.drain_due_outbox_entries() == 3
+        entry, = get_outbox_entries()
+
+    assert entry["attempts"] == 3  # kept for inspection
+    assert bucket.calls == 3
+
+
+def test_drain_outbox_command_reports_failures(runner, app, monkeypatch):
+    monkeypatch.setattr("src.main.services.outbox.get_image_bucket", lambda: UnavailableBucket())
+
+    with app.app_context():
+        add_blob_deletions(["a", "b"])
+
+    result = runner.invoke(args=["drain-outbox"])
+
+    assert "Processed 2 outbox entries, 2 are pending a retry and 0 failed too many times." in result.output
@@ -3,7 +3,8 @@ import pytest as pytest
 from src.main.exceptions import ValidationError
 from src.main.helpers.email_utils import normalize_email
 from src.main.models import UserInfo, Audio
-from src.main.parse_request import validate_and_get_user_info_model, validate_and_get_audio_model
+from src.main.parse_request import validate_and_get_user_info_model, validate_and_get_audio_model, \
+    user_info_validator
 from tests.helpers.list_utils import is_lists_equal
 
 
@@ -63,6 +64,15 @@ def test_user_info_wrong_field_type():
         validate_and_get_user_info_model(test_data)
 
 
+def test_user_info_is_validated_once(monkeypatch):
+    validated = []
+    validate = user_info_validator.validate
+    monkeypatch.setattr(user_info_validator, "validate", lambda data: validated.append(data) or validate(data))
+
+    validate_and_get_user_info_model({"name": "Foo Bar", "email": "foo.bar@gmail.com", "address": "1234 Main Road"})
+
+    assert len(validated) == 1
+
 
 def test_valid_audio():
     test_data = {"ticks": [-96.33, -96.33, -93.47, -89.03999999999999, -84.61, -80.18, -75.75, -71.32, -66.89, -62.46, -58.03, -53.6, -49.17, -44.74, -40.31], "selected_tick": 5, "session_id": 3448, "step_count": 1}
@@ -127,3 +137,32 @@ def test_invalid_audio_selected_tick_too_large():
 
     with pytest.raises(ValidationError):
         validate_and_get_audio_model(test_data)
+
+
+def test_invalid_audio_ticks_not_a_list():
+    test_data = {"ticks": "-96.33", "selected_tick": 5, "session_id": 3448, "step_count": 1}
+
+    with pytest.raises(ValidationError):
+        validate_and_get_audio_model(test_data)
+
+
+def test_invalid_audio_ticks_not_numbers():
+    test_data = {"ticks": ["a"] * 15, "selected_tick": 5, "session_id": 3448, "step_count": 1}
+
+    with pytest.raises(ValidationError) as e:
+        validate_and_get_audio_model(test_data)
+
+    assert e.value.detailed_validation_errors[0]["pointer"] == "ticks"
+
+
+def test_user_info_field_rejected_by_schema():
+    test_data = {
+        "name": 1234,
+        "email": "foo.bar@gmail.com",
+        "address": "1234 Main Road"
+    }
+
+    with pytest.raises(ValidationError) as e:
+        validate_and_get_user_info_model(test_data)
+
+    assert e.value.detailed_validation_errors[0]["pointer"] == "name"
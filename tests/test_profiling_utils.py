@@ -0,0 +1,92 @@
+import os
+import pstats
+import tempfile
+import time
+
+import pytest
+
+from src.main import create_app
+from src.main.data_sources.db import get_db, init_db
+from src.main.services import user_infos as user_info_service
+
+with open(os.path.join(os.path.dirname(__file__), "test_data", "seed.sql"), "rb") as f:
+    _data_sql = f.read().decode("utf8")
+
+SECRET = "profiling-secret"
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        "TESTING": True,
+        "DATABASE": db_path,
+        "OUTBOX_WORKER": False,
+        "PROFILING": True,
+        "PROFILING_SECRET": SECRET,
+        "PROFILING_PATH": str(tmp_path / "profiles"),
+    })
+    with app.app_context():
+        init_db()
+        get_db().executescript(_data_sql)
+
+    yield app
+
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Profile": "wrong-secret"}])
+def test_request_is_not_profiled_without_the_secret(profiled_app, headers):
+    response = profiled_app.test_client().get("/accounts/", headers=headers)
+
+    assert response.status_code == 200
+    assert "X-Profile-File" not in response.headers
+    assert not os.path.exists(profiled_app.config["PROFILING_PATH"])
+
+
+def test_request_is_profiled_with_cprofile(profiled_app):
+    response = profiled_app.test_client().get("/accounts/?name=Test User", headers={"X-Profile": SECRET}, buffered=True)
+
+    assert response.status_code == 200
+    profile_filename = response.headers["X-Profile-File"]
+    assert "-GET-accounts-" in profile_filename and profile_filename.endswith(".pstats")
+    stats = pstats.Stats(os.path.join(profiled_app.config["PROFILING_PATH"], profile_filename))
+    assert any(function_name == "list_user_infos" for _, _, function_name in stats.stats)
+
+
+def test_request_is_profiled_with_sampling(profiled_app, monkeypatch):
+    get_user_infos_page = user_info_service.get_user_infos_page
+
+    def slow_get_user_infos_page(*args):
+        time.sleep(0.05)
+        return get_user_infos_page(*args)
+
+    monkeypatch.setattr(user_info_service, "get_user_infos_page", slow_get_user_infos_page)
+
+    response = profiled_app.test_client().get(
+        "/accounts/", headers={"X-Profile": SECRET, "X-Profile-Mode": "sample"}, buffered=True)
+
+    assert response.status_code == 200
+    assert response.headers["X-Profile-File"].endswith(".collapsed")
+    with open(os.path.join(profiled_app.config["PROFILING_PATH"], response.headers["X-Profile-File"])) as f:
+        lines = f.read().splitlines()
+    assert any("src.main.controllers.accounts:list_user_infos;" in line and "slow_get_user_infos_page" in line
+               for line in lines)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+
+
+def test_oldest_profiles_are_pruned(profiled_app):
+    profiled_app.wsgi_app.max_profiles = 2
+    client = profiled_app.test_client()
+
+    profile_filenames = [client.get("/ping", headers={"X-Profile": SECRET}, buffered=True).headers["X-Profile-File"]
+                         for _ in range(3)]
+
+    assert len(os.listdir(profiled_app.config["PROFILING_PATH"])) == 2
+    assert profile_filenames[2] in os.listdir(profiled_app.config["PROFILING_PATH"])
+
+
+def test_profiling_requires_a_secret():
+    with pytest.raises(ValueError):
+        create_app({"TESTING": True, "OUTBOX_WORKER": False, "PROFILING": True})
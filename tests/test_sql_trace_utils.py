@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from src.main import create_app
+from src.main.data_sources.db import get_db, init_db
+from src.main.helpers.sql_trace_utils import SqlTracer, describe_parameters, mask_statement, merge_snapshots, \
+    normalize_statement
+
+
+@pytest.mark.parametrize("test_input,expected", [
+    ((), "()"),
+    ((1, "a", None), "(int, str, NoneType)"),
+    ((1, 2, 3, "a"), "(int, ..., str)"),
+    ({"email": "a@b.c", "id": 1}, "{email: str, id: int}"),
+])
+def test_describe_parameters(test_input, expected):
+    assert describe_parameters(test_input) == expected
+
+
+def test_normalize_statement_aggregates_parameter_lists():
+    assert normalize_statement("SELECT email\n  FROM user_info WHERE email IN (?, ?,?)") == \
+           "SELECT email FROM user_info WHERE email IN (?, ...)"
+
+
+def test_mask_statement_removes_values():
+    assert mask_statement("INSERT INTO user_info (name, email) VALUES ('O''Brien', 'a@b.c')") == \
+           "INSERT INTO user_info (name, email) VALUES (?, ...)"
+    assert mask_statement("SELECT * FROM t1 WHERE id = 42 AND x = -1.5e3 AND b = X'00ff'") == \
+           "SELECT * FROM t1 WHERE id = ? AND x = ? AND b = ?"
+
+
+def test_tracer_explains_slow_statements():
+    tracer = SqlTracer(None, slow_threshold=0)
+    connection = sqlite3.connect(":memory:")
+    connection.set_trace_callback(tracer.trace_callback)
+    connection.execute("CREATE TABLE t (a, b)")
+    connection.execute("CREATE INDEX t_a_idx ON t (a)")
+
+    for sql in ("SELECT * FROM t WHERE a = ?", "SELECT * FROM t WHERE b = ?"):
+        with tracer.trace(connection, sql, (1,)):
+            connection.execute(sql, (1,)).fetchall()
+
+    statements = {statement["sql"]: statement for statement in tracer.snapshot()["statements"]}
+    assert statements["SELECT * FROM t WHERE a = ?"]["parameters"] == "(int)"
+    assert statements["SELECT * FROM t WHERE a = ?"]["slow_count"] == 1
+    assert not statements["SELECT * FROM t WHERE a = ?"]["scans"]
+    assert statements["SELECT * FROM t WHERE b = ?"]["scans"]
+    assert tracer.snapshot()["executed"]["SELECT * FROM t WHERE b = ?"] == 1
+    assert len(tracer.snapshot()["slow_log"]) == 2
+
+
+def test_tracer_does_not_explain_fast_statements():
+    tracer = SqlTracer(None, slow_threshold=10)
+    connection = sqlite3.connect(":memory:")
+
+    with tracer.trace(connection, "SELECT 1"):
+        connection.execute("SELECT 1")
+
+    statement, = tracer.snapshot()["statements"]
+    assert (statement["count"], statement["slow_count"], statement["plan"]) == (1, 0, None)
+    assert tracer.snapshot()["slow_log"] == []
+
+
+def test_merge_snapshots():
+    statement = {"sql": "SELECT 1", "parameters": "()", "count": 1, "total_ms": 2.0, "mean_ms": 2.0, "max_ms": 2.0,
+                 "slow_count": 0, "plan": None, "scans": False}
+    snapshot = {"statements": [statement], "executed": {"SELECT ?": 1}, "slow_log": []}
+    other_snapshot = {"statements": [dict(statement, total_ms=4.0, max_ms=4.0)], "executed": {"SELECT ?": 2},
+                      "slow_log": []}
+
+    merged = merge_snapshots([snapshot, other_snapshot])
+
+    assert merged["statements"] == [dict(statement, count=2, total_ms=6.0, mean_ms=3.0, max_ms=4.0)]
+    assert merged["executed"] == {"SELECT ?": 3}
+
+
+def test_concurrent_saves(tmp_path):
+    tracer = SqlTracer(str(tmp_path), slow_threshold=10)
+    with tracer.trace(sqlite3.connect(":memory:"), "SELECT 1"):
+        pass
+    threads = [threading.Thread(target=tracer.save) for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert os.listdir(str(tmp_path)) == [f"{os.getpid()}.json"]
+    assert tracer.is_save_due(0)
+    assert not tracer.is_save_due(60)
+
+
+@pytest.fixture
+def traced_app(tmp_path):
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        "TESTING": True,
+        "DATABASE": db_path,
+        "OUTBOX_WORKER": False,
+        "SQL_TRACE": True,
+        "SQL_TRACE_PATH": str(tmp_path / "sql_trace"),
+        "SQL_TRACE_SLOW_THRESHOLD": 0,
+    })
+    with app.app_context():
+        init_db()
+
+    yield app
+
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+def test_sql_stats_of_requests(traced_app):
+    client = traced_app.test_client()
+    assert client.post("/accounts/", json={"name": "Test User", "email": "test.user@dummy.com",
+                                           "address": "1234 Main Road"}).status_code == 201
+    assert client.get("/accounts/?email=test.user@dummy.com").status_code == 200
+
+    response = client.get("/debug/sql?sort=count&limit=100")
+
+    assert response.status_code == 200
+    search, = [statement for statement in response.json["statements"] if "WHERE email = ?" in statement["sql"]]
+    assert search["parameters"] == "(str, int)"
+    assert search["plan"] == ["SEARCH user_info USING INDEX sqlite_autoindex_user_info_1 (email=?)"]
+    insert, = [statement for statement in response.json["statements"] if statement["sql"].startswith("INSERT")]
+    assert insert["plan"] == []
+    assert "BEGIN" in response.json["executed"]
+    assert "dummy.com" not in response.get_data(as_text=True)
+
+    assert client.delete("/debug/sql").status_code == 200
+    assert client.get("/debug/sql").json["statements"] == []
+
+
+def test_sql_stats_invalid_sort(traced_app):
+    assert traced_app.test_client().get("/debug/sql?sort=name").status_code == 400
+
+
+def test_sql_stats_when_not_enabled(client):
+    assert client.get("/debug/sql").status_code == 404
+
+
+def test_sql_stats_command(traced_app):
+    with traced_app.app_context():
+        get_db().execute("SELECT * FROM user_info WHERE address = ?", ("1234 Main Road",)).fetchall()
+    traced_app.extensions["sql_tracer"].save()
+
+    result = traced_app.test_cli_runner().invoke(args=["sql-stats", "--sort", "max", "--reset"])
+
+    assert "SQL statistics saved by 1 processes" in result.output
+    assert "SELECT * FROM user_info WHERE address = ? (str)" in result.output
+    assert os.listdir(traced_app.config["SQL_TRACE_PATH"]) == []
+    assert "No SQL statistics were saved" in traced_app.test_cli_runner().invoke(args=["sql-stats"]).output
+
+
+def test_sql_trace_save_errors_are_logged(traced_app, monkeypatch, caplog):
+    def failing_save():
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(traced_app.extensions["sql_tracer"], "save", failing_save)
+    traced_app.config["SQL_TRACE_SAVE_INTERVAL"] = 0
+
+    assert traced_app.test_client().get("/accounts/").status_code == 200
+    assert "Could not save the SQL statistics" in caplog.text
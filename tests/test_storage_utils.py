@@ -0,0 +1,90 @@
+import io
+import threading
+
+from src.main.helpers.storage_utils import StorageClientRegistry, upload_from_stream
+from tests.helpers.fake_storage import FakeBucket
+
+
+class FakeClient:
+    def __init__(self, credentials_path, pool_size):
+        self.credentials_path = credentials_path
+        self.pool_size = pool_size
+
+    def bucket(self, bucket_name):
+        return (self, bucket_name)
+
+
+def test_registry_reuses_client_and_buckets(monkeypatch):
+    class Recorder(object):
+        calls = 0
+
+    def fake_build_client(credentials_path, pool_size):
+        Recorder.calls += 1
+        return FakeClient(credentials_path, pool_size)
+
+    monkeypatch.setattr("src.main.helpers.storage_utils.build_client", fake_build_client)
+    registry = StorageClientRegistry()
+
+    audio_bucket = registry.get_bucket("creds.json", "audios", 8)
+    image_bucket = registry.get_bucket("creds.json", "images", 8)
+
+    assert registry.get_bucket("creds.json", "audios", 8) is audio_bucket
+    assert audio_bucket[0] is image_bucket[0]  # same client
+    assert audio_bucket[0].pool_size == 8
+    assert Recorder.calls == 1
+
+
+def test_registry_is_thread_safe(monkeypatch):
+    class Recorder(object):
+        calls = 0
+
+    def fake_build_client(credentials_path, pool_size):
+        Recorder.calls += 1
+        return FakeClient(credentials_path, pool_size)
+
+    monkeypatch.setattr("src.main.helpers.storage_utils.build_client", fake_build_client)
+    registry = StorageClientRegistry()
+    buckets = []
+
+    threads = [threading.Thread(target=lambda: buckets.append(registry.get_bucket("creds.json", "audios", 8)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Recorder.calls == 1
+    assert all(bucket is buckets[0] for bucket in buckets)
+
+
+def test_registry_reset(monkeypatch):
+    monkeypatch.setattr("src.main.helpers.storage_utils.build_client", FakeClient)
+    registry = StorageClientRegistry()
+
+    bucket = registry.get_bucket("creds.json", "audios", 8)
+    registry.reset()
+
+    assert registry.get_bucket("creds.json", "audios", 8) is not bucket
+
+
+def test_upload_from_stream_small_stream_in_single_request():
+    bucket = FakeBucket()
+    stream = io.BytesIO(b"x" * 100)
+
+    blob = upload_from_stream(bucket, "small", stream, "image/png", chunk_size=16, resumable_threshold=101)
+
+    assert blob.chunk_size is None
+    assert blob.read_sizes == [100]
+    assert bucket.contents["small"] == b"x" * 100
+
+
+def test_upload_from_stream_large_stream_in_chunks():
+    bucket = FakeBucket()
+    stream = io.BytesIO(b"ignored" + b"x" * 100)
+    stream.seek(len(b"ignored"))  # only the rest of the stream is uploaded
+
+    blob = upload_from_stream(bucket, "large", stream, "image/png", chunk_size=32, resumable_threshold=100)
+
+    assert blob.chunk_size == 32
+    assert blob.read_sizes == [32, 32, 32, 4]
+    assert bucket.contents["large"] == b"x" * 100
@@ -1,9 +1,12 @@
+from itertools import combinations
+
 import pytest as pytest
 
 from src.main.data_sources.db import get_db
 from src.main.exceptions import ValidationError
 from src.main.models import UserInfo
 from src.main.services import user_infos as user_info_service
+from src.main.services.outbox import drain_due_outbox_entries
 
 
 def get_valid_user_info_model():
@@ -148,20 +151,128 @@ def test_delete_user_info_existing(app, monkeypatch):
 
     class Recorder(object):
         called = False
+        blob_names = None
 
     class FakeBucket:
         @staticmethod
-        def delete_blobs(*args, **kwargs):
+        def delete_blobs(blob_names, **kwargs):
             Recorder.called = True
+            Recorder.blob_names = blob_names
 
     with app.app_context():
-        monkeypatch.setattr('src.main.services.user_infos.get_image_bucket', lambda: FakeBucket())
+        monkeypatch.setattr('src.main.services.outbox.get_image_bucket', lambda: FakeBucket())
         db = get_db()
+        db.execute("UPDATE user_info SET image_generation = 7 WHERE id = ?", (user_id,))
+        db.commit()
         initial_row_count = db.execute("SELECT COUNT() FROM user_info").fetchone()["COUNT()"]
         user_info_service.delete_user_info(user_id)
         final_row_count = db.execute("SELECT COUNT() FROM user_info").fetchone()["COUNT()"]
         deleted_user_info_row = db.execute("SELECT * FROM user_info WHERE id = ?", (user_id,)).fetchone()
 
+        assert not Recorder.called  # the image is deleted from the bucket in the background
+        drain_due_outbox_entries()
+        outbox_row_count = db.execute("SELECT COUNT() FROM outbox").fetchone()["COUNT()"]
+
     assert initial_row_count - 1 == final_row_count
     assert deleted_user_info_row is None
     assert Recorder.called  # deleted user info image from bucket
+    assert Recorder.blob_names == user_info_service.build_image_blob_names(user_id, 7)
+    assert outbox_row_count == 0
+
+
+def test_iter_user_infos_in_batches(app):
+    with app.app_context():
+        user_infos = list(user_info_service.iter_user_infos({}, batch_size=1))
+
+    assert [user_info["id"] for user_info in user_infos] == [1, 2]
+
+
+def test_get_user_infos_search_with_quotes(app):
+    test_data = get_valid_user_info_model()
+    test_data.name = "Foo 'Bar' \"Baz\""
+    with app.app_context():
+        user_info_service.create_user_info(test_data)
+        user_infos = user_info_service.get_user_infos({"name": test_data.name})
+
+    assert len(user_infos) == 1
+    assert user_infos[0]["name"] == test_data.name
+
+
+def test_build_user_infos_query_is_independent_of_search_order():
+    query, params = user_info_service.build_user_infos_query({"address": "a", "name": "n"})
+    same_query, same_params = user_info_service.build_user_infos_query({"name": "n", "address": "a"})
+
+    assert query == same_query
+    assert params == same_params == ["n", "a"]
+
+
+@pytest.mark.parametrize("search_columns", [
+    columns
+    for count in range(1, len(user_info_service.SEARCHABLE_COLUMNS) + 1)
+    for columns in combinations(user_info_service.SEARCHABLE_COLUMNS, count)
+])
+def test_get_user_infos_search_does_not_scan_table(app, search_columns):
+    query, params = user_info_service.build_user_infos_query({column: "value" for column in search_columns})
+    with app.app_context():
+        query_plan = get_db().execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+
+    assert len(query_plan) > 0
+    assert not any(step["detail"].startswith("SCAN") for step in query_plan)
+
+
+@pytest.mark.parametrize("search_columns", [
+    columns
+    for count in range(0, len(user_info_service.SEARCHABLE_COLUMNS) + 1)
+    for columns in combinations(user_info_service.SEARCHABLE_COLUMNS, count)
+])
+def test_get_user_infos_next_page_does_not_scan_table(app, search_columns):
+    query, params = user_info_service.build_user_infos_query(
+        {column: "value" for column in search_columns}, after_id=1000, limit=100)
+    with app.app_context():
+        query_plan = get_db().execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+
+    assert not any(step["detail"].startswith("SCAN") for step in query_plan)
+    assert not any("TEMP B-TREE" in step["detail"] for step in query_plan)  # no sorting of all matching rows
+
+
+def test_get_user_infos_page(app):
+    with app.app_context():
+        first_page, next_after_id = user_info_service.get_user_infos_page({}, 1)
+        second_page, last_after_id = user_info_service.get_user_infos_page({}, 1, next_after_id)
+
+    assert [user_info["id"] for user_info in first_page] == [1]
+    assert [user_info["id"] for user_info in second_page] == [2]
+    assert last_after_id is None
+
+
+def test_create_user_infos(app):
+    first_user_info_model = get_valid_user_info_model()
+    duplicate_user_info_model = get_valid_user_info_model()
+    duplicate_user_info_model.name = "Duplicate"
+    existing_user_info_model = get_valid_user_info_model()
+    existing_user_info_model.email = "test.user@dummy.com"
+    second_user_info_model = get_valid_user_info_model()
+    second_user_info_model.email = "second.foo.bar@gmail.com"
+
+    with app.app_context():
+        results = user_info_service.create_user_infos(
+            [first_user_info_model, duplicate_user_info_model, existing_user_info_model, second_user_info_model])
+        final_row_count = get_db().execute("SELECT COUNT() FROM user_info").fetchone()["COUNT()"]
+
+    assert results[0]["email"] == first_user_info_model.email
+    assert isinstance(results[1], ValidationError)
+    assert isinstance(results[2], ValidationError)
+    assert results[3]["email"] == second_user_info_model.email
+    assert results[3]["id"] == results[0]["id"] + 1
+    assert final_row_count == 4
+
+
+def test_create_user_infos_many(app):
+    user_info_models = [UserInfo(name=f"User {i}", email=f"user{i}@dummy.com", address="1 Main Road") for i in range(2000)]
+
+    with app.app_context():
+        results = user_info_service.create_user_infos(user_info_models)
+        final_row_count = get_db().execute("SELECT COUNT() FROM user_info").fetchone()["COUNT()"]
+
+    assert [result["email"] for result in results] == [user_info_model.email for user_info_model in user_info_models]
+    assert final_row_count == 2002